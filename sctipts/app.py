@@ -10,54 +10,102 @@ from PIL import Image
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-from src.vlm_tool import VLMTool
-from src.pipeline import ObjectDetectionTool
 from src.config import (
     MODEL_TYPES,
     DEFAULT_DETECTOR,
-    DEVICE,
     CONFIDENCE_THRESHOLD,
     CONCEPT_EXTRACTION_VLM,
     CRITIQUE_VLM,
-    VALIDATION_VLM
+    VALIDATION_VLM,
+    WORKER_POOL_SIZE,
+    WORKER_QUEUE_SIZE,
+    WORKER_QUEUE_TIMEOUT,
+    METRICS_PORT,
+    get_device,
 )
 
 load_dotenv()
 
-def run_detect_pipeline(input_image, user_request):  # input_image: PIL.Image
-    # 임시 파일로 저장
-    temp_path = "temp_input_for_gradio.jpg"
-    input_image.save(temp_path)
+# DETECTION_SERVICE_URL이 설정되면 모델을 로드하지 않고 HTTP 서비스 (src/server.py)의 thin client로 동작
+SERVICE_URL = os.getenv("DETECTION_SERVICE_URL")
 
-    # pipeline setup
+if SERVICE_URL:
+    from src.client import DetectionClient, decode_image
+
+    client = DetectionClient(SERVICE_URL)
+
+    def run_detect_pipeline(input_image, user_request):  # input_image: PIL.Image
+        body = client.detect(input_image, user_request, return_image=True)
+        final_img = decode_image(body)
+        body.pop("image", None)
+        return final_img, body
+
+    def pool_stats():
+        return client.stats()
+else:
+    from src.vlm_tool import VLMTool
+    from src.pipeline import ObjectDetectionTool
+    from src.model_registry import get_registry
+    from src.worker_pool import WorkerPool
+    from src.metrics import start_metrics_server
+
+    # device detection imports torch, so it only happens in local mode
+    device = get_device()
+    # process-wide shared resources: loaded once at startup, reused by every request
     vlm_tool = VLMTool(api_key=os.getenv("OPENAI_API_KEY"))
-    object_detection_tool = ObjectDetectionTool(
+    processor, model = get_registry().warm_up(MODEL_TYPES[DEFAULT_DETECTOR], device)
+    worker_pool = WorkerPool(
+        max_workers=WORKER_POOL_SIZE,
+        max_queue=WORKER_QUEUE_SIZE,
+        timeout=WORKER_QUEUE_TIMEOUT,
+    )
+    if METRICS_PORT is not None:
+        # Prometheus scrape target: http://<host>:METRICS_PORT/metrics
+        start_metrics_server(METRICS_PORT)
+
+    # one reentrant tool on the shared processor/model serves every request
+    detection_tool = ObjectDetectionTool(
         model_id=MODEL_TYPES[DEFAULT_DETECTOR],
-        device=DEVICE,
+        device=device,
         vlm_tool=vlm_tool,
         confidence_threshold=CONFIDENCE_THRESHOLD,
         concept_detection_model=CONCEPT_EXTRACTION_VLM,
         initial_critique_model=CRITIQUE_VLM,
         final_critique_model=VALIDATION_VLM,
+        processor=processor,
+        model=model,
     )
-    # run pipeline
-    final_img, _ = object_detection_tool.run(temp_path, user_request)
 
-    # image file delete after execution of pipeline
-    try:
-        os.remove(temp_path)
-    except: pass
+    def _run_job(input_image, user_request):
+        result = detection_tool.detect_objects(input_image, user_request)
+        return result.image, result.report.to_dict()
+
+    def run_detect_pipeline(input_image, user_request):  # input_image: PIL.Image
+        # the PIL image is passed through in memory (no temp file shared between users)
+        return worker_pool.run(_run_job, input_image, user_request)
 
-    return final_img  
+    def pool_stats():
+        return worker_pool.stats()
 
-# gradio app interfae setting 
-app = gr.Interface(
+# gradio app interfae setting
+detect_app = gr.Interface(
     fn=run_detect_pipeline,
     inputs=[gr.Image(type="pil"), gr.Textbox(label="User Request")],
-    outputs=[gr.Image(type="pil", label="Detection Result")],
+    outputs=[gr.Image(type="pil", label="Detection Result"), gr.JSON(label="Run Report")],
     title="Agentic Object Detection",
 
     theme=gr.themes.Monochrome(),
     # 예시 이미지 및 예시 User Request 문구 추가
 )
-app.launch()
\ No newline at end of file
+stats_app = gr.Interface(
+    fn=pool_stats,
+    inputs=None,
+    outputs=gr.JSON(label="Worker Pool Metrics"),
+    title="Worker Pool Metrics",
+)
+app = gr.TabbedInterface([detect_app, stats_app], ["Detect", "Metrics"])
+# gradio 대기열은 worker pool 용량까지만 통과시키고, 나머지 backpressure는 pool에서 처리
+app.queue(default_concurrency_limit=WORKER_POOL_SIZE + WORKER_QUEUE_SIZE)
+
+if __name__ == "__main__":
+    app.launch()
@@ -0,0 +1,151 @@
+# detector cascade benchmark: latency saved vs. recall lost against GroundingDINO alone
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.cascade import CascadeDetector
+from src.pipeline import ObjectDetectionTool
+from src.tracing import start_trace
+from src.utils import load_image, iou_matrix
+from src.config import (
+    MODEL_TYPES,
+    DETECTOR_BACKEND,
+    CONFIDENCE_THRESHOLD,
+    CASCADE_ACCEPT_SCORE,
+    get_device,
+)
+
+# a mix of concepts that are / are not in data/*.jpg, so the early exit gets exercised
+DEFAULT_QUERIES = ["person", "dog", "cat", "car", "bicycle", "cup", "chair", "bird"]
+
+
+def recall(reference, candidate, iou_threshold=0.5):
+    """(matched, total): reference boxes found again in `candidate` (same label, IoU >= threshold)."""
+    if not len(reference):
+        return 0, 0
+    if not len(candidate):
+        return 0, len(reference)
+    ious = iou_matrix(reference.boxes, candidate.boxes)
+    matched, used = 0, set()
+    for i, label in enumerate(reference.labels):
+        for j in np.argsort(-ious[i]):
+            if ious[i, j] < iou_threshold:
+                break
+            if j not in used and candidate.labels[j] == label:
+                used.add(j)
+                matched += 1
+                break
+    return matched, len(reference)
+
+
+def timed(tool, samples, queries, repeats):
+    """Best-of-`repeats` latency per sample, the last Detections and the summed stage times."""
+    latencies, outputs, stages = [], [], {}
+    for _, img in samples:
+        best = None
+        for _ in range(repeats):
+            with start_trace() as trace:
+                started = time.perf_counter()
+                detections = tool.detect(img, queries, use_cache=False)
+                elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+            for name, seconds in trace.durations().items():
+                stages[name] = stages.get(name, 0.0) + seconds / repeats
+        latencies.append(best)
+        outputs.append(detections)
+    return latencies, outputs, stages
+
+
+def main():
+    """
+    Runs GroundingDINO alone and the OWL-ViT -> GroundingDINO cascade over the
+    same images and concepts. GroundingDINO-only boxes are the reference: the
+    cascade's recall is the share of them it finds again, next to its latency
+    and per-stage times for each recall threshold.
+    """
+    parser = argparse.ArgumentParser(description="Latency / recall trade-off of the detector cascade.")
+    parser.add_argument("--images", type=str, default=os.path.join(project_root, "data", "*.jpg"))
+    parser.add_argument("--queries", type=str, default=",".join(DEFAULT_QUERIES), help="Comma-separated concepts.")
+    parser.add_argument("--thresholds", type=str, default="0.02,0.05,0.1,0.2", help="Comma-separated recall thresholds to sweep.")
+    parser.add_argument("--accept_score", type=float, default=CASCADE_ACCEPT_SCORE)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--backend", type=str, default=DETECTOR_BACKEND)
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    samples = [(os.path.basename(path), load_image(path)) for path in sorted(glob.glob(args.images))]
+    if not samples:
+        print(f"Error: no images match '{args.images}'")
+        sys.exit(1)
+    queries = [q.strip() for q in args.queries.split(",") if q.strip()]
+
+    device = get_device()
+    tool = ObjectDetectionTool(
+        model_id=MODEL_TYPES["grounding_dino"],
+        device=device,
+        vlm_tool=None,
+        confidence_threshold=CONFIDENCE_THRESHOLD,
+        debug_dir=None,
+        backend=args.backend,
+        tiler=False,
+        cascade=False,
+    )
+    print(f" Samples: {len(samples)} x {args.repeats} repeats, {len(queries)} concepts, '{device}'")
+    print("-" * 30)
+
+    tool.detect(samples[0][1], queries, use_cache=False)  # warm-up
+    base_latencies, reference, base_stages = timed(tool, samples, queries, args.repeats)
+    base_total = sum(base_latencies)
+    report = {
+        "queries": queries,
+        "baseline": {"seconds": base_total, "boxes": sum(len(r) for r in reference), "stages": base_stages},
+        "cascade": [],
+    }
+    print(f"{'mode':<22}{'total ms':>10}{'saved':>8}{'recall':>8}{'boxes':>7}  stages (ms)")
+    print(f"{'grounding_dino':<22}{base_total * 1000:>10.1f}{'-':>8}{'-':>8}{report['baseline']['boxes']:>7}")
+
+    cascade = CascadeDetector.for_tool(tool, accept_score=args.accept_score)
+    for threshold in [float(t) for t in args.thresholds.split(",") if t.strip()]:
+        cascade.recall_threshold = threshold
+        tool.cascade = cascade
+        tool.detect(samples[0][1], queries, use_cache=False)  # warm-up (OWL-ViT weights)
+        latencies, outputs, stages = timed(tool, samples, queries, args.repeats)
+        tool.cascade = None
+
+        matched = total = 0
+        for ref, out in zip(reference, outputs):
+            m, t = recall(ref, out)
+            matched, total = matched + m, total + t
+        entry = {
+            "recall_threshold": threshold,
+            "seconds": sum(latencies),
+            "saved": 1.0 - sum(latencies) / base_total if base_total else 0.0,
+            "recall": matched / total if total else 1.0,
+            "boxes": sum(len(out) for out in outputs),
+            "stages": stages,
+        }
+        report["cascade"].append(entry)
+        stage_text = ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in sorted(stages.items()))
+        print(
+            f"{f'cascade @ {threshold:g}':<22}{entry['seconds'] * 1000:>10.1f}{entry['saved']:>8.0%}"
+            f"{entry['recall']:>8.1%}{entry['boxes']:>7}  {stage_text}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
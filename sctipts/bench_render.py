@@ -0,0 +1,62 @@
+# micro-benchmark for the annotation renderer (src/render.py)
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.utils import draw_arrows_and_numbers, draw_bounding_boxes
+
+LABELS = ["person", "dog", "red tomato", "coffee cup", "bicycle", "traffic light"]
+
+
+def random_objects(count, width, height, seed=0):
+    """`count` random (num, label, [x1, y1, x2, y2]) boxes inside a width x height image."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.uniform(20, 400, size=(count, 2))
+    origins = rng.uniform(0, 1, size=(count, 2)) * (np.array([width, height]) - sizes)
+    return [
+        (i + 1, LABELS[i % len(LABELS)], [float(x), float(y), float(x + w), float(y + h)])
+        for i, ((x, y), (w, h)) in enumerate(zip(origins, sizes))
+    ]
+
+
+def time_call(fn, repeats):
+    fn()  # warm-up (font / glyph caches)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def main():
+    """Times draw_arrows_and_numbers / draw_bounding_boxes for 10/100/500 boxes on a 4K frame."""
+    parser = argparse.ArgumentParser(description="Benchmark annotation rendering.")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--boxes", type=str, default="10,100,500")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(args.height, args.width, 3), dtype=np.uint8)
+
+    print(f" Image: {args.width}x{args.height}, median of {args.repeats} runs")
+    print(f" {'boxes':>6}{'arrows ms':>12}{'boxes ms':>12}")
+    for count in [int(c) for c in args.boxes.split(",")]:
+        objects = random_objects(count, args.width, args.height)
+        arrows = time_call(lambda: draw_arrows_and_numbers(image, objects), args.repeats)
+        boxes = time_call(lambda: draw_bounding_boxes(image, objects), args.repeats)
+        print(f" {count:>6}{arrows * 1000:>12.1f}{boxes * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# startup benchmark: import time of the entry modules and first-inference latency
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+HEAVY = ("torch", "torchvision", "transformers", "cv2", "gradio")
+MODULES = [
+    "src.config",
+    "src.utils",
+    "src.metrics",
+    "src.tracing",
+    "src.vlm_tool",
+    "src.batch_runner",
+    "src.distributed",
+    "src.result_store",
+    "src.model_registry",
+    "src.pipeline",
+    "src.server",
+    "sctipts.app",
+]
+# modules that must stay cheap to import (config lookups, CLIs, queue supervisors, the thin-client UI)
+LIGHT = (
+    "src.config", "src.utils", "src.metrics", "src.tracing", "src.vlm_tool", "src.batch_runner", "src.distributed",
+    "src.result_store", "sctipts.app",
+)
+# environment per module: the Gradio app is imported in thin-client mode (no model, no torch)
+MODULE_ENV = {"sctipts.app": {"DETECTION_SERVICE_URL": "http://127.0.0.1:8000"}}
+# heavy frameworks a light module legitimately needs
+ALLOWED_HEAVY = {"sctipts.app": ("gradio",)}
+
+IMPORT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+INFERENCE_SNIPPET = """
+import json, time
+timings = {{}}
+started = time.perf_counter()
+from PIL import Image
+from src.config import MODEL_TYPES, get_device
+from src.pipeline import ObjectDetectionTool
+timings["import_s"] = time.perf_counter() - started
+started = time.perf_counter()
+device = get_device()
+timings["device_s"] = time.perf_counter() - started
+started = time.perf_counter()
+tool = ObjectDetectionTool(model_id=MODEL_TYPES[{detector!r}], device=device, vlm_tool=None, debug_dir=None)
+timings["load_s"] = time.perf_counter() - started
+image = Image.new("RGB", (640, 480), color=(128, 128, 128))
+started = time.perf_counter()
+tool.detect(image, ["object"], use_cache=False)
+timings["first_detect_s"] = time.perf_counter() - started
+started = time.perf_counter()
+tool.detect(image, ["object"], use_cache=False)
+timings["second_detect_s"] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+
+
+def _python(code, env=None):
+    """Runs `code` in a fresh interpreter (cold imports) and returns its JSON output."""
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=project_root, check=True, capture_output=True, text=True,
+        env={**os.environ, **env} if env else None,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_import(module, repeats):
+    runs = [_python(IMPORT_SNIPPET.format(module=module, heavy=HEAVY), env=MODULE_ENV.get(module)) for _ in range(repeats)]
+    return {"seconds": min(run["seconds"] for run in runs), "heavy": runs[0]["heavy"]}
+
+
+def measure_help(script, repeats):
+    """Wall time of `python <script> --help` (interpreter start included)."""
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, script, "--help"], cwd=project_root, check=True, capture_output=True)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and first-inference latency of the entry points.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh interpreters per measurement (min is reported).")
+    parser.add_argument("--inference", choices=["owlvit", "grounding_dino"], default=None,
+                        help="Also time model load and the first / second detector call.")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a light module imports a heavy framework.")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this file.")
+    args = parser.parse_args()
+
+    results = {"imports": {}, "help": {}}
+    print(f"{'module':<22}{'import ms':>12}  heavy frameworks loaded")
+    for module in MODULES:
+        try:
+            entry = measure_import(module, args.repeats)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<22}{'failed':>12}  {e.stderr.strip().splitlines()[-1] if e.stderr else ''}")
+            continue
+        results["imports"][module] = entry
+        print(f"{module:<22}{entry['seconds'] * 1000:>12.1f}  {', '.join(entry['heavy']) or '-'}")
+
+    print()
+    for script in ("sctipts/run.py", "sctipts/run_distributed.py"):
+        seconds = measure_help(script, args.repeats)
+        results["help"][script] = seconds
+        print(f"{script + ' --help':<40}{seconds * 1000:>10.1f} ms")
+
+    if args.inference:
+        timings = _python(INFERENCE_SNIPPET.format(detector=args.inference))
+        results["inference"] = timings
+        print()
+        for name, seconds in timings.items():
+            print(f"   {name:<18}{seconds * 1000:>10.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        offenders = {}
+        for module, entry in results["imports"].items():
+            heavy = [m for m in entry["heavy"] if m not in ALLOWED_HEAVY.get(module, ())]
+            if module in LIGHT and heavy:
+                offenders[module] = heavy
+        for module, heavy in offenders.items():
+            print(f"FAIL: importing {module} loads {', '.join(heavy)}")
+        if offenders or len(results["imports"]) < len(MODULES):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# end-to-end / per-stage latency benchmark against a mock VLM server
+
+import argparse
+import glob
+import json
+import os
+import resource
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.vlm_tool import VLMTool
+from src.pipeline import ObjectDetectionTool
+from src.mock_vlm_server import MockVLMConfig, MockVLMServer
+from src.policy import StagePolicy
+from src.tracing import start_trace
+from src.utils import load_image, iou_matrix
+from src.config import (
+    MODEL_TYPES,
+    DEFAULT_DETECTOR,
+    DEVICE,
+    DETECTOR_BACKEND,
+    CONFIDENCE_THRESHOLD,
+    CONCEPT_EXTRACTION_VLM,
+    CRITIQUE_VLM,
+    VALIDATION_VLM,
+)
+
+SYNTHETIC_SIZES = [(640, 480), (1920, 1080), (4032, 3024)]
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in [0, 100])."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def synthetic_image(width, height, seed=0):
+    """Smooth random image (JPEG-like statistics, unlike white noise)."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.BILINEAR)
+
+
+def load_samples(pattern, synthetic):
+    samples = [(os.path.basename(path), load_image(path)) for path in sorted(glob.glob(pattern))]
+    if synthetic:
+        samples += [(f"synthetic_{w}x{h}", synthetic_image(w, h, seed=i)) for i, (w, h) in enumerate(SYNTHETIC_SIZES)]
+    return samples
+
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else 0.0,
+    }
+
+
+def run_benchmark(tool, samples, prompt, repeats, concurrency):
+    """
+    Runs every sample `repeats` times. The image-encoding cache is cleared per
+    run so each request pays its own backbone pass (as distinct images would).
+    Returns (end_to_end seconds list, {stage: seconds list}, wall seconds,
+    final objects of the first repeat per sample).
+    """
+    def one(img):
+        tool.image_cache.clear()
+        with start_trace() as trace:
+            started = time.perf_counter()
+            _, _, report = tool.run_with_report(img, prompt)
+            elapsed = time.perf_counter() - started
+        return elapsed, trace.durations(), report.objects
+
+    jobs = [img for _ in range(repeats) for _, img in samples]
+    end_to_end, stages, objects = [], {}, []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for elapsed, durations, final_objects in executor.map(one, jobs):
+            end_to_end.append(elapsed)
+            objects.append(final_objects)
+            for name, seconds in durations.items():
+                stages.setdefault(name, []).append(seconds)
+    return end_to_end, stages, time.perf_counter() - started, objects[:len(samples)]
+
+
+def vlm_totals(vlm_tool):
+    """(requests, prompt + completion tokens) summed over models."""
+    usage = vlm_tool.usage.values()
+    return sum(u["requests"] for u in usage), sum(u["prompt_tokens"] + u["completion_tokens"] for u in usage)
+
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """
+    F1 of `candidate` final boxes against `reference` (same label, IoU >= threshold),
+    averaged over samples. Used as the accuracy proxy when comparing policies.
+    """
+    scores = []
+    for ref, cand in zip(reference, candidate):
+        if not ref and not cand:
+            scores.append(1.0)
+            continue
+        if not ref or not cand:
+            scores.append(0.0)
+            continue
+        ious = iou_matrix(np.array([b for _, _, b in ref], dtype=np.float32), np.array([b for _, _, b in cand], dtype=np.float32))
+        matched, used = 0, set()
+        for i, (_, ref_label, _) in enumerate(ref):
+            for j in np.argsort(-ious[i]):
+                if ious[i, j] < iou_threshold:
+                    break
+                if j not in used and str(cand[j][1]) == str(ref_label):
+                    used.add(j)
+                    matched += 1
+                    break
+        scores.append(2 * matched / (len(ref) + len(cand)))
+    return sum(scores) / len(scores) if scores else 1.0
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Returns human-readable regressions where current p50/p95 exceed baseline by `tolerance`."""
+    regressions = []
+    rows = [("end_to_end", report["end_to_end"], baseline.get("end_to_end", {}))]
+    rows += [(name, stats, baseline.get("stages", {}).get(name, {})) for name, stats in report["stages"].items()]
+    for name, current, previous in rows:
+        for key in ("p50", "p95"):
+            if previous.get(key) and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {previous[key] * 1000:.1f} ms -> {current[key] * 1000:.1f} ms")
+    return regressions
+
+
+def main():
+    """
+    Benchmarks ObjectDetectionTool.run over data/*.jpg (plus synthetic sizes)
+    with VLM calls answered by a local mock server, so results are reproducible
+    offline. Reports per-stage p50/p95/p99, throughput and peak RSS, and
+    compares against a stored baseline.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the agentic object detection pipeline offline.")
+    parser.add_argument("--images", type=str, default=os.path.join(project_root, "data", "*.jpg"))
+    parser.add_argument("--no_synthetic", action="store_true", help="Skip the synthetic image sizes.")
+    parser.add_argument("--prompt", type=str, default="Find the person and the dog")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--detector", choices=list(MODEL_TYPES), default=DEFAULT_DETECTOR)
+    parser.add_argument("--backend", type=str, default=DETECTOR_BACKEND)
+    parser.add_argument("--vlm_latency", type=float, default=0.5, help="Mock VLM latency in seconds.")
+    parser.add_argument("--vlm_jitter", type=float, default=0.1)
+    parser.add_argument("--refine_rate", type=float, default=0.3, help="Fraction of critiques that trigger a re-detection.")
+    parser.add_argument("--policies", type=str, default="always", help="Comma-separated stage policies to compare (always, adaptive).")
+    parser.add_argument("--speculative", action="store_true", help="Validate in parallel with the critique.")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here.")
+    parser.add_argument("--baseline", type=str, default=None, help="Baseline JSON report to compare against.")
+    parser.add_argument("--save_baseline", action="store_true", help="Store this report as the new --baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown vs. baseline (0.10 = 10%%).")
+    args = parser.parse_args()
+
+    samples = load_samples(args.images, synthetic=not args.no_synthetic)
+    if not samples:
+        print(f"Error: no images match '{args.images}'")
+        sys.exit(1)
+
+    config = MockVLMConfig(latency=args.vlm_latency, jitter=args.vlm_jitter, refine_rate=args.refine_rate)
+    with MockVLMServer(config) as server:
+        vlm_tool = VLMTool(api_key="mock", base_url=server.base_url, cache=False)
+        tool = ObjectDetectionTool(
+            model_id=MODEL_TYPES[args.detector],
+            device=DEVICE,
+            vlm_tool=vlm_tool,
+            confidence_threshold=CONFIDENCE_THRESHOLD,
+            concept_detection_model=CONCEPT_EXTRACTION_VLM,
+            initial_critique_model=CRITIQUE_VLM,
+            final_critique_model=VALIDATION_VLM,
+            backend=args.backend,
+            speculative=args.speculative,
+        )
+        print(f" Samples: {len(samples)} x {args.repeats} repeats, concurrency {args.concurrency}")
+        print(f" Detector: {args.detector} ({args.backend}) on '{DEVICE}', mock VLM latency {args.vlm_latency}s")
+        print("-" * 30)
+
+        tool.run(samples[0][1], args.prompt)  # warm-up
+        policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+        results, reference = {}, None
+        for name in policies:
+            tool.policy = StagePolicy(mode=name)
+            requests_before, tokens_before = vlm_totals(vlm_tool)
+            end_to_end, stages, wall, objects = run_benchmark(tool, samples, args.prompt, args.repeats, args.concurrency)
+            requests_after, tokens_after = vlm_totals(vlm_tool)
+            reference = objects if reference is None else reference
+            results[name] = {
+                "end_to_end": summarize(end_to_end),
+                "stages": {stage: {**summarize(values), "calls": len(values)} for stage, values in stages.items()},
+                "throughput_rps": len(end_to_end) / wall if wall > 0 else 0.0,
+                "vlm_requests_per_run": (requests_after - requests_before) / len(end_to_end),
+                "vlm_tokens_per_run": (tokens_after - tokens_before) / len(end_to_end),
+                "agreement": agreement(reference, objects),
+            }
+        vlm_tool.close()
+
+    # top-level numbers are the first policy's, so baselines stay comparable
+    first = results[policies[0]]
+    report = {
+        "config": {
+            "detector": args.detector, "backend": args.backend, "device": DEVICE,
+            "samples": len(samples), "repeats": args.repeats, "concurrency": args.concurrency,
+            "vlm_latency": args.vlm_latency, "refine_rate": args.refine_rate, "policies": policies,
+            "speculative": args.speculative,
+        },
+        "end_to_end": first["end_to_end"],
+        "stages": first["stages"],
+        "throughput_rps": first["throughput_rps"],
+        "policies": results,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,  # Linux: KB
+    }
+
+    print(f" {'stage':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in [("end_to_end", report["end_to_end"])] + sorted(report["stages"].items()):
+        print(f" {name:<20}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}")
+    print(f" Throughput: {report['throughput_rps']:.2f} req/s, peak RSS: {report['peak_rss_mb']:.0f} MB")
+    if len(policies) > 1:
+        print(f"\n {'policy':<12}{'p50 ms':>10}{'VLM calls':>11}{'tokens':>10}{'agreement':>11}")
+        for name, result in results.items():
+            print(f" {name:<12}{result['end_to_end']['p50'] * 1000:>10.1f}{result['vlm_requests_per_run']:>11.2f}"
+                  f"{result['vlm_tokens_per_run']:>10.0f}{result['agreement']:>11.3f}")
+        print(f" (agreement: box F1 vs. the '{policies[0]}' policy's final objects)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f" Baseline saved to: {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+            if regressions:
+                print(" Regressions vs. baseline:")
+                for line in regressions:
+                    print(f"   {line}")
+                sys.exit(1)
+            print(" No regressions vs. baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# export / parity check for detector inference backends
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.pipeline import ObjectDetectionTool
+from src.backends import BACKENDS, check_parity
+from src.utils import load_image
+from src.config import MODEL_TYPES, DEFAULT_DETECTOR, DEVICE, CONFIDENCE_THRESHOLD
+
+
+def build_tool(detector, backend):
+    return ObjectDetectionTool(
+        model_id=MODEL_TYPES[detector],
+        device=DEVICE,
+        vlm_tool=None,
+        confidence_threshold=CONFIDENCE_THRESHOLD,
+        backend=backend,
+    )
+
+
+def time_detection(tool, samples, repeats):
+    """Mean detector latency per image (image cache disabled, so every call runs the backbone)."""
+    tool.detect(*samples[0], use_cache=False)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for image, queries in samples:
+            tool.detect(image, queries, use_cache=False)
+    return (time.perf_counter() - started) / (repeats * len(samples))
+
+
+def main():
+    """
+    Builds (and, for onnx, exports and caches) a detector backend, then checks
+    its detections against the eager model and compares latency.
+    """
+    parser = argparse.ArgumentParser(description="Export a detector backend and check parity with eager.")
+    parser.add_argument("--detector", choices=list(MODEL_TYPES), default=DEFAULT_DETECTOR)
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "eager"], required=True)
+    parser.add_argument("--images", type=str, default=os.path.join(project_root, "data", "*.jpg"), help="Glob of sample images.")
+    parser.add_argument("--queries", type=str, default="person,dog,cat,car,cup", help="Comma-separated detector queries.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    queries = [q.strip() for q in args.queries.split(",") if q.strip()]
+    samples = [(load_image(path), queries) for path in sorted(glob.glob(args.images))]
+    if not samples:
+        print(f"Error: no images match '{args.images}'")
+        sys.exit(1)
+
+    print(f" Detector: {MODEL_TYPES[args.detector]} on '{DEVICE}'")
+    print(f" Backend: {args.backend} ({len(samples)} sample images)")
+    print("-" * 30)
+
+    reference = build_tool(args.detector, "eager")
+    candidate = build_tool(args.detector, args.backend)
+
+    report = check_parity(reference, candidate, samples)
+    print(f" Parity: {report['matched']}/{report['reference_boxes']} reference boxes matched "
+          f"(recall {report['recall']:.3f}, mean IoU {report['mean_iou']}, max score diff {report['max_score_diff']})")
+
+    eager_latency = time_detection(reference, samples, args.repeats)
+    candidate_latency = time_detection(candidate, samples, args.repeats)
+    print(f" Latency: eager {eager_latency * 1000:.1f} ms, {args.backend} {candidate_latency * 1000:.1f} ms "
+          f"({eager_latency / candidate_latency:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# download detector weights into the local HF cache for offline / cold-start runs
+
+import argparse
+import os
+import sys
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.config import MODEL_TYPES, MODEL_CACHE_DIR
+from src.model_registry import prefetch_model
+
+
+def main():
+    """
+    Fetches config, tokenizer and (safetensors) weights of the detectors so
+    containers can start with HF_HUB_OFFLINE=1 and memory-map the weights
+    from the cache (MODEL_CACHE_DIR, default ~/.cache/huggingface).
+    """
+    parser = argparse.ArgumentParser(description="Prefetch detector weights into the local model cache.")
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_TYPES), default=list(MODEL_TYPES))
+    args = parser.parse_args()
+
+    print(f" Cache: {MODEL_CACHE_DIR or 'HF default'}")
+    for name in args.models:
+        path = prefetch_model(MODEL_TYPES[name])
+        weights = [f for f in os.listdir(path) if f.endswith((".safetensors", ".bin"))]
+        print(f" {name:<16} {MODEL_TYPES[name]} -> {path} ({', '.join(sorted(weights))})")
+
+
+if __name__ == "__main__":
+    main()
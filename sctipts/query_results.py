@@ -0,0 +1,96 @@
+# query past detection runs from the result store (no re-inference)
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.config import RESULT_STORE_PATH
+from src.result_store import ResultStore
+
+
+def parse_region(value):
+    region = [float(v) for v in value.split(",")]
+    if len(region) != 4:
+        raise argparse.ArgumentTypeError("region must be x1,y1,x2,y2 in normalized [0, 1] coordinates")
+    return region
+
+
+def main():
+    """
+    labels:  box count per validated label
+    images:  images containing a label ("which images contain a dog")
+    find:    boxes by label / image hash / normalized region / score / request text
+    run:     one stored run with its boxes, queries, reasoning and timings
+    stats:   store size and short-circuit hits
+    """
+    parser = argparse.ArgumentParser(description="Query the detection result store.")
+    parser.add_argument("--store", default=RESULT_STORE_PATH, required=RESULT_STORE_PATH is None, help="Result store SQLite file.")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("labels")
+    images = commands.add_parser("images")
+    images.add_argument("label")
+    images.add_argument("--min_score", type=float, default=None)
+    images.add_argument("--limit", type=int, default=100)
+    find = commands.add_parser("find")
+    find.add_argument("--label", default=None)
+    find.add_argument("--image_hash", default=None)
+    find.add_argument("--region", type=parse_region, default=None, help="x1,y1,x2,y2 in [0, 1]; boxes intersecting it.")
+    find.add_argument("--min_score", type=float, default=None)
+    find.add_argument("--request", default=None, help="Substring of the original request.")
+    find.add_argument("--limit", type=int, default=100)
+    run = commands.add_parser("run")
+    run.add_argument("run_id", type=int)
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        print(f"Error: result store not found at '{args.store}'")
+        sys.exit(1)
+    store = ResultStore(args.store)
+    started = time.perf_counter()
+    if args.command == "labels":
+        result = store.labels()
+    elif args.command == "images":
+        result = store.images_with(args.label, min_score=args.min_score, limit=args.limit)
+    elif args.command == "find":
+        result = store.find(
+            label=args.label, image_hash=args.image_hash, region=args.region,
+            min_score=args.min_score, request=args.request, limit=args.limit,
+        )
+    elif args.command == "run":
+        result = store.get_run(args.run_id)
+        if result is None:
+            print(f"Error: no run with id {args.run_id}")
+            sys.exit(1)
+    else:
+        result = store.stats()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    store.close()
+
+    if args.json or args.command in ("run", "stats"):
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    elif args.command == "labels":
+        for label, count in result.items():
+            print(f" {label:<30}{count:>8}")
+    elif args.command == "images":
+        for image_hash, source, count in result:
+            print(f" {image_hash[:16] if image_hash else '-':<18}{count:>4}  {source or ''}")
+    else:
+        for row in result:
+            box = ", ".join(f"{v:.0f}" for v in row["box"])
+            score = f"{row['score']:.2f}" if row["score"] is not None else "-"
+            print(f" run {row['run_id']:<6}#{row['num']:<3} {row['label']:<20}{score:>6}  [{box}]  {row['source'] or (row['image_hash'] or '')[:16]}")
+    count = 1 if args.command in ("run", "stats") else len(result)
+    print(f"\n {count} result(s) in {elapsed_ms:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,22 @@ from dotenv import load_dotenv
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-from src.vlm_tool import VLMTool
-from src.pipeline import ObjectDetectionTool
+# torch / transformers / cv2 are imported only after argument parsing (fast --help)
 from src.config import (
     MODEL_TYPES,
     DEFAULT_DETECTOR,
-    DEVICE,
     CONFIDENCE_THRESHOLD,
     CONCEPT_EXTRACTION_VLM,
     CRITIQUE_VLM,
-    VALIDATION_VLM
+    VALIDATION_VLM,
+    DETECTOR_MAX_BATCH_SIZE,
+    VIDEO_DETECT_EVERY,
+    STAGE_POLICY,
+    TILE_SIZE,
+    TILE_OVERLAP,
+    TILE_PRESCREEN_THRESHOLD,
+    CASCADE_RECALL_THRESHOLD,
+    get_device,
 )
 
 def main():
@@ -26,17 +32,49 @@ def main():
     Main function to run the object detection pipeline from the command line.
     """
     parser = argparse.ArgumentParser(description="Run the agentic object detection pipeline.")
-    parser.add_argument(
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
         "--image_path",
         type=str,
-        required=True,
         help="Path to the input image file."
     )
+    source.add_argument(
+        "--video",
+        type=str,
+        help="Stream mode: a video file, stream URL or camera index."
+    )
+    source.add_argument(
+        "--batch",
+        type=str,
+        help="Batch mode: a directory of images or a JSONL/CSV manifest of (image, prompt) jobs."
+    )
     parser.add_argument(
         "--prompt",
         type=str,
-        required=True,
-        help="The user's request or prompt for object detection."
+        help="The user's request or prompt for object detection (default prompt in batch mode)."
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        default=None,
+        help="Batch mode: JSONL file for per-job result records (default: <output_dir>/results.jsonl)."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Batch mode: skip jobs already recorded in the results file."
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=DETECTOR_MAX_BATCH_SIZE,
+        help="Batch mode: maximum images per detector forward pass."
+    )
+    parser.add_argument(
+        "--detect_every",
+        type=int,
+        default=VIDEO_DETECT_EVERY,
+        help="Stream mode: run the detector every k-th frame and track in between."
     )
     parser.add_argument(
         "--output_dir",
@@ -49,7 +87,58 @@ def main():
         action="store_true",
         help="Disable the critique and refinement step."
     )
+    parser.add_argument(
+        "--policy",
+        choices=["always", "adaptive"],
+        default=STAGE_POLICY,
+        help="'adaptive' skips critique/validation (or uses a cheaper VLM) when detector scores are confident."
+    )
+    parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="Run final validation in parallel with the critique (discarded if the critique refines the queries). Single-image mode only."
+    )
+    parser.add_argument(
+        "--tile",
+        action="store_true",
+        help="Sliced inference for high-resolution images: detect on overlapping tiles and merge."
+    )
+    parser.add_argument(
+        "--tile_size",
+        type=int,
+        default=TILE_SIZE,
+        help="Tile mode: tile side in pixels."
+    )
+    parser.add_argument(
+        "--tile_overlap",
+        type=int,
+        default=TILE_OVERLAP,
+        help="Tile mode: overlap between neighbouring tiles in pixels (>= the size of the smallest objects)."
+    )
+    parser.add_argument(
+        "--tile_prescreen_threshold",
+        type=float,
+        default=TILE_PRESCREEN_THRESHOLD,
+        help="Tile mode: only run tiles touching a low-res box scoring at least this (faster; may miss objects "
+             "too small to show up at low resolution). Default: every non-blank tile runs."
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Pre-screen with OWL-ViT and run GroundingDINO only for concepts it finds candidates for."
+    )
+    parser.add_argument(
+        "--cascade_recall_threshold",
+        type=float,
+        default=CASCADE_RECALL_THRESHOLD,
+        help="Cascade mode: concepts whose best OWL-ViT score is below this are treated as absent."
+    )
     args = parser.parse_args()
+    if (args.image_path or args.video) and not args.prompt:
+        parser.error("--prompt is required with --image_path / --video")
+    if args.speculative and (args.batch or args.video):
+        # batch / stream modes run critique and validation as separate steps (--policy applies)
+        parser.error("--speculative only applies to --image_path runs")
 
     # === Setup ===
     load_dotenv()
@@ -58,32 +147,54 @@ def main():
         print("Error: OPENAI_API_KEY not found. Please set it in your .env file.")
         sys.exit(1)
 
-    if not os.path.exists(args.image_path):
-        print(f"Error: Image path not found at '{args.image_path}'")
+    input_path = args.image_path or args.batch
+    if input_path and not os.path.exists(input_path):
+        print(f"Error: Image path not found at '{input_path}'")
         sys.exit(1)
 
     os.makedirs(args.output_dir, exist_ok=True)
 
     # === Initialize Tools ===
+    from src.vlm_tool import VLMTool
+    from src.pipeline import ObjectDetectionTool
+    from src.policy import StagePolicy
+
     vlm_tool = VLMTool(api_key=api_key)
     detector = ObjectDetectionTool(
         model_id=MODEL_TYPES[DEFAULT_DETECTOR],
-        device=DEVICE,
+        device=get_device(),
         vlm_tool=vlm_tool,
         confidence_threshold=CONFIDENCE_THRESHOLD,
         concept_detection_model=CONCEPT_EXTRACTION_VLM,
         initial_critique_model=CRITIQUE_VLM,
         final_critique_model=VALIDATION_VLM,
+        policy=StagePolicy(mode=args.policy),
+        speculative=args.speculative,
     )
+    if args.tile:
+        from src.tiling import TiledDetector
+        detector.tiler = TiledDetector(
+            detector, tile_size=args.tile_size, overlap=args.tile_overlap, prescreen_threshold=args.tile_prescreen_threshold
+        )
+    if args.cascade:
+        from src.cascade import CascadeDetector
+        detector.cascade = CascadeDetector.for_tool(detector, recall_threshold=args.cascade_recall_threshold)
+
+    if args.batch:
+        run_batch(args, detector)
+        return
+    if args.video:
+        run_video(args, detector)
+        return
 
     print(f" Image: {os.path.basename(args.image_path)}")
     print(f" User Request: '{args.prompt}'")
-    print(f" Using model '{DEFAULT_DETECTOR}' on '{DEVICE}'")
+    print(f" Using model '{DEFAULT_DETECTOR}' on '{get_device()}'")
     print("-" * 30)
 
     # === Run Pipeline ===
-    final_image, result_text = detector.run(
-        image_path=args.image_path,
+    final_image, result_text, report = detector.run_with_report(
+        image=args.image_path,
         user_request=args.prompt,
         do_critique=not args.no_critique,
     )
@@ -107,5 +218,82 @@ def main():
         print(result_text)
         print("\nCould not find any objects matching the request after the full process.")
 
+    print(f"\n Stage timings ({report.total_ms:.0f} ms total):")
+    for name, ms in report.stage_totals().items():
+        print(f"   {name:<20}{ms:>10.1f} ms")
+
+    payload = vlm_tool.payload_stats()
+    print(
+        f"\n VLM image uploads: {payload['images']} "
+        f"({payload['payload_bytes'] / 1024:.0f} KB sent, {payload['bytes_saved'] / 1024:.0f} KB saved, "
+        f"{payload['tokens']} image tokens, {payload['tokens_saved']} saved)"
+    )
+
+def run_video(args, detector):
+    """
+    Streams a video / camera source: VLM stages run on refresh frames only,
+    the detector every k-th frame, and a tracker fills the frames in between.
+    """
+    from src.video import VideoDetector
+
+    source = int(args.video) if args.video.isdigit() else args.video
+    base_name = os.path.splitext(os.path.basename(str(args.video)))[0] or "stream"
+    output_path = os.path.join(args.output_dir, f"{base_name}_tracked.mp4")
+    print(f" Video: {args.video}")
+    print(f" User Request: '{args.prompt}'")
+    print(f" Detector every {args.detect_every} frame(s), '{DEFAULT_DETECTOR}' on '{get_device()}'")
+    print("-" * 30)
+
+    video_detector = VideoDetector(
+        detector,
+        args.prompt,
+        detect_every=args.detect_every,
+        do_critique=not args.no_critique,
+    )
+    summary = video_detector.run(source, output_path=output_path)
+    print(f" Frames: {summary['frames']}, detector runs: {summary['detector_runs']}, "
+          f"VLM refreshes: {summary['vlm_refreshes']}, {summary['fps']:.1f} fps")
+    print(f" Annotated video saved to: {output_path}")
+
+
+def run_batch(args, detector):
+    """
+    Runs every job of a directory / manifest through the staged batch pipeline
+    and prints a throughput summary.
+    """
+    from src.batch_runner import BatchRunner, load_jobs
+
+    jobs = load_jobs(args.batch, prompt=args.prompt)
+    results_path = args.results or os.path.join(args.output_dir, "results.jsonl")
+    print(f" Jobs: {len(jobs)} from '{args.batch}'")
+    print(f" Results: {results_path}")
+    print(f" Using model '{DEFAULT_DETECTOR}' on '{get_device()}'")
+    print("-" * 30)
+
+    runner = BatchRunner(
+        detector,
+        output_dir=args.output_dir,
+        results_path=results_path,
+        do_critique=not args.no_critique,
+        batch_size=args.batch_size,
+    )
+    progress = {"done": 0}
+
+    def print_progress(record):
+        progress["done"] += 1
+        print(f"[{progress['done']}/{len(jobs)}] {record['id']}: {record['status']}")
+
+    summary = runner.run(jobs, resume=args.resume, on_record=print_progress)
+
+    print("\n" + "=" * 30)
+    print("BATCH SUMMARY")
+    print("=" * 30)
+    print(f" Completed: {summary['jobs']} (ok {summary['ok']}, no objects {summary['no_objects']}, errors {summary['error']})")
+    print(f" Skipped (resumed): {summary['skipped']}")
+    print(f" Wall time: {summary['wall_time_s']:.1f}s, throughput: {summary['jobs_per_s']:.2f} jobs/s")
+    for stage, seconds in summary["mean_stage_s"].items():
+        print(f"   {stage:<9} {seconds * 1000:8.1f} ms/job")
+
+
 if __name__ == "__main__":
     main()
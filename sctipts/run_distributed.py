@@ -0,0 +1,129 @@
+# multi-process / multi-node batch runner
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.batch_runner import load_jobs
+from src.distributed import DistributedRunner, SQLiteWorkQueue, default_threads, read_shards, worker_main
+from src.config import (
+    DETECTOR_MAX_BATCH_SIZE,
+    DIST_WORKERS,
+    DIST_LEASE_SIZE,
+    DIST_MAX_ATTEMPTS,
+    DIST_SHARE_WEIGHTS,
+)
+
+
+def main():
+    """
+    enqueue: load a directory / manifest into the work queue
+    run:     spawn local worker processes until the queue is drained
+    worker:  run a single worker in this process (e.g. one per host or container)
+    status:  queue counts and failed jobs
+    """
+    parser = argparse.ArgumentParser(description="Distributed batch detection over a shared work queue.")
+    parser.add_argument("--queue", required=True, help="SQLite work queue file (shared by every worker).")
+    parser.add_argument("--output_dir", default="outputs/distributed", help="Sharded results and rendered images.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue")
+    enqueue.add_argument("source", help="Directory of images or JSONL/CSV manifest.")
+    enqueue.add_argument("--prompt", help="Default prompt for jobs without one.")
+
+    for name in ("run", "worker"):
+        command = commands.add_parser(name)
+        command.add_argument("--threads", type=int, default=None, help="torch threads per worker process.")
+        command.add_argument("--lease_size", type=int, default=DIST_LEASE_SIZE)
+        command.add_argument("--max_attempts", type=int, default=DIST_MAX_ATTEMPTS)
+        command.add_argument("--batch_size", type=int, default=DETECTOR_MAX_BATCH_SIZE)
+        command.add_argument("--no_critique", action="store_true")
+        command.add_argument("--rate_limit_db", default=None, help="SQLite file holding the shared VLM rate-limit budget.")
+    commands.choices["run"].add_argument("--workers", type=int, default=DIST_WORKERS)
+    commands.choices["run"].add_argument("--node", default=None, help="Host name used in worker ids / shard names.")
+    commands.choices["run"].add_argument("--no_share_weights", action="store_true", help="Load the detector in every worker instead of sharing one copy.")
+    commands.choices["worker"].add_argument("--worker_id", default=f"{socket.gethostname()}-{os.getpid()}")
+
+    commands.add_parser("status")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "enqueue":
+        work_queue = SQLiteWorkQueue(args.queue)
+        jobs = load_jobs(args.source, prompt=args.prompt)
+        added = work_queue.put_many(jobs)
+        print(f" Enqueued {added} new job(s) ({len(jobs) - added} already queued): {work_queue.counts()}")
+        return
+
+    if args.command == "status":
+        work_queue = SQLiteWorkQueue(args.queue)
+        print(json.dumps(work_queue.counts()))
+        for job_id, attempts, error in work_queue.failed_jobs():
+            print(f"   failed {job_id} after {attempts} attempt(s): {error}")
+        print(f" Records in shards: {len(read_shards(args.output_dir))}")
+        return
+
+    worker_options = {
+        "lease_size": args.lease_size,
+        "max_attempts": args.max_attempts,
+        "batch_size": args.batch_size,
+        "do_critique": not args.no_critique,
+    }
+    rate_limit_path = args.rate_limit_db or os.path.join(args.output_dir, "vlm_rate_limits.sqlite")
+
+    if args.command == "worker":
+        processed = worker_main(
+            args.worker_id,
+            args.queue,
+            args.output_dir,
+            threads=args.threads or default_threads(1),
+            rate_limit_path=rate_limit_path,
+            **worker_options,
+        )
+        print(f" Worker {args.worker_id} processed {processed} job(s)")
+        return
+
+    runner = DistributedRunner(
+        args.queue,
+        args.output_dir,
+        workers=args.workers,
+        threads_per_worker=args.threads,
+        node=args.node,
+        rate_limit_path=rate_limit_path,
+        share_weights=DIST_SHARE_WEIGHTS and not args.no_share_weights,
+        **worker_options,
+    )
+    print(f" Workers: {runner.workers} x {runner.threads_per_worker} torch thread(s) on '{runner.node}'")
+    print("-" * 30)
+    summary = runner.run()
+    print("\n" + "=" * 30)
+    print("DISTRIBUTED SUMMARY")
+    print("=" * 30)
+    print(f" Completed: {summary['completed']} (done {summary['done']}, failed {summary['failed']}, left {summary['pending'] + summary['leased']})")
+    print(f" Worker restarts: {summary['restarts']}")
+    print(f" Wall time: {summary['wall_time_s']:.1f}s, throughput: {summary['jobs_per_s']:.2f} jobs/s")
+    print_memory_budget(summary)
+
+
+def print_memory_budget(summary):
+    """Peak RSS / PSS / shared MB per process; the PSS total is the node's real footprint."""
+    peak = summary["peak_memory"]
+    if not peak:
+        return
+    mb = 1024 * 1024
+    print(f"\n Memory budget ({'shared weights' if summary['shared_weights'] else 'one copy of the weights per worker'}):")
+    print(f"   {'process':<24}{'RSS MB':>10}{'PSS MB':>10}{'shared MB':>11}")
+    for name, usage in peak.items():
+        print(f"   {name:<24}{usage['rss'] / mb:>10.0f}{usage['pss'] / mb:>10.0f}{usage['shared'] / mb:>11.0f}")
+    print(f"   {'total (peak PSS)':<24}{'':>10}{summary['peak_total_pss'] / mb:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import contextlib
+import os
+import threading
+import weakref
+import torch
+
+from src.config import INV_MODEL_TYPES, PROJECT_ROOT
+
+BACKENDS = ("eager", "compile", "onnx", "int8", "bf16")
+ONNX_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache", "onnx")
+
+
+def inference_context(backend, device):
+    """Context wrapped around every detector forward (autocast for bf16)."""
+    if backend == "bf16":
+        device_type = "cuda" if str(device).startswith("cuda") else "cpu"
+        return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+class MemoizedBackbone(torch.nn.Module):
+    """
+    Wraps a vision backbone so repeated forwards on the *same* pixel_values
+    tensor object reuse the first result. The memo entry lives exactly as long
+    as the tensor, so evicting an image encoding from the LRU also frees its
+    backbone features.
+    """
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone
+        self._memo = {}  # id(pixel_values) -> (weakref(pixel_values), outputs)
+        self._lock = threading.Lock()
+
+    def forward(self, pixel_values, *args, **kwargs):
+        key = id(pixel_values)
+        with self._lock:
+            entry = self._memo.get(key)
+        if entry is not None and entry[0]() is pixel_values:
+            return entry[1]
+
+        outputs = self.backbone(pixel_values, *args, **kwargs)
+
+        def _drop(_, key=key, memo=self._memo, lock=self._lock):
+            with lock:
+                memo.pop(key, None)
+
+        with self._lock:
+            self._memo[key] = (weakref.ref(pixel_values, _drop), outputs)
+        return outputs
+
+
+def install_backbone_memo(model):
+    """Idempotently wraps GroundingDINO's vision backbone with MemoizedBackbone."""
+    inner = model.model
+    if not isinstance(inner.backbone, MemoizedBackbone):
+        inner.backbone = MemoizedBackbone(inner.backbone)
+    return inner.backbone
+
+
+def _vision_encoder_name(model_id):
+    """Attribute path of the image-side encoder the backends replace or compile."""
+    if INV_MODEL_TYPES[model_id] == "owlvit":
+        return "owlvit.vision_model"
+    if INV_MODEL_TYPES[model_id] == "grounding_dino":
+        return "model.backbone"
+    raise NotImplementedError("Model not supported")
+
+
+def _get_submodule(model, path):
+    module = model
+    for name in path.split("."):
+        module = getattr(module, name)
+        # MemoizedBackbone 등 wrapper는 건너뛰고 실제 모듈을 대상으로 함
+        while isinstance(module, MemoizedBackbone):
+            module = module.backbone
+    return module
+
+
+def _set_submodule(model, path, module):
+    parent_path, _, name = path.rpartition(".")
+    parent = _get_submodule(model, parent_path) if parent_path else model
+    current = getattr(parent, name)
+    if isinstance(current, MemoizedBackbone):
+        current.backbone = module
+    else:
+        setattr(parent, name, module)
+
+
+def apply_backend(model, model_id, backend, device):
+    """
+    Converts a freshly loaded eager model to `backend`:
+      eager   - unchanged
+      compile - torch.compile on the vision encoder (dynamic shapes)
+      onnx    - vision encoder exported once to ONNX and run with ONNX Runtime (CPU only)
+      int8    - dynamic int8 quantization of every nn.Linear (CPU only)
+      bf16    - weights kept fp32, forwards run under bf16 autocast
+    The text side and the fusion/decoder heads stay in torch for all backends.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    model.eval()
+    if backend == "compile":
+        path = _vision_encoder_name(model_id)
+        _set_submodule(model, path, torch.compile(_get_submodule(model, path), dynamic=True))
+    elif backend == "int8":
+        if str(device) != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        if str(device) != "cpu":
+            # the ONNX Runtime session runs on CPUExecutionProvider only
+            raise ValueError("The onnx backend is only supported on CPU")
+        path = _vision_encoder_name(model_id)
+        if INV_MODEL_TYPES[model_id] == "owlvit":
+            encoder = OnnxOwlViTVisionModel(_get_submodule(model, path), model_id)
+        else:
+            encoder = OnnxGroundingDinoBackbone(_get_submodule(model, path), model_id)
+        _set_submodule(model, path, encoder)
+    return model
+
+
+def _onnx_session(onnx_path):
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("The 'onnx' backend requires onnxruntime (pip install onnxruntime)") from e
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = torch.get_num_threads()
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def onnx_path_for(model_id, part):
+    return os.path.join(ONNX_CACHE_DIR, model_id.replace("/", "__"), f"{part}.onnx")
+
+
+class _OwlViTVisionExport(torch.nn.Module):
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        outputs = self.vision_model(pixel_values=pixel_values, return_dict=True)
+        return outputs.last_hidden_state, outputs.pooler_output
+
+
+class OnnxOwlViTVisionModel(torch.nn.Module):
+    """
+    Drop-in for `OwlViTForObjectDetection.owlvit.vision_model` backed by ONNX Runtime.
+    Exported once per model id and cached under .cache/onnx. `post_layernorm`
+    stays the torch module because `image_embedder` calls it directly.
+    """
+    def __init__(self, vision_model, model_id):
+        super().__init__()
+        self.post_layernorm = vision_model.post_layernorm
+        self.config = vision_model.config
+        self.onnx_path = onnx_path_for(model_id, "vision_model")
+        if not os.path.exists(self.onnx_path):
+            size = self.config.image_size
+            os.makedirs(os.path.dirname(self.onnx_path), exist_ok=True)
+            torch.onnx.export(
+                _OwlViTVisionExport(vision_model).eval(),
+                (torch.zeros(1, 3, size, size),),
+                self.onnx_path,
+                input_names=["pixel_values"],
+                output_names=["last_hidden_state", "pooler_output"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}, "pooler_output": {0: "batch"}},
+                opset_version=17,
+            )
+        self.session = _onnx_session(self.onnx_path)
+
+    def forward(self, pixel_values, **kwargs):
+        last_hidden_state, pooler_output = self.session.run(None, {"pixel_values": pixel_values.detach().cpu().float().numpy()})
+        device = pixel_values.device
+        return torch.from_numpy(last_hidden_state).to(device), torch.from_numpy(pooler_output).to(device)
+
+
+class _GroundingDinoBackboneExport(torch.nn.Module):
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone
+
+    def forward(self, pixel_values, pixel_mask):
+        features, position_embeddings = self.backbone(pixel_values, pixel_mask)
+        outputs = []
+        for feature_map, mask in features:
+            outputs += [feature_map, mask.to(torch.uint8)]
+        return tuple(outputs) + tuple(position_embeddings)
+
+
+class OnnxGroundingDinoBackbone(torch.nn.Module):
+    """
+    Drop-in for GroundingDINO's conv/Swin backbone (`model.model.backbone`) backed by
+    ONNX Runtime, with dynamic image height/width. Returns the same
+    ([(feature_map, mask), ...], [position_embedding, ...]) structure.
+    """
+    def __init__(self, backbone, model_id):
+        super().__init__()
+        self.onnx_path = onnx_path_for(model_id, "backbone")
+        if not os.path.exists(self.onnx_path):
+            pixel_values = torch.zeros(1, 3, 800, 1066)
+            pixel_mask = torch.ones(1, 800, 1066, dtype=torch.long)
+            # one eager forward for the number of feature levels, only when exporting
+            with torch.no_grad():
+                num_levels = len(backbone(pixel_values, pixel_mask)[0])
+            output_names = []
+            for level in range(num_levels):
+                output_names += [f"feature_{level}", f"mask_{level}"]
+            output_names += [f"position_{level}" for level in range(num_levels)]
+            os.makedirs(os.path.dirname(self.onnx_path), exist_ok=True)
+            torch.onnx.export(
+                _GroundingDinoBackboneExport(backbone).eval(),
+                (pixel_values, pixel_mask),
+                self.onnx_path,
+                input_names=["pixel_values", "pixel_mask"],
+                output_names=output_names,
+                dynamic_axes={
+                    "pixel_values": {0: "batch", 2: "height", 3: "width"},
+                    "pixel_mask": {0: "batch", 1: "height", 2: "width"},
+                    **{name: {0: "batch"} for name in output_names},
+                },
+                opset_version=17,
+            )
+        self.session = _onnx_session(self.onnx_path)
+        # feature, mask and position embedding per level
+        self.num_levels = len(self.session.get_outputs()) // 3
+
+    def forward(self, pixel_values, pixel_mask):
+        outputs = self.session.run(None, {
+            "pixel_values": pixel_values.detach().cpu().float().numpy(),
+            "pixel_mask": pixel_mask.detach().cpu().long().numpy(),
+        })
+        device = pixel_values.device
+        tensors = [torch.from_numpy(output).to(device) for output in outputs]
+        features = [
+            (tensors[2 * level], tensors[2 * level + 1].bool())
+            for level in range(self.num_levels)
+        ]
+        position_embeddings = tensors[2 * self.num_levels:]
+        return features, position_embeddings
+
+
+def check_parity(reference_tool, candidate_tool, samples, iou_threshold=0.5):
+    """
+    Compares detections of a candidate backend against the eager reference.
+    `samples` = [(image, query_list), ...]. Reports how many reference boxes were
+    matched (same label, IoU >= threshold), the mean IoU of matches and the
+    max score difference between matched boxes.
+    """
+    from src.utils import iou_matrix
+
+    matched = total = 0
+    ious, score_diffs = [], []
+    for image, queries in samples:
+        reference = reference_tool.detect_with_scores(image, queries)
+        candidate = candidate_tool.detect_with_scores(image, queries)
+        total += len(reference)
+        if not reference or not candidate:
+            continue
+        iou = iou_matrix([box for _, _, box, _ in reference], [box for _, _, box, _ in candidate])
+        used = set()
+        for r, (_, label, _, score) in enumerate(reference):
+            best, best_iou = None, iou_threshold
+            for c, (_, candidate_label, _, candidate_score) in enumerate(candidate):
+                if c not in used and str(candidate_label) == str(label) and iou[r, c] >= best_iou:
+                    best, best_iou = c, iou[r, c]
+            if best is not None:
+                used.add(best)
+                matched += 1
+                ious.append(float(best_iou))
+                score_diffs.append(abs(float(score) - float(candidate[best][3])))
+    return {
+        "reference_boxes": total,
+        "matched": matched,
+        "recall": matched / total if total else 1.0,
+        "mean_iou": sum(ious) / len(ious) if ious else None,
+        "max_score_diff": max(score_diffs) if score_diffs else None,
+    }
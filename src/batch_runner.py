@@ -0,0 +1,398 @@
+import csv
+import hashlib
+import json
+import os
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from src.utils import draw_arrows_and_numbers, save_bounding_boxes, load_image
+from src.image_cache import image_digest
+from src.config import (
+    DETECTOR_MAX_BATCH_SIZE,
+    BATCH_QUEUE_SIZE,
+    BATCH_VLM_WORKERS,
+    BATCH_RENDER_WORKERS,
+    BATCH_COLLECT_WINDOW,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+STAGES = ["decode", "extract", "detect", "critique", "redetect", "validate", "render"]
+_DONE = object()  # end-of-stream marker passed between stages
+
+logger = logging.getLogger(__name__)
+
+
+def _job_id(image_path, prompt):
+    digest = hashlib.sha1(f"{os.path.abspath(image_path)}\n{prompt}".encode("utf-8")).hexdigest()[:12]
+    return f"{os.path.splitext(os.path.basename(image_path))[0]}-{digest}"
+
+
+def load_jobs(source, prompt=None):
+    """
+    Reads (image, prompt) jobs from a directory of images, a JSONL manifest
+    (`{"image": ..., "prompt": ..., "id": optional}` per line) or a CSV manifest
+    with `image,prompt[,id]` columns. `prompt` is the default for rows without one;
+    relative image paths are resolved against the manifest's directory.
+    """
+    rows = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                rows.append({"image": os.path.join(source, name), "prompt": prompt})
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        ext = os.path.splitext(source)[1].lower()
+        with open(source, newline="", encoding="utf-8") as f:
+            if ext == ".jsonl":
+                raw_rows = [json.loads(line) for line in f if line.strip()]
+            elif ext == ".csv":
+                raw_rows = list(csv.DictReader(f))
+            else:
+                raise ValueError(f"Unsupported manifest format: {source}")
+        for row in raw_rows:
+            image = row["image"]
+            if not os.path.isabs(image):
+                image = os.path.join(base_dir, image)
+            rows.append({"image": image, "prompt": row.get("prompt") or prompt, "id": row.get("id")})
+
+    jobs = []
+    for row in rows:
+        if not row["prompt"]:
+            raise ValueError(f"No prompt given for {row['image']}")
+        jobs.append({
+            "id": row.get("id") or _job_id(row["image"], row["prompt"]),
+            "image": row["image"],
+            "prompt": row["prompt"],
+            "timings": {},
+        })
+    return jobs
+
+
+def load_checkpoint(results_path):
+    """Returns the ids of jobs already finished in a previous run of `results_path`."""
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 중단된 실행의 마지막 줄은 잘려 있을 수 있음
+            if record.get("status") in ("ok", "no_objects"):
+                done.add(record["id"])
+    return done
+
+
+def _to_json(value):
+    if hasattr(value, "item"):  # numpy / torch scalars
+        return value.item()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def _job_record(job):
+    detections = job.get("detections")
+    score_by_num = {num: float(score) for (num, _, _), score in zip(detections, detections.scores)} if detections is not None else {}
+    return {
+        "id": job["id"],
+        "image": job["image"],
+        "prompt": job["prompt"],
+        "status": job["status"],
+        "concepts": job.get("concepts"),
+        "refined_queries": job.get("refined_queries"),
+        "objects": [
+            {"num": num, "label": label, "box": box, "score": score_by_num.get(num)}
+            for num, label, box in job.get("objects", [])
+        ],
+        "reasoning": job.get("reasoning"),
+        "decisions": job.get("decisions"),
+        "output": job.get("output"),
+        "timings": job["timings"],
+        "error": job.get("error"),
+    }
+
+
+class BatchRunner:
+    """
+    Staged pipeline over many (image, prompt) jobs:
+    decode -> extract -> detect -> critique -> redetect -> validate -> render.
+
+    Stages run in their own threads and are connected by bounded queues, so
+    VLM round-trips of different jobs overlap, the detector stages collect jobs
+    into batched forward passes and the final rendering runs in a process pool.
+    Each finished job is appended to a JSONL results file, which doubles as the
+    checkpoint for `resume`. Critique and validation follow `tool.policy`
+    (src/policy.py) like a single run does; each record keeps the decisions.
+    """
+    def __init__(
+        self,
+        tool,
+        output_dir,
+        results_path,
+        do_critique=True,
+        queue_size=BATCH_QUEUE_SIZE,
+        vlm_workers=BATCH_VLM_WORKERS,
+        render_workers=BATCH_RENDER_WORKERS,
+        batch_size=DETECTOR_MAX_BATCH_SIZE,
+        collect_window=BATCH_COLLECT_WINDOW,
+        result_store=None,
+    ):
+        self.tool = tool
+        self.output_dir = output_dir
+        self.results_path = results_path
+        self.do_critique = do_critique
+        self.queue_size = queue_size
+        self.vlm_workers = vlm_workers
+        self.render_workers = render_workers
+        self.batch_size = batch_size
+        self.collect_window = collect_window
+        # finished records are also written to the tool's result store (src/result_store.py)
+        self.result_store = result_store if result_store is not None else getattr(tool, "result_store", None)
+        self._finished = None
+        self._render_pool = None
+
+    # ------------------------------------------------------------------
+    # stage functions: mutate the job; setting job["status"] ends it early
+    # ------------------------------------------------------------------
+    def _decode(self, job):
+        # decoded once here; later stages share this in-memory buffer
+        job["img"] = load_image(job["image"])
+        job["size"] = job["img"].size
+        if self.result_store is not None:
+            job["image_hash"] = image_digest(job["img"])
+
+    def _extract(self, job):
+        concepts = self.tool.vlm_tool.extract_objects_from_request(
+            job["img"], job["prompt"], model=self.tool.concept_detection_model
+        )
+        if not concepts:
+            job["status"] = "no_objects"
+            return
+        job["concepts"] = concepts
+
+    def _label(self, job, detections):
+        job["detections"] = detections
+        debug_path = None
+        if self.tool.debug_dir is not None:
+            debug_path = os.path.join(self.tool.debug_dir, f"{job['id']}_intermediate.jpg")
+        job["labeled_image"] = draw_arrows_and_numbers(job["img"], detections, output_path=debug_path)
+
+    def _detect(self, jobs):
+        results = self.tool.detect_batch([(job["img"], job["concepts"]) for job in jobs], max_batch_size=self.batch_size)
+        for job, detections in zip(jobs, results):
+            self._label(job, detections)
+
+    def _critique(self, job):
+        if not self.do_critique:
+            return
+        detections = job["detections"]
+        # same stage policy as ObjectDetectionTool._run (src/policy.py)
+        decision = self.tool.policy.critique(job["concepts"], detections, detections.scores.tolist(), self.tool.initial_critique_model)
+        job.setdefault("decisions", {})["critique"] = decision.to_dict()
+        if decision.skipped:
+            return
+        current_labels = ",".join(set([str(lbl) for _, lbl, _ in detections]))
+        refined_query_list = self.tool._critique_and_refine_query(
+            user_request=job["prompt"],
+            original_concepts=current_labels,
+            labeled_image=job["labeled_image"],
+            objects_detected=current_labels,
+            model=decision.model,
+        )
+        if refined_query_list and set(refined_query_list) != set(job["concepts"]):
+            job["refined_queries"] = refined_query_list
+
+    def _redetect(self, jobs):
+        pending = [job for job in jobs if job.get("refined_queries")]
+        if not pending:
+            return
+        results = self.tool.detect_batch([(job["img"], job["refined_queries"]) for job in pending], max_batch_size=self.batch_size)
+        for job, detections in zip(pending, results):
+            if not detections:
+                job["status"] = "no_objects"
+                continue
+            self._label(job, detections)
+
+    def _validate(self, job):
+        detections = job["detections"]
+        queries = job.get("refined_queries") or job["concepts"]
+        decision = self.tool.policy.validation(queries, detections, detections.scores.tolist(), self.tool.final_critique_model)
+        job.setdefault("decisions", {})["validate"] = decision.to_dict()
+        if decision.skipped:
+            valid_numbers = {}  # keep every box as detected
+        else:
+            valid_numbers, job["reasoning"] = self.tool._validate_bboxes_with_llm(
+                job["prompt"], job["labeled_image"], model=decision.model, with_reasoning=True
+            )
+        job["objects"] = self.tool._apply_validation(job["detections"], valid_numbers)
+        # the render process re-reads the file, so the decoded buffers can be released here
+        job.pop("img", None)
+        job.pop("labeled_image", None)
+
+    def _render(self, job):
+        ext = os.path.splitext(job["image"])[1]
+        output_path = os.path.join(self.output_dir, f"{job['id']}_final{ext}")
+        job["output"] = self._render_pool.submit(save_bounding_boxes, job["image"], job["objects"], output_path).result()
+        job["status"] = "ok"
+
+    # ------------------------------------------------------------------
+    # stage plumbing
+    # ------------------------------------------------------------------
+    def _collect(self, inbox):
+        """Blocks for one job, then gathers more for up to `collect_window` seconds."""
+        job = inbox.get()
+        if job is _DONE:
+            return [], True
+        jobs = [job]
+        deadline = time.monotonic() + self.collect_window
+        while len(jobs) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is _DONE:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def _process(self, name, fn, jobs, outbox, batched):
+        started = time.perf_counter()
+        try:
+            if batched:
+                fn(jobs)
+            else:
+                fn(jobs[0])
+        except Exception as e:
+            for job in jobs:
+                job["status"] = "error"
+                job["error"] = f"{name}: {type(e).__name__}: {e}"
+        elapsed = (time.perf_counter() - started) / len(jobs)
+        for job in jobs:
+            job["timings"][name] = job["timings"].get(name, 0.0) + elapsed
+            if "status" in job:
+                self._finished.put(job)
+            else:
+                outbox.put(job)
+
+    def _start_stage(self, name, fn, inbox, outbox, workers=1, batched=False):
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def loop():
+            try:
+                while True:
+                    if batched:
+                        jobs, done = self._collect(inbox)
+                    else:
+                        job = inbox.get()
+                        done = job is _DONE
+                        jobs = [] if done else [job]
+                    if jobs:
+                        self._process(name, fn, jobs, outbox, batched)
+                    if done:
+                        inbox.put(_DONE)  # 같은 stage의 다른 worker도 종료하도록 다시 넣음
+                        break
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+
+        threads = [threading.Thread(target=loop, name=f"batch-{name}-{i}", daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self, jobs, resume=False, on_record=None):
+        """
+        Runs all `jobs` and appends one record per job to `results_path`.
+        With `resume=True`, jobs already recorded as finished are skipped.
+        `on_record(record)` is called after each record is flushed (e.g. to
+        acknowledge the job in a work queue). Returns a throughput summary dict.
+        """
+        skipped = 0
+        if resume:
+            done_ids = load_checkpoint(self.results_path)
+            skipped = sum(1 for job in jobs if job["id"] in done_ids)
+            jobs = [job for job in jobs if job["id"] not in done_ids]
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.results_path)), exist_ok=True)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in STAGES]
+        self._finished = queue.Queue()
+        stage_specs = [
+            ("decode", self._decode, 1, False),
+            ("extract", self._extract, self.vlm_workers, False),
+            ("detect", self._detect, 1, True),
+            ("critique", self._critique, self.vlm_workers, False),
+            ("redetect", self._redetect, 1, True),
+            ("validate", self._validate, self.vlm_workers, False),
+            ("render", self._render, self.render_workers, False),
+        ]
+
+        started = time.perf_counter()
+        counts = {"ok": 0, "no_objects": 0, "error": 0}
+        stage_totals = {name: 0.0 for name in STAGES}
+        with ProcessPoolExecutor(max_workers=self.render_workers) as render_pool:
+            self._render_pool = render_pool
+            threads = []
+            for i, (name, fn, workers, batched) in enumerate(stage_specs):
+                outbox = queues[i + 1] if i + 1 < len(queues) else self._finished
+                threads += self._start_stage(name, fn, queues[i], outbox, workers=workers, batched=batched)
+
+            def feed():
+                for job in jobs:
+                    queues[0].put(job)
+                queues[0].put(_DONE)
+
+            threading.Thread(target=feed, name="batch-feed", daemon=True).start()
+
+            # the render stage's end marker arrives last; everything before it is a finished job
+            with open(self.results_path, "a", encoding="utf-8") as results_file:
+                completed = 0
+                while True:
+                    job = self._finished.get()
+                    if job is _DONE:
+                        break
+                    completed += 1
+                    counts[job["status"]] += 1
+                    for name, seconds in job["timings"].items():
+                        stage_totals[name] += seconds
+                    record = _job_record(job)
+                    results_file.write(json.dumps(record, default=_to_json, ensure_ascii=False) + "\n")
+                    results_file.flush()
+                    if self.result_store is not None:
+                        try:
+                            self.result_store.add_record(
+                                record, image_hash=job.get("image_hash"), image_size=job.get("size"),
+                                critique=self.do_critique, detector=self.tool.model_id,
+                            )
+                        except sqlite3.Error as e:
+                            logger.warning("Could not persist %s to the result store: %s", job["id"], e)
+                    if on_record is not None:
+                        on_record(record)
+                    logger.info("[%d/%d] %s: %s", completed, len(jobs), job["id"], job["status"])
+
+            for thread in threads:
+                thread.join()
+            self._render_pool = None
+
+        wall_time = time.perf_counter() - started
+        completed = sum(counts.values())
+        return {
+            "jobs": completed,
+            "skipped": skipped,
+            **counts,
+            "wall_time_s": wall_time,
+            "jobs_per_s": completed / wall_time if wall_time > 0 else 0.0,
+            "mean_stage_s": {name: total / completed for name, total in stage_totals.items()} if completed else {},
+        }
@@ -0,0 +1,163 @@
+import numpy as np
+
+from src.metrics import CASCADE_CONCEPTS
+from src.model_registry import get_registry
+from src.postprocess import Detections, postprocess, weighted_box_fusion
+from src.tracing import stage
+from src.config import (
+    MODEL_TYPES,
+    INV_MODEL_TYPES,
+    CASCADE_PRESCREEN_DETECTOR,
+    CASCADE_RECALL_THRESHOLD,
+    CASCADE_ACCEPT_SCORE,
+    CASCADE_FUSION_IOU,
+    CASCADE_FUSION_WEIGHTS,
+)
+
+
+def _subset(detections, labels):
+    """Detections restricted to `labels`."""
+    keep = [i for i, label in enumerate(detections.labels) if label in labels]
+    return Detections(detections.boxes[keep], detections.scores[keep], [detections.labels[i] for i in keep])
+
+
+def _match_queries(labels, queries):
+    """
+    Maps detector labels back to the query strings. GroundingDINO's
+    `text_labels` are spans of the prompt, which can be a part of a query
+    ("traffic" for "traffic light") or merge two; they go to the query
+    sharing the most words with them, and stay as they are otherwise.
+    """
+    words = {query: set(query.lower().split()) for query in queries}
+    matched = []
+    for label in labels:
+        if label in words:
+            matched.append(label)
+            continue
+        label_words = set(str(label).lower().split())
+        best = max(queries, key=lambda query: len(words[query] & label_words))
+        matched.append(best if words[best] & label_words else label)
+    return matched
+
+
+class CascadeDetector:
+    """
+    Two-stage detection: a cheap pre-screen detector (OWL-ViT) gates the
+    expensive one (`main`, GroundingDINO). Both stay resident.
+
+    1. Pre-screen: OWL-ViT scores every concept. A concept whose best raw
+       score is below `recall_threshold` is taken as absent and ends there;
+       when every concept is absent the image ends without a GroundingDINO
+       pass. With `accept_score` set, concepts OWL-ViT is already sure of
+       keep its boxes and skip GroundingDINO too.
+    2. Main: GroundingDINO runs on the remaining concepts only (tiled /
+       batched like any call of `main`).
+    3. Fuse: for routed concepts the boxes of both detectors are merged with
+       weighted box fusion (`weights` = (pre-screen, main)). A box only
+       OWL-ViT found keeps a fraction of its score and is dropped unless
+       OWL-ViT was very sure of it; a box only GroundingDINO found survives.
+    """
+    def __init__(
+        self,
+        prescreen,
+        main,
+        recall_threshold=CASCADE_RECALL_THRESHOLD,
+        accept_score=CASCADE_ACCEPT_SCORE,
+        fusion_iou=CASCADE_FUSION_IOU,
+        weights=CASCADE_FUSION_WEIGHTS,
+    ):
+        if prescreen.model_id == main.model_id:
+            raise ValueError(f"Cascade needs two different detectors, got {main.model_id} twice")
+        if INV_MODEL_TYPES[prescreen.model_id] != "owlvit":
+            # GroundingDINO post-processing drops boxes below its own threshold, so it cannot report weak evidence
+            raise ValueError(f"Pre-screen detector must be OWL-ViT, got {prescreen.model_id}")
+        self.prescreen = prescreen
+        self.main = main
+        self.recall_threshold = recall_threshold
+        self.accept_score = accept_score
+        self.fusion_iou = fusion_iou
+        self.weights = tuple(weights)
+
+    @classmethod
+    def for_tool(cls, tool, prescreen_detector=CASCADE_PRESCREEN_DETECTOR, **kwargs):
+        """
+        Cascade in front of `tool`. The pre-screen weights come from the model
+        registry, so every tool on this device shares one copy.
+        """
+        model_id = MODEL_TYPES[prescreen_detector]
+        processor, model = get_registry().get(model_id, tool.device, tool.backend)
+        prescreen = type(tool)(
+            model_id=model_id,
+            device=tool.device,
+            vlm_tool=None,
+            confidence_threshold=tool.confidence_threshold,
+            processor=processor,
+            model=model,
+            image_cache=tool.image_cache,
+            text_cache=tool.text_cache,
+            debug_dir=None,
+            backend=tool.backend,
+            tiler=False,
+            cascade=False,
+        )
+        return cls(prescreen, tool, **kwargs)
+
+    def route(self, best_scores):
+        """Splits concepts by their best pre-screen score into (absent, accepted, routed)."""
+        absent, accepted, routed = [], [], []
+        for query, score in best_scores.items():
+            if score < self.recall_threshold:
+                absent.append(query)
+            elif self.accept_score is not None and score >= self.accept_score:
+                accepted.append(query)
+            else:
+                routed.append(query)
+        return absent, accepted, routed
+
+    def detect(self, img, query_list, use_cache=True):
+        """Detections for `query_list` on a decoded image."""
+        queries = list(dict.fromkeys(query_list))
+        if not queries:
+            return Detections.empty()
+
+        with stage("cascade_prescreen", model=self.prescreen.model_id) as span:
+            encoding = self.prescreen._encode_image(img, use_cache=use_cache)
+            scores, boxes, labels = self.prescreen._detect_with_encoding(encoding, queries, img.size)
+            best_scores = dict.fromkeys(queries, 0.0)
+            for score, label in zip(np.asarray(scores.cpu(), dtype=np.float32).tolist(), labels):
+                best_scores[label] = max(best_scores[label], score)
+            absent, accepted, routed = self.route(best_scores)
+            prescreened = self.prescreen._postprocess(scores, boxes, labels, img.size)
+            span.set_attribute("absent", len(absent))
+            span.set_attribute("accepted", len(accepted))
+            span.set_attribute("routed", len(routed))
+        for route, concepts in (("absent", absent), ("accepted", accepted), ("routed", routed)):
+            if concepts:
+                CASCADE_CONCEPTS.inc(len(concepts), route=route)
+
+        kept = _subset(prescreened, set(accepted))
+        if not routed:
+            # nothing left for the expensive detector
+            return kept
+
+        with stage("cascade_main", model=self.main.model_id, concepts=len(routed)):
+            confirmed = self.main._detect_single_model(img, routed, use_cache=use_cache)
+            confirmed = Detections(confirmed.boxes, confirmed.scores, _match_queries(confirmed.labels, routed))
+
+        with stage("cascade_fuse") as span:
+            fused_scores, fused_boxes, fused_labels = weighted_box_fusion(
+                [_subset(prescreened, set(routed)), confirmed], self.weights, self.fusion_iou
+            )
+            # WBF scales a cluster by the weight share of the models that saw it: the main
+            # detector's threshold at its own share keeps every box it found on its own
+            threshold = self.main.confidence_threshold * self.weights[1] / sum(self.weights)
+            fused_keep = fused_scores >= threshold
+            detections = postprocess(
+                np.concatenate([kept.scores, fused_scores[fused_keep]]),
+                np.concatenate([kept.boxes, fused_boxes[fused_keep]]),
+                kept.labels + [label for label, keep in zip(fused_labels, fused_keep) if keep],
+                0.0,
+                image_size=img.size,
+            )
+            span.set_attribute("boxes", len(detections))
+        return detections
@@ -0,0 +1,60 @@
+import base64
+import io
+
+import httpx
+
+from PIL import Image
+from src.utils import load_image
+
+
+class DetectionClient:
+    """
+    Minimal client for the HTTP detection service (src/server.py).
+    `image` may be a path, PIL image, ndarray or encoded bytes; anything that is
+    not already encoded is uploaded as PNG so identical inputs coalesce server-side.
+    """
+    def __init__(self, base_url, timeout=300.0):
+        self._http = httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout)
+
+    @staticmethod
+    def _encode(image):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return bytes(image)
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                return f.read()
+        buffer = io.BytesIO()
+        load_image(image).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def detect(self, image, user_request, critique=True, return_image=False):
+        """`POST /v1/detect`; returns the JSON body. Raises httpx.HTTPStatusError on 4xx/5xx."""
+        response = self._http.post(
+            "/v1/detect",
+            files={"image": ("image", self._encode(image), "application/octet-stream")},
+            data={"request": user_request, "critique": str(bool(critique)).lower(), "return_image": str(bool(return_image)).lower()},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def ready(self):
+        try:
+            return self._http.get("/readyz").status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def stats(self):
+        response = self._http.get("/v1/stats")
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._http.close()
+
+
+def decode_image(body):
+    """Annotated PIL image from a `/v1/detect` body requested with `return_image=True` (None if absent)."""
+    encoded = body.get("image")
+    if not encoded:
+        return None
+    return Image.open(io.BytesIO(base64.b64decode(encoded))).convert("RGB")
@@ -1,4 +1,4 @@
-import torch
+import os
 
 # ==== Object detector ====
 # object detector model types
@@ -6,6 +6,12 @@ MODEL_TYPES = {"owlvit": "google/owlvit-base-patch32",
     "grounding_dino": "IDEA-Research/grounding-dino-tiny",}
 
 DEFAULT_DETECTOR = "grounding_dino"
+# 모델 로딩: HF 캐시에서 safetensors를 memory-map으로 읽음 (sctipts/prefetch_models.py로 미리 다운로드)
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR")  # None이면 HF 기본 캐시 (~/.cache/huggingface)
+MODEL_OFFLINE = os.getenv("HF_HUB_OFFLINE", "0").lower() in ("1", "true", "yes")  # 네트워크 없이 로컬 캐시만 사용
+MODEL_USE_SAFETENSORS = None  # True: safetensors만 허용, None: 있으면 safetensors 사용
+# detector inference backend: "eager", "compile", "onnx", "int8", "bf16" (src/backends.py)
+DETECTOR_BACKEND = "eager"
 INV_MODEL_TYPES = {v:k for k,v in MODEL_TYPES.items()} # key, value 뒤집은 딕셔너리
 
 # ==== VLM ====
@@ -13,12 +19,161 @@ CONCEPT_EXTRACTION_VLM = "gpt-4.1"  # 초기 개념 추출
 CRITIQUE_VLM = "gpt-4o"            # 쿼리 비평 및 개선
 VALIDATION_VLM = "gpt-4.1"         # 최종 검증
 
+# VLM 호출 제어: 동시 요청 수, timeout, 재시도(backoff) 설정
+VLM_MAX_CONCURRENCY = 16
+VLM_TIMEOUT = 60.0            # 요청당 timeout (초)
+VLM_MAX_RETRIES = 5
+VLM_BACKOFF_BASE = 0.5        # 지수 backoff 시작 값 (초)
+VLM_BACKOFF_MAX = 20.0        # backoff 최대 값 (초)
+# 모델별 분당 요청/토큰 예산 (rpm: requests per minute, tpm: tokens per minute)
+VLM_RATE_LIMITS = {
+    "gpt-4.1": {"rpm": 500, "tpm": 30000},
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+}
+VLM_RATE_LIMIT_PATH = None    # SQLite 파일 경로를 주면 이 파일을 여는 모든 process가 위 예산을 공유
+
+# VLM 이미지 업로드 준비: 모델이 실제로 사용하는 tile 해상도로 줄이고 JPEG 재인코딩
+VLM_IMAGE_DETAIL = "high"
+VLM_JPEG_QUALITY = 85
+VLM_MAX_TILES = None          # high detail tile 수 상한 (None이면 모델 기본 geometry만 적용)
+VLM_PAYLOAD_CACHE_MAX_BYTES = 64 * 1024 * 1024
+VLM_IMAGE_GEOMETRY = {
+    # max_side 안으로 축소 -> 짧은 변 short_side로 축소 -> tile x tile 단위로 과금
+    "default": {"max_side": 2048, "short_side": 768, "low_side": 512, "tile": 512, "base_tokens": 85, "tile_tokens": 170},
+}
+
+# VLM 응답 캐시 (동일한 model/messages/image 요청은 API 재호출 없이 재사용)
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+VLM_CACHE_ENABLED = True
+VLM_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "vlm_responses.sqlite")
+VLM_CACHE_TTL = 7 * 24 * 3600              # 초 단위, None이면 만료 없음
+VLM_CACHE_MAX_BYTES = 256 * 1024 * 1024    # 디스크 캐시 최대 크기
+VLM_CACHE_MEMORY_ENTRIES = 1024            # 메모리 LRU 항목 수
+
 # === Device ===
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# DEVICE는 처음 접근할 때 결정 (config import만으로 torch를 로드하지 않도록, 아래 __getattr__ 참고)
+DEVICE_OVERRIDE = os.getenv("DETECTOR_DEVICE")  # "cpu" / "cuda" / "cuda:1" ..., None이면 자동 감지
 CONFIDENCE_THRESHOLD = 0.2
+# detection post-processing (src/postprocess.py), None이면 해당 단계 생략
+NMS_IOU_THRESHOLD = 0.5             # 같은 label 내 NMS IoU
+NMS_AGNOSTIC_IOU_THRESHOLD = 0.8    # label 무관 NMS IoU (여러 쿼리/phrase가 같은 객체에 매칭된 중복 제거)
+MAX_DETECTIONS_PER_LABEL = 20
+MAX_DETECTIONS = 50
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 이미지 인코딩(backbone feature) LRU 캐시 크기
+# detector text query 임베딩 캐시 (OWL-ViT), 자주 쓰는 concept은 재인코딩 없이 재사용
+TEXT_EMBED_CACHE_ENABLED = True
+TEXT_EMBED_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "text_embeddings.sqlite")  # None이면 메모리만 사용
+TEXT_EMBED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TEXT_EMBED_CACHE_MEMORY_ENTRIES = 4096
+DETECTOR_MAX_BATCH_SIZE = 8                    # batch detection 시 forward pass 당 최대 이미지 수
+DETECTOR_MAX_BATCH_PIXELS = 8 * 800 * 1333     # forward pass 당 최대 (padding 포함) 입력 픽셀 수
+INTERMEDIATE_DEBUG_DIR = None  # 경로 지정 시 화살표/번호가 그려진 중간 이미지를 디스크에 저장 (디버그용)
+
+# ==== Tiled detection (src/tiling.py) ====
+TILING_ENABLED = False          # 고해상도 이미지를 tile로 나눠 detection
+TILE_SIZE = 1024                # tile 한 변 (px)
+TILE_OVERLAP = 128              # 인접 tile 겹침 (px), 이보다 작은 객체는 한 tile 안에 온전히 들어감
+TILE_MIN_IMAGE_SIDE = 2048      # 긴 변이 이보다 큰 이미지만 tiling
+TILE_PRESCREEN_SIZE = 1024      # low-res pass 긴 변 (px)
+TILE_PRESCREEN_THRESHOLD = None # low-res pass에서 이 점수 이상의 box와 겹치는 tile만 실행 (None이면 끔, GroundingDINO는 후처리 자체 threshold 0.25 미만 box를 내지 않음)
+TILE_FLAT_STD = 6.0             # low-res 밝기 표준편차가 이보다 작은 (빈 배경) tile은 건너뜀 (None이면 끔)
+TILE_BATCH_SIZE = 8             # 한 forward에 묶는 tile 수 (메모리 상한)
+TILE_MAX_DETECTIONS = 500       # tiling 결과 최대 box 수
+
+# ==== Detector cascade (src/cascade.py) ====
+CASCADE_ENABLED = False             # OWL-ViT pre-screen 후 필요한 concept만 GroundingDINO로 detection
+CASCADE_PRESCREEN_DETECTOR = "owlvit"  # 먼저 실행하는 저비용 detector (MODEL_TYPES key)
+CASCADE_RECALL_THRESHOLD = 0.05     # OWL-ViT 최고 점수가 이보다 낮은 concept은 없는 것으로 보고 종료 (recall 우선이라 낮게)
+CASCADE_ACCEPT_SCORE = None         # OWL-ViT 최고 점수가 이 이상인 concept은 GroundingDINO 없이 OWL-ViT 결과 사용 (None이면 끔)
+CASCADE_FUSION_IOU = 0.55           # weighted box fusion에서 같은 객체로 묶는 IoU
+CASCADE_FUSION_WEIGHTS = (1.0, 2.0) # fusion 가중치 (pre-screen, GroundingDINO)
+
+
+# ==== Stage policy (src/policy.py) ====
+STAGE_POLICY = "always"                 # "always": critique/validation 항상 실행, "adaptive": detector 점수로 생략/모델 변경
+POLICY_CHEAP_VLM = "gpt-4.1"            # 쉬운 경우에 사용할 저비용 모델
+POLICY_CRITIQUE_SKIP_SCORE = 0.5        # 모든 concept의 최고 점수가 이 이상이면 critique 생략
+POLICY_VALIDATION_SKIP_SCORE = 0.6      # 모든 box 점수가 이 이상이고
+POLICY_VALIDATION_SKIP_MAX_BOXES = 3    # box 수가 이 이하이면 validation 생략
+POLICY_DOWNGRADE_SCORE = 0.4            # 모든 box 점수가 이 이상이면 validation에 저비용 모델 사용
+SPECULATIVE_VALIDATION = False          # critique와 동시에 1차 결과 validation 실행 (refine 시 결과 폐기)
+
+# ==== Serving ====
+WORKER_POOL_SIZE = 2        # 공유 모델에 동시에 접근하는 worker 수
+WORKER_QUEUE_SIZE = 8       # 대기열 최대 길이 (초과 시 요청 거절)
+WORKER_QUEUE_TIMEOUT = 30.0 # 대기열 자리가 날 때까지 기다리는 최대 시간 (초)
+
+# HTTP 서비스 (src/server.py)
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8000
+SERVER_WORKERS = 16               # 동시에 진행하는 pipeline 수 (detector forward는 batcher thread 하나에서 실행)
+SERVER_BATCH_WINDOW = 0.01        # 동시 요청의 detector 호출을 한 forward로 모으는 시간 (초)
+SERVER_MAX_BATCH_SIZE = 8         # 한 forward에 묶는 최대 이미지 수
+SERVER_MAX_IMAGE_BYTES = 20 * 1024 * 1024  # 업로드 이미지 최대 크기
+SERVER_DRAIN_TIMEOUT = 30.0       # 종료 시 진행 중인 요청을 기다리는 최대 시간 (초)
+SERVER_DRAIN_DELAY = 5.0          # 종료 신호 후 /readyz가 503을 보고한 채 연결을 계속 받는 최소 시간 (초)
+
+
+# ==== Observability ====
+METRICS_PORT = 9464         # Prometheus `/metrics` 포트 (None이면 비활성)
+TRACE_EXPORT = None         # None | "otel" (OpenTelemetry SDK) | 파일 경로 (trace 당 OTLP/JSON 한 줄)
+TRACE_SERVICE_NAME = "agentic-object-detection"
+
+# ==== Result store (src/result_store.py) ====
+RESULT_STORE_PATH = None            # 경로 지정 시 모든 run 결과(box, label, score, timing)를 SQLite에 저장 (None이면 끔)
+RESULT_STORE_SHORT_CIRCUIT = True   # 같은 이미지 + 요청의 이전 "ok" 결과가 있으면 pipeline 대신 저장된 결과 사용
+RESULT_STORE_MAX_AGE = None         # short-circuit에 쓰는 결과의 최대 나이 (초, None이면 무제한)
+
+
+# ==== Batch runner ====
+BATCH_QUEUE_SIZE = 32        # stage 사이 queue 최대 길이
+BATCH_VLM_WORKERS = 8        # VLM stage (extract / critique / validate) 별 thread 수
+BATCH_RENDER_WORKERS = 4     # 최종 이미지 렌더링 process 수
+BATCH_COLLECT_WINDOW = 0.05  # detector batch를 모으기 위해 기다리는 시간 (초)
+
+
+# ==== Distributed batch (src/distributed.py) ====
+DIST_WORKERS = 4                # worker process 수
+DIST_THREADS_PER_WORKER = None  # worker당 torch thread 수 (None이면 cpu 수 // worker 수)
+DIST_LEASE_SIZE = 16            # worker가 queue에서 한 번에 가져오는 job 수
+DIST_LEASE_TIMEOUT = 600.0      # heartbeat가 끊긴 worker의 job이 queue로 돌아가기까지의 시간 (초)
+DIST_MAX_ATTEMPTS = 3           # job당 최대 시도 횟수 (초과 시 failed)
+DIST_MAX_RESTARTS = 10          # 비정상 종료된 worker를 다시 띄우는 총 횟수 한도
+DIST_POLL_INTERVAL = 2.0        # 남은 job을 기다리거나 worker 상태를 확인하는 주기 (초)
+DIST_SHARE_WEIGHTS = True       # CPU에서 부모 process가 detector를 한 번 로드하고 shared memory로 worker들과 공유 (eager/bf16 backend)
+DIST_SHARING_STRATEGY = "file_system"  # torch tensor 공유 방식 ("file_descriptor"는 tensor마다 fd를 열어 ulimit에 걸릴 수 있음)
+
+
+# ==== Video / stream ====
+VIDEO_DETECT_EVERY = 3                # detector는 k 프레임마다 실행, 나머지는 tracker 예측
+VIDEO_REFRESH_EVERY = 300             # N 프레임마다 VLM으로 쿼리 재추출/재검증 (None이면 비활성)
+VIDEO_SCENE_CHANGE_THRESHOLD = 0.5    # 히스토그램 상관계수가 이보다 낮으면 scene change로 판단
+VIDEO_MIN_REFRESH_GAP = 30            # scene change로 인한 VLM 재실행 사이의 최소 프레임 수 (빠른 pan/깜빡임 대비)
+TRACKER_IOU_THRESHOLD = 0.3
+TRACKER_MAX_MISSES = 10               # 연속으로 매칭되지 않은 detector 실행 횟수 한도
 
 
 # ==== Visualization ====
 COLOR_PALETTE = ["red", "blue", "green", "purple", "orange", 
     "cyan", "magenta", "yellow", "brown", "pink"]
-FONT_PATH = "fonts/arial.ttf"
\ No newline at end of file
+FONT_PATH = "fonts/arial.ttf"
+
+
+def get_device():
+    """Detector device: DETECTOR_DEVICE if set, else cuda when available (imports torch on first call)."""
+    device = globals().get("DEVICE")
+    if device is None:
+        if DEVICE_OVERRIDE:
+            device = DEVICE_OVERRIDE
+        else:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        globals()["DEVICE"] = device
+    return device
+
+
+def __getattr__(name):
+    # `from src.config import DEVICE` still works, but only resolves the device when asked for
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,473 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from src.config import (
+    MODEL_TYPES,
+    DEFAULT_DETECTOR,
+    CONFIDENCE_THRESHOLD,
+    CONCEPT_EXTRACTION_VLM,
+    CRITIQUE_VLM,
+    VALIDATION_VLM,
+    DETECTOR_MAX_BATCH_SIZE,
+    VLM_RATE_LIMIT_PATH,
+    DIST_WORKERS,
+    DIST_THREADS_PER_WORKER,
+    DIST_LEASE_SIZE,
+    DIST_LEASE_TIMEOUT,
+    DIST_MAX_ATTEMPTS,
+    DIST_MAX_RESTARTS,
+    DIST_POLL_INTERVAL,
+    DIST_SHARE_WEIGHTS,
+    DIST_SHARING_STRATEGY,
+    DETECTOR_BACKEND,
+    get_device,
+)
+
+logger = logging.getLogger(__name__)
+
+# backends whose weights stay plain torch tensors (compile / onnx / int8 wrap or repack them)
+SHAREABLE_BACKENDS = ("eager", "bf16")
+
+
+class SQLiteWorkQueue:
+    """
+    Job queue in one SQLite file, the local (single-host) stand-in for a
+    shared broker. Workers lease jobs for `lease_timeout` seconds and keep the
+    lease alive with `heartbeat`; jobs of a crashed or hung worker go back to
+    the queue when the lease runs out (or at once via `release_worker`). After
+    `max_attempts` leases a job is marked failed, so one bad image cannot
+    crash workers forever.
+    """
+    def __init__(self, path, max_attempts=DIST_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " state TEXT NOT NULL,"  # pending | leased | done | failed
+            " status TEXT,"          # BatchRunner record status of the last attempt
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state)")
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn, time.time())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _requeue(self, conn, now, where, params, error):
+        """Leased jobs matching `where` go back to pending, or to failed once out of attempts."""
+        return conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " worker = NULL, lease_until = NULL, error = ?, updated_at = ?"
+            f" WHERE state = 'leased' AND {where}",
+            (self.max_attempts, error, now, *params),
+        ).rowcount
+
+    def put_many(self, jobs):
+        """Enqueues `load_jobs`-style dicts; ids already in the queue are ignored. Returns the number added."""
+        def put(conn, now):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (id, payload, state, updated_at) VALUES (?, ?, 'pending', ?)",
+                [(job["id"], json.dumps(job, ensure_ascii=False), now) for job in jobs],
+            )
+            return conn.total_changes - before
+        return self._transaction(put)
+
+    def lease(self, worker_id, n, lease_timeout=DIST_LEASE_TIMEOUT):
+        """Claims up to `n` pending jobs (expired leases first go back to the queue)."""
+        def lease(conn, now):
+            self._requeue(conn, now, "lease_until < ?", (now,), "lease expired")
+            rows = conn.execute(
+                "SELECT id, payload FROM jobs WHERE state = 'pending' ORDER BY rowid LIMIT ?", (n,)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(worker_id, now + lease_timeout, now, job_id) for job_id, _ in rows],
+            )
+            return [json.loads(payload) for _, payload in rows]
+        return self._transaction(lease)
+
+    def heartbeat(self, worker_id, lease_timeout=DIST_LEASE_TIMEOUT):
+        """Extends the leases of every job held by `worker_id`."""
+        return self._transaction(lambda conn, now: conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE state = 'leased' AND worker = ?", (now + lease_timeout, worker_id)
+        ).rowcount)
+
+    def ack(self, job_id, status="ok"):
+        """Marks a job finished (also accepted from a worker whose lease already expired)."""
+        self._transaction(lambda conn, now: conn.execute(
+            "UPDATE jobs SET state = 'done', status = ?, worker = NULL, lease_until = NULL, error = NULL, updated_at = ?"
+            " WHERE id = ? AND state != 'done'",
+            (status, now, job_id),
+        ))
+
+    def fail(self, job_id, worker_id, error):
+        """Returns a failed job to the queue for another attempt, or marks it failed."""
+        self._transaction(lambda conn, now: self._requeue(
+            conn, now, "id = ? AND worker = ?", (job_id, worker_id), error
+        ))
+
+    def release_worker(self, worker_id, error=None):
+        """Requeues every job leased by `worker_id` (called when its process died)."""
+        return self._transaction(lambda conn, now: self._requeue(
+            conn, now, "worker = ?", (worker_id,), error or f"worker {worker_id} exited"
+        ))
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def unfinished(self):
+        counts = self.counts()
+        return counts["pending"] + counts["leased"]
+
+    def failed_jobs(self):
+        """[(id, attempts, error), ...] of jobs that ran out of attempts."""
+        with self._lock:
+            return self._conn.execute("SELECT id, attempts, error FROM jobs WHERE state = 'failed' ORDER BY id").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def default_threads(workers):
+    """torch intra-op threads per worker so `workers` processes do not oversubscribe the cores."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def shard_path(output_dir, worker_id):
+    return os.path.join(output_dir, "shards", f"{worker_id}.jsonl")
+
+
+def read_shards(output_dir):
+    """Final record per job id across all shards (retried jobs keep their last record)."""
+    records = {}
+    shard_dir = os.path.join(output_dir, "shards")
+    if not os.path.isdir(shard_dir):
+        return records
+    for name in sorted(os.listdir(shard_dir)):
+        if not name.endswith(".jsonl"):
+            continue
+        with open(os.path.join(shard_dir, name), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a killed worker may leave a truncated last line
+                previous = records.get(record["id"])
+                if previous is None or previous.get("status") == "error":
+                    records[record["id"]] = record
+    return records
+
+
+def process_memory(pid):
+    """
+    {"rss", "pss", "shared"} bytes of process `pid` from /proc (Linux), or None.
+    RSS counts weights shared with other processes in full for every one of
+    them; PSS splits each shared page between its users, so PSS summed over
+    processes is what the node actually spends.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024  # kB
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+def load_shared_weights(model_id, device, backend=DETECTOR_BACKEND, sharing_strategy=DIST_SHARING_STRATEGY):
+    """
+    Loads (processor, model) once and moves the model's parameters and buffers
+    into shared memory. Passed to a spawned worker, the tensors are pickled as
+    shared-memory handles, so every worker maps the same pages instead of
+    holding its own copy. Workers only run no_grad inference on an eval-mode
+    model and never write to the weights.
+    """
+    if str(device) != "cpu":
+        raise ValueError(f"Shared weights are only supported on CPU, got device '{device}'")
+    if backend not in SHAREABLE_BACKENDS:
+        raise ValueError(f"Backend '{backend}' cannot share weights, expected one of {SHAREABLE_BACKENDS}")
+    import torch.multiprocessing  # registers the shared-memory tensor reductions for multiprocessing pickling
+    from src.model_registry import load_model, load_processor
+
+    torch.multiprocessing.set_sharing_strategy(sharing_strategy)
+    processor = load_processor(model_id)
+    model = load_model(model_id, device, backend)
+    model.share_memory()
+    return processor, model
+
+
+def worker_main(
+    worker_id,
+    queue_path,
+    output_dir,
+    threads=None,
+    lease_size=DIST_LEASE_SIZE,
+    lease_timeout=DIST_LEASE_TIMEOUT,
+    max_attempts=DIST_MAX_ATTEMPTS,
+    poll_interval=DIST_POLL_INTERVAL,
+    do_critique=True,
+    batch_size=DETECTOR_MAX_BATCH_SIZE,
+    render_workers=1,
+    rate_limit_path=VLM_RATE_LIMIT_PATH,
+    weights=None,
+):
+    """
+    One worker process: limits torch threads, loads the detector once (or
+    takes the parent's shared-memory `weights`, see `load_shared_weights`),
+    then leases jobs and runs them through BatchRunner until the queue is drained.
+    Records are appended to `<output_dir>/shards/<worker_id>.jsonl` and
+    rendered images go to `<output_dir>/images`. Also usable directly on
+    other hosts that share the queue (see sctipts/run_distributed.py).
+    """
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # interop pool already started in this process
+
+    from dotenv import load_dotenv
+    from src.batch_runner import BatchRunner
+    from src.model_registry import get_registry
+    from src.pipeline import ObjectDetectionTool
+    from src.vlm_tool import VLMTool
+
+    load_dotenv()
+    work_queue = SQLiteWorkQueue(queue_path, max_attempts=max_attempts)
+    model_id = MODEL_TYPES[DEFAULT_DETECTOR]
+    device = get_device()
+    processor, model = weights if weights is not None else get_registry().get(model_id, device)
+    vlm_tool = VLMTool(api_key=os.getenv("OPENAI_API_KEY"), rate_limit_path=rate_limit_path)
+    tool = ObjectDetectionTool(
+        model_id=model_id,
+        device=device,
+        vlm_tool=vlm_tool,
+        confidence_threshold=CONFIDENCE_THRESHOLD,
+        concept_detection_model=CONCEPT_EXTRACTION_VLM,
+        initial_critique_model=CRITIQUE_VLM,
+        final_critique_model=VALIDATION_VLM,
+        processor=processor,
+        model=model,
+        debug_dir=None,
+    )
+    runner = BatchRunner(
+        tool,
+        output_dir=os.path.join(output_dir, "images"),
+        results_path=shard_path(output_dir, worker_id),
+        do_critique=do_critique,
+        batch_size=batch_size,
+        render_workers=render_workers,
+    )
+
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(lease_timeout / 3):
+            work_queue.heartbeat(worker_id, lease_timeout)
+
+    def on_record(record):
+        if record["status"] == "error":
+            work_queue.fail(record["id"], worker_id, record["error"])
+        else:
+            work_queue.ack(record["id"], record["status"])
+
+    threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True).start()
+    processed = 0
+    try:
+        while True:
+            jobs = work_queue.lease(worker_id, lease_size, lease_timeout)
+            if not jobs:
+                # other workers may still hand jobs back (failure / expired lease)
+                if work_queue.unfinished() == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+            runner.run(jobs, on_record=on_record)
+            processed += len(jobs)
+    finally:
+        stop.set()
+        vlm_tool.close()
+        work_queue.close()
+    logger.info("Worker %s finished after %d job(s)", worker_id, processed)
+    return processed
+
+
+class DistributedRunner:
+    """
+    Runs a queued corpus on `workers` spawned processes of `worker_main` and
+    supervises them: a worker that dies (crash, OOM kill) has its leased jobs
+    requeued at once and is restarted, up to `max_restarts` times in total.
+    All workers share one VLM rate-limit budget through a SQLite file, so
+    adding workers does not just multiply 429s. For several hosts, run one
+    DistributedRunner per host against the same queue and rate-limit file
+    with a distinct `node` name (or replace SQLiteWorkQueue with a broker
+    that has the same methods).
+
+    With `share_weights` (CPU, eager/bf16 backends) the detector is loaded
+    once here and shared read-only with every worker and restart, so N
+    workers cost one copy of the weights plus their activations. Per-process
+    RSS/PSS is sampled while running and reported in the summary.
+    """
+    def __init__(
+        self,
+        queue_path,
+        output_dir,
+        workers=DIST_WORKERS,
+        threads_per_worker=DIST_THREADS_PER_WORKER,
+        node=None,
+        max_restarts=DIST_MAX_RESTARTS,
+        poll_interval=DIST_POLL_INTERVAL,
+        rate_limit_path=VLM_RATE_LIMIT_PATH,
+        share_weights=DIST_SHARE_WEIGHTS,
+        **worker_options,
+    ):
+        self.queue_path = queue_path
+        self.output_dir = output_dir
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads(workers)
+        self.node = node or socket.gethostname()
+        self.max_restarts = max_restarts
+        self.poll_interval = poll_interval
+        self.rate_limit_path = rate_limit_path or os.path.join(output_dir, "vlm_rate_limits.sqlite")
+        self.share_weights = share_weights
+        self.worker_options = worker_options
+        self._weights = None
+        self._context = multiprocessing.get_context("spawn")  # fresh interpreter; no forked CUDA / thread state
+
+    def _load_shared_weights(self):
+        """Shared-memory (processor, model) for the workers, or None when each worker loads its own."""
+        if not self.share_weights:
+            return None
+        device = get_device()
+        if str(device) != "cpu" or DETECTOR_BACKEND not in SHAREABLE_BACKENDS:
+            logger.info("Weights not shared on %s with backend '%s'; each worker loads its own copy", device, DETECTOR_BACKEND)
+            return None
+        started = time.perf_counter()
+        weights = load_shared_weights(MODEL_TYPES[DEFAULT_DETECTOR], device)
+        logger.info("Loaded shared detector weights in %.1fs", time.perf_counter() - started)
+        return weights
+
+    def _spawn(self, worker_id):
+        process = self._context.Process(
+            target=worker_main,
+            name=worker_id,
+            args=(worker_id, self.queue_path, self.output_dir),
+            kwargs={
+                "threads": self.threads_per_worker,
+                "poll_interval": self.poll_interval,
+                "rate_limit_path": self.rate_limit_path,
+                "weights": self._weights,
+                **self.worker_options,
+            },
+        )
+        process.start()
+        return process
+
+    @staticmethod
+    def memory_report(processes):
+        """process_memory() of this (parent) process and every live worker, by name."""
+        report = {"parent": process_memory(os.getpid())}
+        for worker_id, process in processes.items():
+            if process is not None and process.is_alive():
+                report[worker_id] = process_memory(process.pid)
+        return {name: usage for name, usage in report.items() if usage is not None}
+
+    def run(self):
+        """Blocks until the queue is drained (or no worker can be restarted). Returns a summary dict."""
+        work_queue = SQLiteWorkQueue(self.queue_path, max_attempts=self.worker_options.get("max_attempts", DIST_MAX_ATTEMPTS))
+        os.makedirs(os.path.join(self.output_dir, "shards"), exist_ok=True)
+        started = time.perf_counter()
+        done_before = work_queue.counts()["done"]
+        if self._weights is None:
+            self._weights = self._load_shared_weights()
+        processes = {f"{self.node}-w{i}": None for i in range(self.workers)}
+        for worker_id in processes:
+            processes[worker_id] = self._spawn(worker_id)
+        restarts = 0
+        peak_memory, peak_total_pss = {}, 0
+        try:
+            while any(process is not None for process in processes.values()):
+                time.sleep(self.poll_interval)
+                usage = self.memory_report(processes)
+                for name, current in usage.items():
+                    peak = peak_memory.setdefault(name, dict.fromkeys(current, 0))
+                    for key, value in current.items():
+                        peak[key] = max(peak[key], value)
+                peak_total_pss = max(peak_total_pss, sum(current["pss"] for current in usage.values()))
+                for worker_id, process in processes.items():
+                    if process is None or process.is_alive():
+                        continue
+                    process.join()
+                    if process.exitcode == 0:
+                        processes[worker_id] = None
+                        continue
+                    requeued = work_queue.release_worker(worker_id, error=f"worker {worker_id} exited with code {process.exitcode}")
+                    logger.warning("Worker %s exited with code %s; %d job(s) requeued", worker_id, process.exitcode, requeued)
+                    if restarts < self.max_restarts and work_queue.unfinished():
+                        restarts += 1
+                        processes[worker_id] = self._spawn(worker_id)
+                    else:
+                        processes[worker_id] = None
+        except BaseException:
+            for worker_id, process in processes.items():
+                if process is not None and process.is_alive():
+                    process.terminate()
+                    process.join()
+                    work_queue.release_worker(worker_id, error="runner interrupted")
+            raise
+        finally:
+            counts = work_queue.counts()
+            work_queue.close()
+
+        wall_time = time.perf_counter() - started
+        completed = counts["done"] - done_before
+        return {
+            **counts,
+            "completed": completed,
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "restarts": restarts,
+            "shared_weights": self._weights is not None,
+            "peak_memory": peak_memory,
+            "peak_total_pss": peak_total_pss,
+            "wall_time_s": wall_time,
+            "jobs_per_s": completed / wall_time if wall_time > 0 else 0.0,
+        }
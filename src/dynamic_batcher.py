@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class DynamicBatcher:
+    """
+    Collects detector calls from concurrent requests into one forward pass.
+    The first call opens a window of `window` seconds (or until
+    `max_batch_size` calls are waiting); everything collected is sent through
+    `tool.detect_batch` and each caller gets its own Detections back.
+    """
+    def __init__(self, tool, max_batch_size=8, window=0.01):
+        self.tool = tool
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._counters = {"calls": 0, "batches": 0, "failed_batches": 0}
+        self._thread = threading.Thread(target=self._loop, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image, query_list):
+        """Queues one detection; returns a Future resolving to Detections."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DynamicBatcher is closed")
+            self._counters["calls"] += 1
+            self._queue.put((image, list(query_list), future))
+        return future
+
+    def detect(self, image, query_list):
+        """Blocking helper with the same result as `tool.detect`."""
+        return self.submit(image, query_list).result()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # finish this batch, stop on the next collect
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.tool.detect_batch([(image, queries) for image, queries, _ in batch], max_batch_size=self.max_batch_size)
+            except Exception as e:
+                with self._lock:
+                    self._counters["failed_batches"] += 1
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self._counters["batches"] += 1
+            for (_, _, future), detections in zip(batch, results):
+                future.set_result(detections)
+
+    def stats(self):
+        with self._lock:
+            batches = self._counters["batches"] + self._counters["failed_batches"]
+            return {
+                **self._counters,
+                "queued": self._queue.qsize(),
+                "avg_batch_size": self._counters["calls"] / batches if batches else 0.0,
+            }
+
+    def close(self, wait=True):
+        """Stops accepting calls; already queued calls are still served."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+
+class Coalescer:
+    """
+    Runs identical in-flight calls once: while a call for `key` is running,
+    later callers with the same key wait for and share its result.
+    `run` returns `(result, coalesced)`, where `coalesced` is True for callers
+    that were served by another caller's run.
+    """
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                future.set_running_or_notify_cancel()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"inflight": len(self._inflight), "coalesced": self.coalesced}
@@ -0,0 +1,88 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+
+def image_digest(img):
+    """Content hash of a decoded PIL image (pixels + size + mode)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.mode}:{img.size[0]}x{img.size[1]}".encode("utf-8"))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def tensor_nbytes(obj):
+    """Total bytes held by the tensors inside (nested) lists/tuples/dicts."""
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):  # torch.Tensor, without importing torch
+        return obj.element_size() * obj.nelement()
+    if isinstance(obj, dict):
+        return sum(tensor_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(tensor_nbytes(v) for v in obj)
+    return 0
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache bounded by the total byte size of its values.
+    The least recently used entries are evicted until the new entry fits.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return  # 캐시 전체보다 큰 항목은 저장하지 않음
+            while self._entries and self._total_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_IMAGE_CACHE = None
+_IMAGE_CACHE_LOCK = threading.Lock()
+
+
+def get_image_cache():
+    """Process-wide image encoding cache shared by every ObjectDetectionTool."""
+    global _IMAGE_CACHE
+    with _IMAGE_CACHE_LOCK:
+        if _IMAGE_CACHE is None:
+            from src.config import IMAGE_CACHE_MAX_BYTES
+            _IMAGE_CACHE = ByteLRUCache(IMAGE_CACHE_MAX_BYTES)
+        return _IMAGE_CACHE
@@ -0,0 +1,147 @@
+import base64
+import io
+import math
+import os
+import threading
+
+from PIL import Image
+
+from src.utils import load_image
+from src.image_cache import ByteLRUCache, image_digest
+from src.config import (
+    VLM_IMAGE_GEOMETRY,
+    VLM_IMAGE_DETAIL,
+    VLM_JPEG_QUALITY,
+    VLM_MAX_TILES,
+    VLM_PAYLOAD_CACHE_MAX_BYTES,
+)
+
+
+def _geometry(model):
+    return VLM_IMAGE_GEOMETRY.get(model, VLM_IMAGE_GEOMETRY["default"])
+
+
+def server_resize(width, height, geometry, detail="high"):
+    """Size the API itself resizes an image to before tiling (no upscaling)."""
+    if detail == "low":
+        scale = min(1.0, geometry["low_side"] / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    scale = min(1.0, geometry["max_side"] / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, geometry["short_side"] / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def image_tokens(width, height, geometry, detail="high"):
+    """Image input tokens billed for an image of this size."""
+    if detail == "low":
+        return geometry["base_tokens"]
+    width, height = server_resize(width, height, geometry, detail)
+    tiles = math.ceil(width / geometry["tile"]) * math.ceil(height / geometry["tile"])
+    return geometry["base_tokens"] + geometry["tile_tokens"] * tiles
+
+
+def target_size(width, height, geometry, detail="high", max_tiles=None):
+    """
+    Upload size for an image: the geometry the model actually uses, further
+    shrunk when `max_tiles` caps the number of high-detail tiles.
+    """
+    width, height = server_resize(width, height, geometry, detail)
+    if detail == "high" and max_tiles:
+        tile = geometry["tile"]
+        while math.ceil(width / tile) * math.ceil(height / tile) > max_tiles and min(width, height) > tile // 2:
+            width, height = max(1, int(width * 0.9)), max(1, int(height * 0.9))
+    return width, height
+
+
+class PreparedImage:
+    """A VLM-ready image payload plus the numbers needed to report savings."""
+    def __init__(self, base64_data, detail, original_size, prepared_size, payload_bytes, original_bytes, tokens, original_tokens):
+        self.base64_data = base64_data
+        self.detail = detail
+        self.original_size = original_size
+        self.prepared_size = prepared_size
+        self.payload_bytes = payload_bytes
+        self.original_bytes = original_bytes
+        self.tokens = tokens
+        self.original_tokens = original_tokens
+
+    def content(self):
+        """`image_url` message part for the chat completions API."""
+        return {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{self.base64_data}", "detail": self.detail},
+        }
+
+
+class ImagePreparer:
+    """
+    Resizes images to the tile geometry of the target model and re-encodes
+    them as JPEG before upload. Payloads are cached per (image, model
+    geometry) so the critique and validation calls on the same labeled image
+    encode it only once. Detector boxes are unaffected: only the uploaded
+    copy is resized.
+    """
+    def __init__(self, detail=VLM_IMAGE_DETAIL, quality=VLM_JPEG_QUALITY, max_tiles=VLM_MAX_TILES, cache_max_bytes=VLM_PAYLOAD_CACHE_MAX_BYTES):
+        self.detail = detail
+        self.quality = quality
+        self.max_tiles = max_tiles
+        self.cache = ByteLRUCache(cache_max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {
+            "images": 0, "cache_hits": 0,
+            "payload_bytes": 0, "original_bytes": 0,
+            "tokens": 0, "original_tokens": 0,
+        }
+
+    def prepare(self, image, model):
+        img = load_image(image)
+        geometry = _geometry(model)
+        key = (image_digest(img), self.detail, self.quality, self.max_tiles, tuple(sorted(geometry.items())))
+        prepared = self.cache.get(key)
+        cache_hit = prepared is not None
+        if not cache_hit:
+            prepared = self._prepare(image, img, geometry)
+            self.cache.put(key, prepared, nbytes=len(prepared.base64_data))
+
+        with self._lock:
+            self._stats["images"] += 1
+            self._stats["cache_hits"] += int(cache_hit)
+            self._stats["payload_bytes"] += prepared.payload_bytes
+            self._stats["original_bytes"] += prepared.original_bytes
+            self._stats["tokens"] += prepared.tokens
+            self._stats["original_tokens"] += prepared.original_tokens
+        return prepared
+
+    def _prepare(self, image, img, geometry):
+        size = target_size(img.width, img.height, geometry, self.detail, self.max_tiles)
+        resized = img if size == img.size else img.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, format="JPEG", quality=self.quality)
+        payload = buffer.getvalue()
+
+        # what the old path would have uploaded: the file bytes, or a full-size JPEG (q=95)
+        if isinstance(image, str):
+            original_bytes = os.path.getsize(image)
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            original_bytes = len(image)
+        else:
+            original_bytes = img.width * img.height * 3 // 10  # ~ JPEG q95 압축률 근사
+        return PreparedImage(
+            base64_data=base64.b64encode(payload).decode("utf-8"),
+            detail=self.detail,
+            original_size=img.size,
+            prepared_size=size,
+            payload_bytes=len(payload),
+            original_bytes=original_bytes,
+            tokens=image_tokens(size[0], size[1], geometry, self.detail),
+            original_tokens=image_tokens(img.width, img.height, geometry, "high"),
+        )
+
+    def stats(self):
+        """Bytes/tokens sent vs. what full-resolution "high" uploads would have cost."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["bytes_saved"] = stats["original_bytes"] - stats["payload_bytes"]
+        stats["tokens_saved"] = stats["original_tokens"] - stats["tokens"]
+        return stats
@@ -0,0 +1,166 @@
+import bisect
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; covers sub-ms drawing up to multi-second VLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + list(extra or [])
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels (Prometheus semantics)."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name + "_total", _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (Prometheus semantics)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        samples = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append((self.name + "_bucket", _format_labels(self.labelnames, key, [("le", repr(float(bound)))]), cumulative))
+            samples.append((self.name + "_bucket", _format_labels(self.labelnames, key, [("le", "+Inf")]), state[-1]))
+            samples.append((self.name + "_sum", _format_labels(self.labelnames, key), state[-2]))
+            samples.append((self.name + "_count", _format_labels(self.labelnames, key), state[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics, rendered in the Prometheus text format."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric '{name}' is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_REGISTRY = MetricsRegistry()
+
+
+def get_metrics():
+    return _REGISTRY
+
+
+# pipeline metrics shared by the pipeline, VLM tool and tracing modules
+STAGE_SECONDS = _REGISTRY.histogram("pipeline_stage_seconds", "Wall time of each pipeline stage.", ["stage"])
+RUNS = _REGISTRY.counter("pipeline_runs", "Pipeline runs by outcome.", ["outcome"])
+CRITIQUES = _REGISTRY.counter("pipeline_critiques", "Critique calls by outcome (refined, kept, failed).", ["outcome"])
+DETECTOR_FORWARD_SECONDS = _REGISTRY.histogram("detector_forward_seconds", "Detector forward pass time (image encoding + heads).", ["model", "backend"])
+DETECTOR_BOXES = _REGISTRY.histogram("detector_boxes", "Boxes kept per detector call.", ["model"], buckets=COUNT_BUCKETS)
+CASCADE_CONCEPTS = _REGISTRY.counter("detector_cascade_concepts", "Cascade routing of each concept (absent, accepted, routed).", ["route"])
+VLM_REQUEST_SECONDS = _REGISTRY.histogram("vlm_request_seconds", "Latency of one VLM HTTP request.", ["model", "outcome"])
+VLM_EVENTS = _REGISTRY.counter("vlm_events", "VLM requests, retries, errors and cache hits/misses.", ["model", "event"])
+VLM_TOKENS = _REGISTRY.counter("vlm_tokens", "VLM tokens used.", ["model", "kind"])
+
+
+def _make_handler(registry):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=None):
+    """Serves `GET /metrics` from a daemon thread; returns the HTTP server."""
+    httpd = ThreadingHTTPServer((host, port), _make_handler(registry or _REGISTRY))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-server", daemon=True).start()
+    return httpd
@@ -0,0 +1,154 @@
+import argparse
+import json
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockVLMConfig:
+    """
+    Behaviour of the mock chat-completions endpoint.
+    `latency`/`jitter` are seconds; `refine_rate` is the probability that the
+    critique call proposes a different query list (forcing a second detector
+    pass); `error_rate` is the probability of answering 429 instead.
+    """
+    def __init__(self, latency=0.5, jitter=0.1, concepts="person, dog", refined="object", refine_rate=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.concepts = concepts
+        self.refined = refined
+        self.refine_rate = refine_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def roll(self):
+        with self.lock:
+            self.requests += 1
+            return self.random.random(), self.random.random(), self.random.uniform(-self.jitter, self.jitter)
+
+
+def _canned_content(config, body, refine_roll):
+    """Picks the canned answer from the system prompt of the request."""
+    system = next((m["content"] for m in body.get("messages", []) if m.get("role") == "system"), "")
+    if "refined_list" in system:
+        refined = config.refined if refine_roll < config.refine_rate else config.concepts
+        return json.dumps({"reasoning": "mock critique", "refined_list": refined})
+    if "valid_numbers" in system:
+        return json.dumps({"reasoning": "mock validation", "valid_numbers": {"1": config.concepts.split(",")[0].strip()}})
+    return config.concepts
+
+
+def _make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            error_roll, refine_roll, jitter = config.roll()
+            time.sleep(max(0.0, config.latency + jitter))
+
+            if error_roll < config.error_rate:
+                payload = {"error": {"message": "mock rate limit", "type": "rate_limit_error", "code": "rate_limit_exceeded"}}
+                self._send(429, payload, {"retry-after": "0.1"})
+                return
+
+            content = _canned_content(config, body, refine_roll)
+            prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+            completion_tokens = max(1, len(content) // 4)
+            self._send(200, {
+                "id": f"chatcmpl-mock-{config.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+class MockVLMServer:
+    """
+    Local OpenAI-compatible `/v1/chat/completions` server with configurable
+    latency and canned JSON, for offline benchmarks and retry tests.
+    Use `base_url` as VLMTool's base_url.
+    """
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config if config is not None else MockVLMConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.config))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-vlm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI chat-completions server.")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--concepts", type=str, default="person, dog")
+    parser.add_argument("--refine_rate", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = MockVLMConfig(
+        latency=args.latency, jitter=args.jitter, concepts=args.concepts,
+        refine_rate=args.refine_rate, error_rate=args.error_rate,
+    )
+    server = MockVLMServer(config, port=args.port)
+    print(f"Mock VLM server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
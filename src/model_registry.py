@@ -0,0 +1,107 @@
+import threading
+import torch
+
+from PIL import Image
+from src.config import INV_MODEL_TYPES, DETECTOR_BACKEND, MODEL_CACHE_DIR, MODEL_OFFLINE, MODEL_USE_SAFETENSORS
+from src.backends import apply_backend, inference_context
+
+
+def _hub_options():
+    return {"cache_dir": MODEL_CACHE_DIR, "local_files_only": MODEL_OFFLINE}
+
+
+def load_processor(model_id):
+    """Processor for `model_id` from the local HF cache (no network with MODEL_OFFLINE)."""
+    from transformers import AutoProcessor  # transformers is only imported once a model is needed
+    return AutoProcessor.from_pretrained(model_id, **_hub_options())
+
+
+def load_model(model_id, device, backend=DETECTOR_BACKEND):
+    """
+    Detector weights on `device`, converted to `backend`. safetensors
+    checkpoints are memory-mapped from the cache instead of being read
+    into an intermediate copy; with MODEL_OFFLINE nothing is downloaded
+    (see `prefetch_model`).
+    """
+    from transformers import AutoModelForZeroShotObjectDetection
+    model = AutoModelForZeroShotObjectDetection.from_pretrained(
+        model_id, use_safetensors=MODEL_USE_SAFETENSORS, **_hub_options()
+    ).to(device)
+    return apply_backend(model, model_id, backend, device)
+
+
+def prefetch_model(model_id):
+    """
+    Downloads the config / tokenizer / weight files of `model_id` into the cache
+    so later loads can run offline. Only safetensors weights are fetched when
+    the repo has them. Returns the local snapshot directory.
+    """
+    from huggingface_hub import list_repo_files, snapshot_download
+    files = list_repo_files(model_id)
+    ignore = ["*.h5", "*.msgpack", "*.onnx", "*.ot", "*.tflite"]
+    if any(name.endswith(".safetensors") for name in files):
+        ignore.append("*.bin")
+    return snapshot_download(model_id, cache_dir=MODEL_CACHE_DIR, ignore_patterns=ignore)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of detector (processor, model) pairs.
+    Entries are keyed by (model_id, device, backend) and loaded at most once,
+    so every request in the process shares the same weights.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id, device, backend=DETECTOR_BACKEND):
+        """Returns (processor, model) for `model_id` on `device`, loading it on first use."""
+        key = (model_id, str(device), backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 같은 모델을 동시에 두 번 로드하지 않도록 key 단위로 잠금
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = (load_processor(model_id), load_model(model_id, device, backend))
+                with self._lock:
+                    self._entries[key] = entry
+        return entry
+
+    def warm_up(self, model_id, device, backend=DETECTOR_BACKEND):
+        """
+        Loads the model and runs one dummy forward pass so the first
+        real request does not pay lazy initialization costs.
+        """
+        processor, model = self.get(model_id, device, backend)
+        if INV_MODEL_TYPES[model_id] == "owlvit":
+            text = ["An image of object"]
+        else:
+            text = "object."
+        img = Image.new("RGB", (64, 64), color=(255, 255, 255))
+        inputs = processor(text=text, images=img, return_tensors="pt", padding=True).to(device)
+        with torch.no_grad(), inference_context(backend, device):
+            model(**inputs)
+        return processor, model
+
+    def loaded(self):
+        """Returns the list of (model_id, device, backend) keys currently resident."""
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._key_locks.clear()
+
+
+_REGISTRY = ModelRegistry()
+
+
+def get_registry():
+    return _REGISTRY
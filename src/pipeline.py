@@ -1,10 +1,29 @@
+import contextlib
 import json
+import logging
+import os
+import sqlite3
+import time
 import torch
 
-from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
-from PIL import Image
-from src.utils import encode_image, draw_arrows_and_numbers, draw_bounding_boxes
-from src.config import INV_MODEL_TYPES
+from src.utils import draw_arrows_and_numbers, draw_bounding_boxes, load_image
+from src.config import INV_MODEL_TYPES, DETECTOR_MAX_BATCH_SIZE, DETECTOR_MAX_BATCH_PIXELS, INTERMEDIATE_DEBUG_DIR, DETECTOR_BACKEND, SPECULATIVE_VALIDATION, TILING_ENABLED, CASCADE_ENABLED
+from src.backends import inference_context, install_backbone_memo
+from src.tracing import RunReport, stage, start_trace
+from src.metrics import RUNS, CRITIQUES, DETECTOR_FORWARD_SECONDS, DETECTOR_BOXES
+from src.vlm_tool import VLMError
+from src.policy import StagePolicy
+from src.postprocess import normalized_cxcywh_to_xyxy, postprocess
+from src.text_cache import get_text_cache
+from src.image_cache import get_image_cache, image_digest, tensor_nbytes
+from src.model_registry import load_model, load_processor
+from src.tiling import TiledDetector
+from src.result import DetectionResult
+from src.result_store import get_result_store
+from src.cascade import CascadeDetector
+
+logger = logging.getLogger(__name__)
+
 
 class ObjectDetectionTool:
     """ Agentic object detection pipeline"""
@@ -13,89 +32,380 @@ class ObjectDetectionTool:
     plus an optional 'critique' (refinement) step with a VLM
     to yield a refined set of objects to detect.
     """
-    def __init__(self, model_id, device, vlm_tool, confidence_threshold=0.2, concept_detection_model="gpt-4.1", initial_critique_model="gpt-4o", final_critique_model="gpt-4.1"):
+    def __init__(self, model_id, device, vlm_tool, confidence_threshold=0.2, concept_detection_model="gpt-4.1", initial_critique_model="gpt-4o", final_critique_model="gpt-4.1", processor=None, model=None, image_cache=None, text_cache=None, debug_dir=INTERMEDIATE_DEBUG_DIR, backend=DETECTOR_BACKEND, policy=None, speculative=SPECULATIVE_VALIDATION, batcher=None, tiler=None, cascade=None, result_store=None):
         self.model_id = model_id # owlvit or groungding dino
-        self.processor = AutoProcessor.from_pretrained(model_id)
-        self.model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(device)
+        # processor/model can be injected (e.g. from ModelRegistry) to share weights across tools
+        self.processor = processor if processor is not None else load_processor(model_id)
+        self.model = model if model is not None else load_model(model_id, device, backend)
+        self.backend = backend
         self.device = device
         self.vlm_tool = vlm_tool  # The LLMTool that can handle vision (GPT-4V) or similar
         self.confidence_threshold = confidence_threshold
         self.concept_detection_model = concept_detection_model
         self.initial_critique_model = initial_critique_model
         self.final_critique_model = final_critique_model
-        
-        # We store bounding boxes for potential usage later (e.g., for SAM).
-        self.last_detection_bboxes = []
-        self.last_filtered_objects = []
 
-    def _run_detector(self, image_path, query_list):
+        # decides whether critique/validation call the VLM, and with which model
+        self.policy = policy if policy is not None else StagePolicy()
+        # start validation in parallel with the critique (costs a wasted call when the critique refines)
+        self.speculative = speculative
+        # DynamicBatcher shared by concurrent requests (src/server.py); None runs the detector inline
+        self.batcher = batcher
+        # sliced inference for very large images (src/tiling.py); tiler=False disables it
+        if tiler is None:
+            tiler = TiledDetector(self) if TILING_ENABLED else None
+        self.tiler = tiler or None
+        # intermediate (arrow-labeled) images are only written to disk when a debug dir is set
+        self.debug_dir = debug_dir
+
+        # image-side encodings are cached and reused across query sets (e.g. after critique)
+        self.image_cache = image_cache if image_cache is not None else get_image_cache()
+        # text-query embeddings (OWL-ViT) are cached persistently per concept
+        self.text_cache = text_cache if text_cache is not None else get_text_cache()
+        # every run is persisted here and repeat requests are answered from it (src/result_store.py)
+        self.result_store = result_store if result_store is not None else get_result_store()
+        if INV_MODEL_TYPES[self.model_id] == "grounding_dino":
+            install_backbone_memo(self.model)
+        # OWL-ViT pre-screen in front of this detector (src/cascade.py); cascade=False disables it
+        if cascade is None:
+            cascade = CascadeDetector.for_tool(self) if CASCADE_ENABLED else None
+        self.cascade = cascade or None
+        # Configuration only from here on: every run keeps its state in locals and returns
+        # a DetectionResult, so one tool can serve concurrent calls on one loaded model.
+
+    def _inference(self):
+        """no_grad plus the backend's forward context (e.g. bf16 autocast)."""
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.no_grad())
+        stack.enter_context(inference_context(self.backend, self.device))
+        return stack
+
+    def _encode_image(self, img, use_cache=True):
         """
-        Low-level routine to run the detection model on `query_list`.
-        Returns: (detected_objects_final, labeled_image_path)
-        Where `detected_objects_final` = [(num, label, [x1,y1,x2,y2]), ...].
+        Image-side half of the detector: runs the image processor and the
+        vision backbone once per image and caches the result (LRU by bytes).
+        OWL-ViT: patch features + predicted boxes (boxes do not depend on text).
+        GroundingDINO: pixel tensors + backbone features (reused via MemoizedBackbone).
+        `use_cache=False` skips hashing/caching for one-off images such as video frames.
+        """
+        key = None
+        if use_cache:
+            key = (self.model_id, str(self.device), self.backend, image_digest(img))
+            encoding = self.image_cache.get(key)
+            if encoding is not None:
+                return encoding
+
+        image_inputs = self.processor.image_processor(images=img, return_tensors="pt").to(self.device)
+        with self._inference():
+            if INV_MODEL_TYPES[self.model_id] == "owlvit":
+                feature_map = self.model.image_embedder(pixel_values=image_inputs["pixel_values"])[0]
+                batch_size, num_patches_height, num_patches_width, hidden_dim = feature_map.shape
+                image_feats = torch.reshape(feature_map, (batch_size, num_patches_height * num_patches_width, hidden_dim))
+                pred_boxes = self.model.box_predictor(image_feats, feature_map)
+                encoding = {"image_feats": image_feats, "pred_boxes": pred_boxes}
+            elif INV_MODEL_TYPES[self.model_id] == "grounding_dino":
+                pixel_values = image_inputs["pixel_values"]
+                pixel_mask = image_inputs["pixel_mask"]
+                # fills the MemoizedBackbone entry tied to this pixel_values tensor
+                backbone_outputs = self.model.model.backbone(pixel_values, pixel_mask)
+                encoding = {"pixel_values": pixel_values, "pixel_mask": pixel_mask, "backbone": backbone_outputs}
+            else:
+                raise NotImplementedError("Model not supported")
+
+        if key is not None:
+            self.image_cache.put(key, encoding, nbytes=tensor_nbytes(encoding))
+        return encoding
+
+    def _encode_owlvit_queries(self, query_list):
+        """
+        OWL-ViT text embeddings for `query_list`, shape [num_queries, dim].
+        Only prompts missing from the text embedding cache are tokenized and encoded.
+        """
+        formatted_queries = [f"An image of {q}" for q in query_list]
+        cached = {}
+        if self.text_cache is not None:
+            cached = self.text_cache.get_many(self.model_id, self.backend, formatted_queries)
+        missing = list(dict.fromkeys(q for q in formatted_queries if q not in cached))
+        if missing:
+            text_inputs = self.processor.tokenizer(
+                missing, padding=True, truncation=True, return_tensors="pt"
+            ).to(self.device)
+            embeddings = self.model.owlvit.get_text_features(
+                input_ids=text_inputs["input_ids"], attention_mask=text_inputs["attention_mask"]
+            )
+            encoded = dict(zip(missing, embeddings))
+            if self.text_cache is not None:
+                self.text_cache.put_many(self.model_id, self.backend, encoded)
+            cached.update(encoded)
+        return torch.stack([cached[q].to(self.device, torch.float32) for q in formatted_queries])
+
+    def _query_chunks(self, query_list):
+        """
+        De-duplicated queries split into prompts that fit the text encoder.
+        GroundingDINO reads all concepts as one "a. b. c." prompt capped at
+        `max_text_len` tokens, so long lists are packed greedily into several
+        prompts instead of being truncated. OWL-ViT encodes each query
+        separately and needs no chunking.
+        """
+        queries = list(dict.fromkeys(query_list))
+        if INV_MODEL_TYPES[self.model_id] != "grounding_dino" or not queries:
+            return [queries]
+        limit = getattr(self.model.config, "max_text_len", 256) - 2  # [CLS] ... [SEP]
+        lengths = [len(ids) for ids in self.processor.tokenizer([f"{q}." for q in queries], add_special_tokens=False)["input_ids"]]
+        chunks, current, used = [], [], 0
+        for query, length in zip(queries, lengths):
+            if current and used + length > limit:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(query)
+            used += length
+        chunks.append(current)
+        return chunks
+
+    def _detect_with_encoding(self, encoding, query_list, image_size):
+        """
+        Text-side half of the detector: scores `query_list` against a cached image encoding.
+        Returns (scores, boxes, labels) before thresholding/NMS: score and pixel
+        xyxy box tensors, and the matched query string per box.
         """
-        from PIL import ImageFont
-        
-        # Format queries for the model
         if INV_MODEL_TYPES[self.model_id] == "owlvit":
-            formatted_queries = [f"An image of {q}" for q in query_list]
+            with self._inference():
+                query_embeds = self._encode_owlvit_queries(query_list)[None]
+                query_mask = torch.ones(query_embeds.shape[:2], dtype=torch.bool, device=query_embeds.device)
+                pred_logits, _ = self.model.class_predictor(encoding["image_feats"], query_embeds, query_mask)
+
+            logits = torch.max(pred_logits[0], dim=-1)
+            scores = torch.sigmoid(logits.values)
+            labels = [query_list[i] for i in logits.indices.tolist()]
+            boxes = normalized_cxcywh_to_xyxy(encoding["pred_boxes"][0], image_size)
         elif INV_MODEL_TYPES[self.model_id] == "grounding_dino":
-            formatted_queries = " ".join([f"{q}." for q in list(set(query_list))])
+            # one decoder pass per prompt chunk against the same image encoding;
+            # duplicates across chunks are merged by the label-aware NMS in _postprocess
+            all_scores, all_boxes, labels = [], [], []
+            for chunk in self._query_chunks(query_list):
+                formatted_queries = " ".join([f"{q}." for q in chunk])
+                text_inputs = self.processor.tokenizer(
+                    formatted_queries, padding=True, truncation=True, return_tensors="pt"
+                ).to(self.device)
+                with self._inference():
+                    # backbone is served from the memo; only text encoder + fusion + decoder run
+                    outputs = self.model(
+                        pixel_values=encoding["pixel_values"],
+                        pixel_mask=encoding["pixel_mask"],
+                        **text_inputs,
+                    )
+                results = self.processor.post_process_grounded_object_detection(
+                    outputs, 
+                    text_inputs.input_ids,
+                    target_sizes=[image_size[::-1]]
+                )
+                all_scores.append(results[0]["scores"])
+                all_boxes.append(results[0]["boxes"])
+                labels += list(results[0]["text_labels"])
+            scores = torch.cat(all_scores)
+            boxes = torch.cat(all_boxes)
         else:
             raise NotImplementedError("Model not supported")
+        return scores, boxes, labels
+
+    def _postprocess(self, scores, boxes, labels, image_size):
+        """Threshold + NMS + top-k (src/postprocess.py); returns Detections numbered from 1 by score."""
+        return postprocess(scores, boxes, labels, self.confidence_threshold, image_size=image_size)
+
+    def _processed_size(self, image_size):
+        """(height, width) the image processor will resize an image of `image_size` (w, h) to."""
+        size = self.processor.image_processor.size
+        if "height" in size:
+            return size["height"], size["width"]
+        w, h = image_size
+        scale = min(size["shortest_edge"] / min(w, h), size["longest_edge"] / max(w, h))
+        return round(h * scale), round(w * scale)
+
+    def _plan_batches(self, images, max_batch_size, max_batch_pixels):
+        """
+        Groups image indices into forward passes. Images are bucketed by their
+        processed size (rounded to 64 px) so padding inside a batch stays small,
+        and each batch respects `max_batch_size` and the padded pixel ceiling.
+        """
+        buckets = {}
+        for i, img in enumerate(images):
+            h, w = self._processed_size(img.size)
+            buckets.setdefault((-(-h // 64), -(-w // 64)), []).append(i)
+
+        batches = []
+        for indices in buckets.values():
+            batch, max_h, max_w = [], 0, 0
+            for i in indices:
+                h, w = self._processed_size(images[i].size)
+                new_h, new_w = max(max_h, h), max(max_w, w)
+                if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * new_h * new_w > max_batch_pixels):
+                    batches.append(batch)
+                    batch, new_h, new_w = [], h, w
+                batch.append(i)
+                max_h, max_w = new_h, new_w
+            if batch:
+                batches.append(batch)
+        return batches
+
+    def _detect_batch_forward(self, batch_images, batch_queries):
+        """One batched forward pass. Returns [(scores, boxes, labels), ...] per image."""
+        if not any(batch_queries):
+            return [([], [], []) for _ in batch_queries]
+
+        image_inputs = self.processor.image_processor(images=batch_images, return_tensors="pt").to(self.device)
+        outputs_per_image = []
 
-        # Load image
-        img = Image.open(image_path).convert("RGB")
-        inputs = self.processor(
-            text=formatted_queries, 
-            images=img, 
-            return_tensors="pt", 
-            padding=True, 
-            truncation=True
-        ).to(self.device)
-
-        # PyTorch gradient 계산 비활성화
-        self.model.eval()
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        
-        # Post-process bounding boxes
-        if INV_MODEL_TYPES[self.model_id] == "grounding_dino":
+        if INV_MODEL_TYPES[self.model_id] == "owlvit":
+            with self._inference():
+                feature_map = self.model.image_embedder(pixel_values=image_inputs["pixel_values"])[0]
+                batch_size, num_patches_height, num_patches_width, hidden_dim = feature_map.shape
+                image_feats = torch.reshape(feature_map, (batch_size, num_patches_height * num_patches_width, hidden_dim))
+                pred_boxes = self.model.box_predictor(image_feats, feature_map)
+
+                # encode each distinct query once for the whole batch
+                vocab = sorted(set(q for queries in batch_queries for q in queries))
+                vocab_index = {q: i for i, q in enumerate(vocab)}
+                text_embeds = self._encode_owlvit_queries(vocab)
+                max_queries = max(len(queries) for queries in batch_queries)
+                query_embeds = torch.zeros((batch_size, max_queries, text_embeds.shape[-1]), device=feature_map.device)
+                query_mask = torch.zeros((batch_size, max_queries), dtype=torch.bool, device=feature_map.device)
+                for i, queries in enumerate(batch_queries):
+                    if queries:
+                        query_embeds[i, :len(queries)] = text_embeds[[vocab_index[q] for q in queries]]
+                        query_mask[i, :len(queries)] = True
+                pred_logits, _ = self.model.class_predictor(image_feats, query_embeds, query_mask)
+
+            for i, queries in enumerate(batch_queries):
+                if not queries:
+                    outputs_per_image.append(([], [], []))
+                    continue
+                logits = torch.max(pred_logits[i, :, :len(queries)], dim=-1)
+                scores = torch.sigmoid(logits.values)
+                labels = [queries[j] for j in logits.indices.tolist()]
+                boxes = normalized_cxcywh_to_xyxy(pred_boxes[i], batch_images[i].size)
+                outputs_per_image.append((scores, boxes, labels))
+        elif INV_MODEL_TYPES[self.model_id] == "grounding_dino":
+            texts = [" ".join([f"{q}." for q in dict.fromkeys(queries)]) for queries in batch_queries]
+            text_inputs = self.processor.tokenizer(
+                texts, padding=True, truncation=True, return_tensors="pt"
+            ).to(self.device)
+            with self._inference():
+                outputs = self.model(
+                    pixel_values=image_inputs["pixel_values"],
+                    pixel_mask=image_inputs["pixel_mask"],
+                    **text_inputs,
+                )
             results = self.processor.post_process_grounded_object_detection(
-                outputs, 
-                inputs.input_ids,
-                target_sizes=[img.size[::-1]]
+                outputs,
+                text_inputs.input_ids,
+                target_sizes=[img.size[::-1] for img in batch_images]
+            )
+            for result in results:
+                outputs_per_image.append((result["scores"], result["boxes"], result["text_labels"]))
+        else:
+            raise NotImplementedError("Model not supported")
+        return outputs_per_image
+
+    def detect_batch(self, items, max_batch_size=DETECTOR_MAX_BATCH_SIZE, max_batch_pixels=DETECTOR_MAX_BATCH_PIXELS):
+        """
+        Batched detection for offline jobs over many images.
+        `items` = [(image, query_list), ...] where image is a path, PIL image or ndarray.
+        Returns one Detections (iterates as `(num, label, [x1,y1,x2,y2])`) per item, in input order.
+        """
+        images = [load_image(image) for image, _ in items]
+        results = [None] * len(items)
+        # cascades, concept lists too long for one prompt and images large enough to tile take the single-image path
+        batchable = []
+        for i, (_, query_list) in enumerate(items):
+            if self.cascade is not None or len(self._query_chunks(query_list)) > 1 or (self.tiler is not None and self.tiler.should_tile(images[i])):
+                results[i] = self.detect(images[i], query_list)
+            else:
+                batchable.append(i)
+        for batch in self._plan_batches([images[i] for i in batchable], max_batch_size, max_batch_pixels):
+            batch = [batchable[j] for j in batch]
+            batch_outputs = self._detect_batch_forward(
+                [images[i] for i in batch],
+                [list(items[i][1]) for i in batch],
             )
-            boxes = results[0]["boxes"]
-            scores = results[0]["scores"]
-            labels = results[0]["text_labels"]
-        elif INV_MODEL_TYPES[self.model_id] == "owlvit":
-            logits = torch.max(outputs["logits"][0], dim=-1)
-            scores = torch.sigmoid(logits.values).cpu().numpy()
-            labels = logits.indices.cpu().numpy()
-            boxes = outputs["pred_boxes"][0].cpu().numpy()
+            for i, (scores, boxes, labels) in zip(batch, batch_outputs):
+                results[i] = self._postprocess(scores, boxes, labels, images[i].size)
+        return results
+
+    def _debug_path(self, image, img, run_id, detector_pass):
+        """
+        Where to write the intermediate image of one detector pass, or None when
+        the debug sink is off. The run id keeps concurrent runs on inputs with
+        the same name (e.g. a shared upload temp file) from overwriting each other.
+        """
+        if self.debug_dir is None:
+            return None
+        if isinstance(image, str):
+            name_part = os.path.splitext(os.path.basename(image))[0]
         else:
-            raise NotImplementedError("Model not supported")            
+            name_part = image_digest(img)[:12]
+        return os.path.join(self.debug_dir, f"{name_part}_{run_id}_{detector_pass}_intermediate.jpg")
 
-        detected_objects_final = []
-        idx = 1
-        for score, box, label in zip(scores, boxes, labels):
-            if score < self.confidence_threshold:
-                continue
-            detected_objects_final.append((idx, label, box.tolist()))
-            idx += 1
+    def detect(self, image, query_list, use_cache=True):
+        """
+        Detector only (no drawing, no VLM): returns Detections, which iterates
+        as `[(num, label, [x1,y1,x2,y2]), ...]` and keeps `.scores` alongside.
+        """
+        img = load_image(image)
+        # a single low-res pre-screen cannot vouch for objects that only show up in tiles
+        if self.cascade is not None and not (self.tiler is not None and self.tiler.should_tile(img)):
+            detections = self.cascade.detect(img, query_list, use_cache=use_cache)
+        else:
+            detections = self._detect_single_model(img, query_list, use_cache=use_cache)
+        DETECTOR_BOXES.observe(len(detections), model=self.model_id)
+        return detections
+
+    def _detect_single_model(self, img, query_list, use_cache=True):
+        """This tool's own detector on a decoded image: tiled, batched across callers or inline."""
+        if self.tiler is not None and self.tiler.should_tile(img):
+            return self.tiler.detect(img, query_list)
+        if self.batcher is not None:
+            # concurrent callers are merged into one forward pass
+            return self.batcher.detect(img, query_list)
+        started = time.perf_counter()
+        encoding = self._encode_image(img, use_cache=use_cache)
+        scores, boxes, labels = self._detect_with_encoding(encoding, query_list, img.size)
+        DETECTOR_FORWARD_SECONDS.observe(time.perf_counter() - started, model=self.model_id, backend=self.backend)
+        return self._postprocess(scores, boxes, labels, img.size)
+
+    def detect_with_scores(self, image, query_list, use_cache=True):
+        """Like `detect`, but returns `[(num, label, box, score), ...]`."""
+        return self.detect(image, query_list, use_cache=use_cache).with_scores()
+
+    def _run_detector(self, image, query_list, debug_path=None, with_scores=False, use_cache=True):
+        """
+        Low-level routine to run the detection model on `query_list`.
+        `image` may be a path, PIL image, ndarray or encoded bytes.
+        Returns: (detected_objects_final, labeled_image)
+        Where `detected_objects_final` = [(num, label, [x1,y1,x2,y2]), ...]
+        and `labeled_image` is an in-memory PIL image with numbered arrows.
+        With `with_scores`, also returns the detector score of each box:
+        (detected_objects_final, labeled_image, scores).
+        `use_cache=False` keeps one-off images (video frames) out of the image cache.
+        """
+        img = load_image(image)
+        with stage("detect", queries=len(query_list)) as span:
+            detected_objects_final = self.detect(img, query_list, use_cache=use_cache)
+            span.set_attribute("boxes", len(detected_objects_final))
 
         # Draw numbers
-        labeled_image_path = draw_arrows_and_numbers(image_path, detected_objects_final)
-        return detected_objects_final, labeled_image_path
+        with stage("draw_arrows"):
+            labeled_image = draw_arrows_and_numbers(img, detected_objects_final, output_path=debug_path)
+        if with_scores:
+            return detected_objects_final, labeled_image, detected_objects_final.scores.tolist()
+        return detected_objects_final, labeled_image
     
-    def _critique_and_refine_query(self, user_request, original_concepts, labeled_image_path, objects_detected, model="gpt-4o"):
+    def _critique_and_refine_query(self, user_request, original_concepts, labeled_image, objects_detected, model="gpt-4o"):
         """
         Asks the VLM/LLM: "We tried to detect <objects_detected> for the user request, 
         but maybe we need a refined set of objects. 
         Return a new list of objects or concepts to detect."
         """
-        base64_labeled_image = encode_image(labeled_image_path)
+        labeled_image_content = self.vlm_tool.prepare_image(labeled_image, model).content()
 
         # For clarity, let's pass the original user request and 
         # the currently detected object list to the LLM. 
@@ -189,12 +499,16 @@ class ObjectDetectionTool:
 
         {"role": "user", "content": [
             {"type": "text", "text": f"User's request: {user_request}\n Original Concepts for Detection: {original_concepts}"},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_labeled_image}", "detail": "high"}}
+            labeled_image_content
         ]}
         ]
-        refine_response = self.vlm_tool.chat_completion(refine_messages, model=model, response_format={"type": "json_object"})
-        
-        refined_response_objects = json.loads(refine_response)["refined_list"].split(",")
+        try:
+            refine_response = self.vlm_tool.chat_completion(refine_messages, model=model, response_format={"type": "json_object"})
+            refined_response_objects = str(json.loads(refine_response)["refined_list"]).split(",")
+        except (VLMError, json.JSONDecodeError, KeyError, TypeError) as e:
+            # critique는 선택 단계이므로 실패하면 기존 쿼리를 그대로 사용
+            logger.warning("Critique step failed, keeping original queries: %s", e)
+            return []
 
         if not refined_response_objects:
             return []
@@ -204,12 +518,8 @@ class ObjectDetectionTool:
    
 
     
-    def _validate_bboxes_with_llm(self, user_request, labeled_image_path, model="gpt-4o"):
-        """
-        Pass the labeled image to the LLM to filter bounding boxes 
-        based on user request. Returns 'valid_numbers' list.
-        """
-        base64_labeled_image = encode_image(labeled_image_path) # VLM API에 이미지 직접 전송을 위함 
+    def _validation_messages(self, user_request, labeled_image, model):
+        labeled_image_content = self.vlm_tool.prepare_image(labeled_image, model).content() # VLM API에 이미지 직접 전송을 위함 
         
         messages = [
             {"role": "system", "content": "You are an AI reviewing an object detection output.\n"
@@ -227,27 +537,97 @@ class ObjectDetectionTool:
             },
             {"role": "user", "content": [
                 {"type": "text", "text": f"The user's original request was: {user_request}"},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_labeled_image}", "detail": "high"}}
+                labeled_image_content
             ]
             }
         ] # 각 번호가 가리키는 객체가 사용차의 요청과 관련 있는지 판단 
+        return messages
 
-        valid_numbers_json = self.vlm_tool.chat_completion(
-            messages, 
-            model=model,
-            response_format={"type": "json_object"}
-        ) # VLM api 전송, 
+    def _start_speculative_validation(self, user_request, labeled_image, model="gpt-4o"):
+        """Starts the validation call in the background; see `_validate_bboxes_with_llm(pending=...)`."""
+        messages = self._validation_messages(user_request, labeled_image, model)
+        return self.vlm_tool.speculate(messages, model=model, response_format={"type": "json_object"})
 
+    def _validate_bboxes_with_llm(self, user_request, labeled_image, model="gpt-4o", pending=None, with_reasoning=False):
+        """
+        Pass the labeled image to the LLM to filter bounding boxes 
+        based on user request. Returns 'valid_numbers' list.
+        `pending` is a speculative call already started for this image,
+        whose answer is used instead of sending a new request.
+        With `with_reasoning`, returns (valid_numbers, reasoning or None).
+        """
         try:
+            if pending is not None:
+                valid_numbers_json = pending.result()
+            else:
+                valid_numbers_json = self.vlm_tool.chat_completion(
+                    self._validation_messages(user_request, labeled_image, model),
+                    model=model,
+                    response_format={"type": "json_object"}
+                ) # VLM api 전송, 
             valid_numbers_data = json.loads(valid_numbers_json)
-            return valid_numbers_data.get("valid_numbers", {})
+            valid_numbers = valid_numbers_data.get("valid_numbers", {})
+            reasoning = valid_numbers_data.get("reasoning")
+        except VLMError as e:
+            # 검증 실패 시 필터링 없이 모든 detection 유지
+            logger.warning("Validation step failed, keeping all detections: %s", e)
+            valid_numbers, reasoning = {}, None
         except json.JSONDecodeError:
-            return []
+            valid_numbers, reasoning = [], None
+        return (valid_numbers, reasoning) if with_reasoning else valid_numbers
         # VLM으로부터 받은 JSON 형식의 문자열 응답 > 파이썬 딕셔너리 
 
 
-    def run(self, image_path, user_request, do_critique=True):
+    def _apply_validation(self, detected_objects_final, valid_numbers):
+        """Keeps only the boxes the VLM marked valid, relabelled with its object names."""
+        if valid_numbers: 
+            return [(n, valid_numbers[str(n)], box) for (n, lbl, box) in detected_objects_final if str(n) in valid_numbers]
+            # detection에서 유효한 객체 번호 목록에 따른 detection 박스에 대한 튜플만 걸러내기 
+        return detected_objects_final
+
+    def run(self, image, user_request, do_critique=True):
+        """
+        `image` may be a file path, PIL image, RGB ndarray or encoded bytes.
+        Returns (final_img, final_text); see `detect_objects` for the full result.
         """
+        result = self.detect_objects(image, user_request, do_critique=do_critique)
+        return result.image, result.text
+
+    def run_with_report(self, image, user_request, do_critique=True):
+        """(final_img, final_text, RunReport) with per-stage timings and counts."""
+        result = self.detect_objects(image, user_request, do_critique=do_critique)
+        return result.image, result.text, result.report
+
+    def detect_objects(self, image, user_request, do_critique=True):
+        """
+        Runs the full pipeline inside a trace and returns a DetectionResult
+        (objects, scores, intermediate images and the RunReport). Safe to call
+        from several threads on the same tool.
+        """
+        with start_trace() as trace:
+            try:
+                with stage("run", detector=self.model_id, backend=self.backend) as root:
+                    result = self._run(image, user_request, do_critique, root)
+                    root.set_attribute("outcome", result.outcome)
+            except Exception:
+                RUNS.inc(outcome="error")
+                raise
+        RUNS.inc(outcome=result.outcome)
+        result = result.replace(report=RunReport.from_trace(trace, root, result.outcome, result.objects, result.scores))
+        if self.result_store is not None and not result.cached:
+            try:
+                self.result_store.add(
+                    result, user_request, critique=do_critique, detector=self.model_id,
+                    source=image if isinstance(image, str) else None,
+                )
+            except sqlite3.Error as e:
+                # the store is a record / cache; a write failure must not fail the request
+                logger.warning("Could not persist run to the result store: %s", e)
+        return result
+
+    def _run(self, image, user_request, do_critique, root):
+        """
+        The image is decoded once and the same buffer is reused by every stage.
         Full pipeline:
         1. Extract objects from user request (LLM).
         2. Detect bounding boxes with that query.
@@ -255,68 +635,145 @@ class ObjectDetectionTool:
         4. (Optional) Critique Step => refine the query if needed.
         5. Re-run detection with refined queries.
         6. Final LLM validation => final bounding boxes and annotation.
+        Returns a DetectionResult without the report (added by `detect_objects`).
         """
         # do_critique: critique 여부 선택 
+        with stage("decode") as span:
+            img = load_image(image)
+            span.set_attribute("image_size", f"{img.size[0]}x{img.size[1]}")
+        intermediates = []  # labeled image of each detector pass
+        image_hash = None
+        if self.result_store is not None:
+            with stage("result_store_lookup") as span:
+                image_hash = image_digest(img)
+                cached = self.result_store.lookup(image_hash, user_request, critique=do_critique, detector=self.model_id)
+                span.set_attribute("hit", cached is not None)
+            if cached is not None:
+                # a repeat request: only the final image is re-rendered from the stored boxes
+                root.set_attribute("cached", True)
+                with stage("draw_bounding_boxes"):
+                    final_img = draw_bounding_boxes(img, cached.objects)
+                return cached.replace(image=final_img)
+        run_info = {"image_hash": image_hash, "image_size": img.size}
 
         # ---------------------------------------------------
         # Step 1: initial user queries from request
         # ---------------------------------------------------
-        objects_to_detect = self.vlm_tool.extract_objects_from_request(image_path, user_request, model=self.concept_detection_model)
+        try:
+            with stage("extract", model=self.concept_detection_model) as span:
+                objects_to_detect = self.vlm_tool.extract_objects_from_request(img, user_request, model=self.concept_detection_model)
+                span.set_attribute("queries", len(objects_to_detect or []))
+        except VLMError as e:
+            return DetectionResult("extract_failed", f"⚠️ Concept extraction failed: {e}", **run_info)
         if not objects_to_detect:
-            return None, "⚠️ No objects to detect or invalid request."
+            return DetectionResult("no_objects", "⚠️ No objects to detect or invalid request.", **run_info)
+        run_info["concepts"] = objects_to_detect
 
         # ---------------------------------------------------
         # Step 2: run detection with the initial user queries
         # ---------------------------------------------------
-        detected_objects_final, labeled_image_path = self._run_detector(image_path, objects_to_detect)
+        queries = objects_to_detect
+        detected_objects_final, labeled_image, scores = self._run_detector(
+            img, queries, debug_path=self._debug_path(image, img, root.span_id, "initial"), with_scores=True
+        )
+        intermediates.append(labeled_image)
         
         # ------------------------------------------------------
         # Step 3: Initial Critique and Object Concept Refinement
         # ------------------------------------------------------
+        speculative = None
+        validation_decision = None
         if do_critique:
-            current_labels = ",".join(set([str(lbl) for _, lbl, _ in detected_objects_final]))
-
-            refined_query_list = self._critique_and_refine_query(
-                user_request=user_request,
-                original_concepts=current_labels,
-                labeled_image_path=labeled_image_path,
-                objects_detected=current_labels,
-                model=self.initial_critique_model
-            )
-            
-            # If the refined list is empty or identical, we might skip re-running
-            # But let's suppose we only re-run if we actually get a new set.
-            if refined_query_list and set(refined_query_list) != set(objects_to_detect):
+            decision = self.policy.critique(queries, detected_objects_final, scores, self.initial_critique_model)
+            if self.speculative and not decision.skipped:
+                # validate the first-pass image while the critique runs; the answer
+                # is only used if the critique keeps the original queries
+                validation_decision = self.policy.validation(queries, detected_objects_final, scores, self.final_critique_model)
+                if not validation_decision.skipped:
+                    speculative = self._start_speculative_validation(user_request, labeled_image, model=validation_decision.model)
+            try:
+                with stage("critique", **decision.to_dict()) as span:
+                    if decision.skipped:
+                        refined_query_list = []
+                    else:
+                        current_labels = ",".join(set([str(lbl) for _, lbl, _ in detected_objects_final]))
+                        refined_query_list = self._critique_and_refine_query(
+                            user_request=user_request,
+                            original_concepts=current_labels,
+                            labeled_image=labeled_image,
+                            objects_detected=current_labels,
+                            model=decision.model
+                        )
+                    # If the refined list is empty or identical, we might skip re-running
+                    # But let's suppose we only re-run if we actually get a new set.
+                    refined = bool(refined_query_list) and set(refined_query_list) != set(objects_to_detect)
+                    span.set_attribute("refined", refined)
+            except BaseException:
+                if speculative is not None:
+                    speculative.discard()
+                raise
+            if not decision.skipped:
+                CRITIQUES.inc(outcome="refined" if refined else ("kept" if refined_query_list else "failed"))
+            root.set_attribute("refined", refined)
+
+            if refined:
+                if speculative is not None:
+                    root.set_attribute("speculation", speculative.discard())
+                    speculative = None
+                validation_decision = None
                 # Re-run detection with refined query
-                detected_objects_final, labeled_image_path = self._run_detector(image_path, refined_query_list)
+                queries = refined_query_list
+                detected_objects_final, labeled_image, scores = self._run_detector(
+                    img, queries, debug_path=self._debug_path(image, img, root.span_id, "refined"), with_scores=True
+                )
+                intermediates.append(labeled_image)
                 if not detected_objects_final:
-                    return None, "No objects found for the initial query."
+                    return DetectionResult(
+                        "no_detections", "No objects found for the initial query.", queries=queries, intermediates=intermediates, **run_info
+                    )
         
         # ---------------------------------------------------
         # Step 4: LLM-based critique
         # ---------------------------------------------------
-        valid_numbers = self._validate_bboxes_with_llm(user_request, labeled_image_path, model=self.final_critique_model)
-        # dictionary 형태의 유효한 객체 번호 목록
-
-        # filter bounding boxes
-        if valid_numbers: 
-            filtered_objects = [(n, valid_numbers[str(n)], box) for (n, lbl, box) in detected_objects_final if str(n) in valid_numbers]
-            # detection에서 유효한 객체 번호 목록에 따른 detection 박스에 대한 튜플만 걸러내기 
-        else:
-            filtered_objects = detected_objects_final
-        
-
-        # store them
-        self.last_detection_bboxes = [x[-1] for x in filtered_objects] # 튜플의 마지막 항목 - bbox 좌표 리스트
-        self.last_filtered_objects = filtered_objects
-
+        decision = validation_decision or self.policy.validation(queries, detected_objects_final, scores, self.final_critique_model)
+        with stage("validate", speculative=speculative is not None, **decision.to_dict()) as span:
+            reasoning = None
+            if decision.skipped:
+                valid_numbers = {}  # keep every box as detected
+            else:
+                valid_numbers, reasoning = self._validate_bboxes_with_llm(
+                    user_request, labeled_image, model=decision.model, pending=speculative, with_reasoning=True
+                )
+            # dictionary 형태의 유효한 객체 번호 목록
+
+            # filter bounding boxes
+            filtered_objects = self._apply_validation(detected_objects_final, valid_numbers)
+            span.set_attribute("kept", len(filtered_objects))
+            span.set_attribute("dropped", len(detected_objects_final) - len(filtered_objects))
+        if speculative is not None:
+            root.set_attribute("speculation", "used")
 
         # ---------------------------------------------------
         # Step 5: Produce final annotated image
         # ---------------------------------------------------
-        final_img = draw_bounding_boxes(image_path, filtered_objects)
+        with stage("draw_bounding_boxes"):
+            final_img = draw_bounding_boxes(img, filtered_objects)
+        root.set_attribute("objects", len(filtered_objects))
 
         final_text = (
             f"🔍 Validated objects: {', '.join(set(str(lbl) for _, lbl, _ in filtered_objects))}"
         )
-        return final_img, final_text
\ No newline at end of file
+        # validation keeps the detector numbering, so scores are looked up by number
+        score_by_num = {num: score for (num, _, _), score in zip(detected_objects_final, scores)}
+        final_scores = [score_by_num[num] for num, _, _ in filtered_objects]
+        return DetectionResult(
+            "ok",
+            final_text,
+            image=final_img,
+            objects=filtered_objects,
+            scores=final_scores,
+            queries=queries,
+            intermediates=intermediates,
+            reasoning=reasoning,
+            **run_info,
+        )
@@ -0,0 +1,105 @@
+from src.metrics import get_metrics
+from src.config import (
+    STAGE_POLICY,
+    POLICY_CHEAP_VLM,
+    POLICY_CRITIQUE_SKIP_SCORE,
+    POLICY_VALIDATION_SKIP_SCORE,
+    POLICY_VALIDATION_SKIP_MAX_BOXES,
+    POLICY_DOWNGRADE_SCORE,
+)
+
+STAGE_DECISIONS = get_metrics().counter(
+    "pipeline_stage_decisions", "Policy decisions for the optional VLM stages.", ["stage", "action", "reason"]
+)
+
+
+class StageDecision:
+    """Whether an optional VLM stage runs, with which model, and why."""
+    def __init__(self, action, reason, model=None):
+        self.action = action  # "run" | "skip"
+        self.reason = reason
+        self.model = model
+
+    @property
+    def skipped(self):
+        return self.action == "skip"
+
+    def to_dict(self):
+        return {"action": self.action, "reason": self.reason, "model": self.model}
+
+
+def concept_scores(queries, detections, scores):
+    """Best detector score per query concept (labels are the matched query text)."""
+    best = {q: 0.0 for q in queries}
+    for (_, label, _), score in zip(detections, scores):
+        name = str(label).strip().lower()
+        if name in best:
+            best[name] = max(best[name], score)
+    return best
+
+
+class StagePolicy:
+    """
+    Decides, from the detector's own scores, whether the critique and final
+    validation VLM calls are worth making for a run.
+    mode "always" keeps the original behaviour (both stages always run);
+    mode "adaptive" skips them when the detector is already confident and
+    falls back to `cheap_model` for the easy-but-not-trivial cases.
+    """
+    def __init__(
+        self,
+        mode=STAGE_POLICY,
+        cheap_model=POLICY_CHEAP_VLM,
+        critique_skip_score=POLICY_CRITIQUE_SKIP_SCORE,
+        validation_skip_score=POLICY_VALIDATION_SKIP_SCORE,
+        validation_skip_max_boxes=POLICY_VALIDATION_SKIP_MAX_BOXES,
+        downgrade_score=POLICY_DOWNGRADE_SCORE,
+    ):
+        if mode not in ("always", "adaptive"):
+            raise ValueError(f"Unknown stage policy '{mode}' (expected 'always' or 'adaptive')")
+        self.mode = mode
+        self.cheap_model = cheap_model
+        self.critique_skip_score = critique_skip_score
+        self.validation_skip_score = validation_skip_score
+        self.validation_skip_max_boxes = validation_skip_max_boxes
+        self.downgrade_score = downgrade_score
+
+    def _decide(self, stage, action, reason, model):
+        STAGE_DECISIONS.inc(stage=stage, action=action, reason=reason)
+        return StageDecision(action, reason, None if action == "skip" else model)
+
+    def critique(self, queries, detections, scores, model):
+        """
+        Skips the critique when every concept was found above
+        `critique_skip_score`; uses the cheap model when every concept was
+        found at all. With no detections the critique always runs, since it
+        is what proposes broader concepts.
+        """
+        if self.mode == "always":
+            return self._decide("critique", "run", "policy_always", model)
+        if not detections:
+            return self._decide("critique", "run", "no_detections", model)
+        best = concept_scores(queries, detections, scores).values()
+        if all(score >= self.critique_skip_score for score in best):
+            return self._decide("critique", "skip", "all_concepts_confident", model)
+        if all(score > 0.0 for score in best):
+            return self._decide("critique", "run", "all_concepts_detected", self.cheap_model)
+        return self._decide("critique", "run", "missing_concepts", model)
+
+    def validation(self, queries, detections, scores, model):
+        """
+        Skips validation when there is nothing to validate, or when there are
+        at most `validation_skip_max_boxes` boxes all above
+        `validation_skip_score`; uses the cheap model when every box is above
+        `downgrade_score`.
+        """
+        if self.mode == "always":
+            return self._decide("validate", "run", "policy_always", model)
+        if not detections:
+            return self._decide("validate", "skip", "no_boxes", model)
+        lowest = min(scores)
+        if len(detections) <= self.validation_skip_max_boxes and lowest >= self.validation_skip_score:
+            return self._decide("validate", "skip", "few_confident_boxes", model)
+        if lowest >= self.downgrade_score:
+            return self._decide("validate", "run", "confident_boxes", self.cheap_model)
+        return self._decide("validate", "run", "uncertain_boxes", model)
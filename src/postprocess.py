@@ -0,0 +1,174 @@
+import numpy as np
+import torch
+
+from torchvision.ops import batched_nms, box_convert, nms
+from src.utils import iou_matrix
+from src.config import (
+    NMS_IOU_THRESHOLD,
+    NMS_AGNOSTIC_IOU_THRESHOLD,
+    MAX_DETECTIONS_PER_LABEL,
+    MAX_DETECTIONS,
+)
+
+
+class Detections:
+    """
+    Array-backed detector output for one image: `boxes` [N, 4] float32 pixel
+    xyxy, `scores` [N] float32 and `labels` (N query strings), sorted by score.
+    Iterates (and indexes) as the pipeline's `(num, label, [x1, y1, x2, y2])`
+    tuples, numbered from 1, so it can be used wherever that list was.
+    """
+    __slots__ = ("boxes", "scores", "labels")
+
+    def __init__(self, boxes, scores, labels):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.labels = list(labels)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), [])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return (index + 1, self.labels[index], self.boxes[index].tolist())
+
+    def __iter__(self):
+        boxes = self.boxes.tolist()
+        for i, label in enumerate(self.labels):
+            yield (i + 1, label, boxes[i])
+
+    def __repr__(self):
+        return f"Detections(n={len(self)}, labels={sorted(set(self.labels))})"
+
+    def with_scores(self):
+        """`[(num, label, box, score), ...]`."""
+        return [(num, label, box, float(score)) for (num, label, box), score in zip(self, self.scores)]
+
+
+def normalized_cxcywh_to_xyxy(boxes, image_size):
+    """Normalized (cx, cy, w, h) boxes -> pixel (x1, y1, x2, y2) for a (width, height) image."""
+    width, height = image_size
+    scale = torch.tensor([width, height, width, height], dtype=boxes.dtype, device=boxes.device)
+    return box_convert(boxes, "cxcywh", "xyxy") * scale
+
+
+def postprocess(
+    scores,
+    boxes,
+    labels,
+    score_threshold,
+    image_size=None,
+    iou_threshold=NMS_IOU_THRESHOLD,
+    agnostic_iou_threshold=NMS_AGNOSTIC_IOU_THRESHOLD,
+    max_per_label=MAX_DETECTIONS_PER_LABEL,
+    max_detections=MAX_DETECTIONS,
+):
+    """
+    Tensor-level cleanup of raw detector output:
+    score threshold -> class-aware NMS (`iou_threshold`) -> per-label top-k ->
+    class-agnostic NMS (`agnostic_iou_threshold`, merges the same object
+    matched by several queries/phrases) -> global top-k.
+    `boxes` are pixel xyxy; `labels` are query strings. When `image_size`
+    (width, height) is given, boxes are clipped to the image.
+    Any threshold / cap set to None is skipped. Returns Detections.
+    """
+    scores = torch.as_tensor(scores, dtype=torch.float32)
+    boxes = torch.as_tensor(boxes, dtype=torch.float32).reshape(-1, 4)
+    if scores.numel() == 0:
+        return Detections.empty()
+
+    keep = torch.nonzero(scores >= score_threshold).flatten()
+    if keep.numel() == 0:
+        return Detections.empty()
+    scores, boxes = scores[keep], boxes[keep]
+    labels = [labels[i] for i in keep.tolist()]
+    if image_size is not None:
+        width, height = image_size
+        boxes[:, 0::2] = boxes[:, 0::2].clamp(0, width)
+        boxes[:, 1::2] = boxes[:, 1::2].clamp(0, height)
+
+    names = sorted(set(labels))
+    label_ids = torch.tensor([names.index(label) for label in labels], dtype=torch.int64, device=boxes.device)
+
+    # batched_nms returns indices in decreasing score order
+    if iou_threshold is not None:
+        order = batched_nms(boxes, scores, label_ids, iou_threshold)
+    else:
+        order = torch.argsort(scores, descending=True)
+
+    if max_per_label is not None:
+        one_hot = torch.nn.functional.one_hot(label_ids[order], num_classes=len(names))
+        rank = (one_hot.cumsum(0) * one_hot).sum(1)  # 1-based rank within its label
+        order = order[rank <= max_per_label]
+
+    if agnostic_iou_threshold is not None and order.numel() > 1:
+        order = order[nms(boxes[order], scores[order], agnostic_iou_threshold)]
+
+    if max_detections is not None:
+        order = order[:max_detections]
+
+    order_list = order.tolist()
+    return Detections(
+        boxes[order].cpu().numpy(),
+        scores[order].cpu().numpy(),
+        [labels[i] for i in order_list],
+    )
+
+
+def weighted_box_fusion(detections_list, weights=None, iou_threshold=0.55):
+    """
+    Merges Detections of several models for the same image.
+    Boxes are visited by decreasing score and join the cluster of the same
+    label whose fused box they overlap by >= `iou_threshold` (else start a
+    new one). A fused box is the (score x model weight)-weighted mean of its
+    members; its score is the weight-averaged best score of each model in the
+    cluster, scaled by the share of the total model weight that saw it (as in
+    standard WBF), so a box only one model found is down-weighted.
+    Returns (scores [N], boxes [N, 4], labels) for `postprocess`.
+    """
+    if weights is None:
+        weights = [1.0] * len(detections_list)
+    total_weight = float(sum(weights))
+    entries = []
+    for model_index, (detections, weight) in enumerate(zip(detections_list, weights)):
+        for box, score, label in zip(detections.boxes, detections.scores, detections.labels):
+            entries.append((float(score), model_index, float(weight), box, label))
+    entries.sort(key=lambda entry: -entry[0])
+
+    clusters = {}  # label -> [{"sum", "mass", "box", "models": {model_index: (score, weight)}}]
+    for score, model_index, weight, box, label in entries:
+        group = clusters.setdefault(label, [])
+        cluster = None
+        if group:
+            ious = iou_matrix(box, np.stack([c["box"] for c in group]))[0]
+            best = int(np.argmax(ious))
+            if ious[best] >= iou_threshold:
+                cluster = group[best]
+        if cluster is None:
+            cluster = {"sum": np.zeros(4, dtype=np.float64), "mass": 0.0, "models": {}}
+            group.append(cluster)
+        mass = max(score, 1e-6) * weight
+        cluster["sum"] += box * mass
+        cluster["mass"] += mass
+        cluster["box"] = (cluster["sum"] / cluster["mass"]).astype(np.float32)
+        cluster["models"].setdefault(model_index, (score, weight))  # first visit is the model's best
+
+    scores, boxes, labels = [], [], []
+    for label, group in clusters.items():
+        for cluster in group:
+            # weighted mean over the models that saw it x (their weight / total weight)
+            scores.append(sum(s * w for s, w in cluster["models"].values()) / total_weight)
+            boxes.append(cluster["box"])
+            labels.append(label)
+    return (
+        np.asarray(scores, dtype=np.float32),
+        np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+        labels,
+    )
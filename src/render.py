@@ -0,0 +1,225 @@
+import functools
+import os
+
+import cv2
+import numpy as np
+
+from PIL import Image, ImageDraw, ImageFont
+from src.config import FONT_PATH, PROJECT_ROOT
+
+ARROW_PADDING = 50             # white border the numbered arrows point into
+ARROW_LABEL_SIZE = (35, 25)    # (w, h) of the dark box behind each number
+BOX_COLOR = (255, 0, 0)
+BOX_WIDTH = 3
+BOX_RADIUS = 10
+LABEL_FONT_SIZE = 20
+LABEL_PADDING = 5
+LABEL_ALPHA = 0.5
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(size=LABEL_FONT_SIZE):
+    """
+    TrueType font for box labels, loaded once per size.
+    Falls back from FONT_PATH to system Arial / DejaVu and finally PIL's built-in font.
+    """
+    candidates = [FONT_PATH if os.path.isabs(FONT_PATH) else os.path.join(PROJECT_ROOT, FONT_PATH), "arial.ttf", "DejaVuSans.ttf"]
+    for path in candidates:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _pil_glyph(text, size):
+    """Coverage mask (uint8 [h, w]) of `text` in the label font; repeated labels are rasterized once."""
+    font = get_font(size)
+    left, top, right, bottom = font.getbbox(text)
+    canvas = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(canvas).text((-left, -top), text, fill=255, font=font)
+    glyph = np.array(canvas)
+    glyph.setflags(write=False)
+    return glyph
+
+
+@functools.lru_cache(maxsize=4096)
+def _cv2_glyph(text, scale=0.5, thickness=2):
+    """Coverage mask of `text` in cv2's Hershey font; numbers are rasterized once instead of per arrow."""
+    (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    pad = thickness
+    glyph = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+    cv2.putText(glyph, text, (pad, h + pad), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+    glyph.setflags(write=False)
+    return glyph
+
+
+def _clip_rect(rect, width, height):
+    x1, y1, x2, y2 = rect
+    return max(0, x1), max(0, y1), min(width, x2), min(height, y2)
+
+
+def blend_rects(img, rects, color, alpha):
+    """
+    Alpha-blends `color` into each (x1, y1, x2, y2) rect of an HxWx3 uint8
+    array in place. Only the ROI pixels are touched, so the cost is the
+    total label area, not objects x image size.
+    """
+    height, width = img.shape[:2]
+    color = np.asarray(color, dtype=np.float32) * alpha
+    for rect in rects:
+        x1, y1, x2, y2 = _clip_rect(rect, width, height)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        roi = img[y1:y2, x1:x2]
+        roi[:] = (roi * (1.0 - alpha) + color).astype(np.uint8)
+
+
+def paste_glyph(img, glyph, origin, color):
+    """Composites a cached coverage mask at `origin` (x, y of its top-left) in `color`."""
+    height, width = img.shape[:2]
+    x, y = origin
+    gh, gw = glyph.shape
+    x1, y1, x2, y2 = _clip_rect((x, y, x + gw, y + gh), width, height)
+    if x2 <= x1 or y2 <= y1:
+        return
+    coverage = glyph[y1 - y:y2 - y, x1 - x:x2 - x, None].astype(np.float32) / 255.0
+    roi = img[y1:y2, x1:x2]
+    roi[:] = (roi * (1.0 - coverage) + np.asarray(color, dtype=np.float32) * coverage).astype(np.uint8)
+
+
+class LabelPlacer:
+    """
+    Greedy collision-aware label placement. Placed rects are kept in a
+    uniform grid, so each candidate is only tested against nearby labels.
+    """
+    def __init__(self, width, height, cell=64):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self._grid = {}
+
+    def _cells(self, rect):
+        x1, y1, x2, y2 = rect
+        for gx in range(int(x1) // self.cell, int(x2) // self.cell + 1):
+            for gy in range(int(y1) // self.cell, int(y2) // self.cell + 1):
+                yield gx, gy
+
+    def _fits(self, rect):
+        x1, y1, x2, y2 = rect
+        if x1 < 0 or y1 < 0 or x2 > self.width or y2 > self.height:
+            return False
+        for key in self._cells(rect):
+            for ox1, oy1, ox2, oy2 in self._grid.get(key, ()):
+                if x1 < ox2 and ox1 < x2 and y1 < oy2 and oy1 < y2:
+                    return False
+        return True
+
+    def place(self, candidates):
+        """Takes the first free candidate rect (falls back to the first one) and reserves it."""
+        chosen = next((rect for rect in candidates if self._fits(rect)), candidates[0])
+        for key in self._cells(chosen):
+            self._grid.setdefault(key, []).append(chosen)
+        return chosen
+
+
+def _slide(rect, dx, dy, steps):
+    """`rect`, then alternately shifted by +/-k * (dx, dy) for k = 1..steps."""
+    x1, y1, x2, y2 = rect
+    yield rect
+    for k in range(1, steps + 1):
+        for sign in (1, -1):
+            yield (x1 + sign * k * dx, y1 + sign * k * dy, x2 + sign * k * dx, y2 + sign * k * dy)
+
+
+def render_arrows(image, detected_objects, pad=ARROW_PADDING):
+    """
+    Pads an RGB image (PIL or ndarray) with a white border and draws, for each
+    `(num, label, box)`, an arrow from the box center to the nearest border
+    with its number in a half-transparent box. Numbers that would collide
+    slide along the border. Returns an RGB ndarray.
+    """
+    img = cv2.copyMakeBorder(np.asarray(image), pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=[255, 255, 255])
+    height, width = img.shape[:2]
+    label_w, label_h = ARROW_LABEL_SIZE
+    placer = LabelPlacer(width, height)
+
+    labels = []
+    for num, _, box in detected_objects:
+        x1, y1, x2, y2 = map(int, box)
+        cx, cy = (x1 + x2) // 2 + pad, (y1 + y2) // 2 + pad
+
+        # arrow towards the nearest border; the number sits in the padding there
+        distances = {"top": cy, "bottom": height - cy, "left": cx, "right": width - cx}
+        direction = min(distances, key=distances.get)
+        if direction == "top":
+            rect, step = (cx - 15, pad - 30, cx + 20, pad - 5), (label_w + 2, 0)
+        elif direction == "bottom":
+            rect, step = (cx - 15, height - pad + 5, cx + 20, height - pad + 30), (label_w + 2, 0)
+        elif direction == "left":
+            rect, step = (pad - 35, cy - 15, pad, cy + 10), (0, label_h + 2)
+        else:
+            rect, step = (width - pad, cy - 15, width - pad + 35, cy + 10), (0, label_h + 2)
+        rect = placer.place(list(_slide(rect, *step, steps=8)))
+
+        lx, ly = (rect[0] + rect[2]) // 2, (rect[1] + rect[3]) // 2
+        arrow_end = {"top": (lx, pad), "bottom": (lx, height - pad), "left": (pad, ly), "right": (width - pad, ly)}[direction]
+        cv2.arrowedLine(img, (cx, cy), arrow_end, (0, 0, 0), 2, tipLength=0.3)
+        labels.append((num, rect))
+
+    # one compositing pass for all label backgrounds, then the cached number glyphs
+    blend_rects(img, [rect for _, rect in labels], (0, 0, 0), LABEL_ALPHA)
+    for num, (x1, y1, x2, y2) in labels:
+        glyph = _cv2_glyph(str(num))
+        paste_glyph(img, glyph, (x1 + 3, y1 + (y2 - y1 - glyph.shape[0]) // 2), (0, 0, 0))
+    return img
+
+
+def _rounded_box(img, box, color, thickness, radius):
+    x1, y1, x2, y2 = map(int, box)
+    radius = max(0, min(radius, (x2 - x1) // 2, (y2 - y1) // 2))
+    if radius == 0:
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, thickness)
+        return
+    cv2.line(img, (x1 + radius, y1), (x2 - radius, y1), color, thickness)
+    cv2.line(img, (x1 + radius, y2), (x2 - radius, y2), color, thickness)
+    cv2.line(img, (x1, y1 + radius), (x1, y2 - radius), color, thickness)
+    cv2.line(img, (x2, y1 + radius), (x2, y2 - radius), color, thickness)
+    cv2.ellipse(img, (x1 + radius, y1 + radius), (radius, radius), 180, 0, 90, color, thickness)
+    cv2.ellipse(img, (x2 - radius, y1 + radius), (radius, radius), 270, 0, 90, color, thickness)
+    cv2.ellipse(img, (x2 - radius, y2 - radius), (radius, radius), 0, 0, 90, color, thickness)
+    cv2.ellipse(img, (x1 + radius, y2 - radius), (radius, radius), 90, 0, 90, color, thickness)
+
+
+def render_boxes(image, filtered_objects, font_size=LABEL_FONT_SIZE):
+    """
+    Draws rounded red boxes with `label` captions on a copy of an RGB image
+    (PIL or ndarray). Captions sit above the box, or inside/below it when that
+    spot is taken or off-image. Returns an RGB ndarray.
+    """
+    img = np.array(image, dtype=np.uint8)  # the only full-frame copy
+    height, width = img.shape[:2]
+    placer = LabelPlacer(width, height)
+
+    captions = []
+    for _, lbl, box in filtered_objects:
+        x1, y1, x2, y2 = map(int, box)
+        _rounded_box(img, (x1, y1, x2, y2), BOX_COLOR, BOX_WIDTH, BOX_RADIUS)
+
+        glyph = _pil_glyph(str(lbl), font_size)
+        label_w = glyph.shape[1] + 2 * LABEL_PADDING
+        label_h = max(glyph.shape[0], font_size) + 2 * LABEL_PADDING
+        candidates = [
+            (x1, y1 - label_h, x1 + label_w, y1),          # above
+            (x1, y1, x1 + label_w, y1 + label_h),          # inside, top
+            (x1, y2, x1 + label_w, y2 + label_h),          # below
+            (x2 - label_w, y1 - label_h, x2, y1),          # above, right-aligned
+        ]
+        captions.append((glyph, placer.place(candidates)))
+
+    blend_rects(img, [rect for _, rect in captions], BOX_COLOR, LABEL_ALPHA)
+    for glyph, (x1, y1, _, y2) in captions:
+        paste_glyph(img, glyph, (x1 + LABEL_PADDING, y1 + (y2 - y1 - glyph.shape[0]) // 2), (255, 255, 255))
+    return img
+
@@ -0,0 +1,83 @@
+class DetectionResult:
+    """
+    Immutable outcome of one `ObjectDetectionTool.detect_objects` call.
+    Everything a run produces lives here instead of on the tool, so one tool
+    (and one loaded model) can serve concurrent calls:
+
+    - `outcome` / `text`: run status ("ok", "no_objects", ...) and summary
+    - `image`: final annotated PIL image (None when the run stopped early)
+    - `objects`: validated `(num, label, (x1, y1, x2, y2))` tuples, `scores` alongside
+    - `queries`: the concepts the final detection ran on
+    - `intermediates`: arrow-labeled PIL images sent to the VLM, one per detector pass
+    - `report`: RunReport with per-stage timings (src/tracing.py)
+    - `concepts`: concepts first extracted from the request (before critique)
+    - `reasoning`: the validation VLM's explanation, when it gave one
+    - `image_hash` / `image_size`: content hash and (width, height) of the input
+    - `cached`: served from the result store instead of running the pipeline
+    """
+    __slots__ = (
+        "outcome", "text", "image", "objects", "scores", "queries", "intermediates", "report",
+        "concepts", "reasoning", "image_hash", "image_size", "cached",
+    )
+
+    def __init__(
+        self,
+        outcome,
+        text,
+        image=None,
+        objects=(),
+        scores=(),
+        queries=(),
+        intermediates=(),
+        report=None,
+        concepts=(),
+        reasoning=None,
+        image_hash=None,
+        image_size=None,
+        cached=False,
+    ):
+        values = {
+            "outcome": outcome,
+            "text": text,
+            "image": image,
+            "objects": tuple((num, label, tuple(float(v) for v in box)) for num, label, box in objects),
+            "scores": tuple(float(score) for score in scores),
+            "queries": tuple(queries),
+            "intermediates": tuple(intermediates),
+            "report": report,
+            "concepts": tuple(concepts),
+            "reasoning": reasoning,
+            "image_hash": image_hash,
+            "image_size": tuple(image_size) if image_size is not None else None,
+            "cached": cached,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DetectionResult is immutable (tried to set {name!r})")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"DetectionResult is immutable (tried to delete {name!r})")
+
+    def __repr__(self):
+        return f"DetectionResult(outcome={self.outcome!r}, objects={len(self.objects)})"
+
+    def replace(self, **changes):
+        """Copy with some fields changed."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return DetectionResult(**values)
+
+    @property
+    def boxes(self):
+        """`[(x1, y1, x2, y2), ...]` of the validated objects (e.g. as SAM prompts)."""
+        return [box for _, _, box in self.objects]
+
+    @property
+    def labels(self):
+        return [label for _, label, _ in self.objects]
+
+    def with_scores(self):
+        """`[(num, label, box, score), ...]`."""
+        return [(num, label, box, score) for (num, label, box), score in zip(self.objects, self.scores)]
@@ -0,0 +1,295 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.result import DetectionResult
+
+
+class ResultStore:
+    """
+    Every pipeline run in one SQLite file, queryable without re-running it.
+
+    `runs` holds one row per run (image hash, request, concepts, refined
+    queries, outcome, validation reasoning, stage timings) and `detections`
+    one row per validated box with its label and score. Indexes cover label
+    and image hash, and an R-tree indexes each box in normalized [0, 1]
+    image coordinates, so region queries work across image sizes.
+
+    Finished "ok" runs also serve as a short-circuit cache: `lookup` returns
+    the latest run for the same image content, request, critique flag and
+    detector (optionally no older than `max_age` seconds).
+    """
+    def __init__(self, path, max_age=None, short_circuit=True):
+        self.path = path
+        self.max_age = max_age
+        self.short_circuit = short_circuit
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY,"
+            " image_hash TEXT,"
+            " source TEXT,"           # file path / job id when known
+            " request TEXT NOT NULL,"
+            " critique INTEGER NOT NULL,"
+            " detector TEXT,"
+            " outcome TEXT NOT NULL,"
+            " text TEXT,"
+            " concepts TEXT,"         # JSON list
+            " queries TEXT,"          # JSON list; differs from concepts after a critique refined them
+            " reasoning TEXT,"        # JSON
+            " width INTEGER,"
+            " height INTEGER,"
+            " trace_id TEXT,"
+            " total_ms REAL,"
+            " stage_ms TEXT,"         # JSON {stage: ms}
+            " created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS runs_image ON runs(image_hash, request, critique, detector);"
+            "CREATE TABLE IF NOT EXISTS detections ("
+            " id INTEGER PRIMARY KEY,"
+            " run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,"
+            " num INTEGER,"
+            " label TEXT NOT NULL,"
+            " score REAL,"
+            " x1 REAL, y1 REAL, x2 REAL, y2 REAL);"
+            "CREATE INDEX IF NOT EXISTS detections_label ON detections(label, score);"
+            "CREATE INDEX IF NOT EXISTS detections_run ON detections(run_id);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS detection_boxes USING rtree(id, x1, x2, y1, y2);"
+        )
+
+    # ---- writing ----
+    def add(self, result, request, critique=True, detector=None, source=None):
+        """Stores a DetectionResult (with its report); returns the run id."""
+        report = result.report
+        width, height = result.image_size or (None, None)
+        return self._insert(
+            {
+                "image_hash": result.image_hash,
+                "source": source,
+                "request": request,
+                "critique": int(bool(critique)),
+                "detector": detector,
+                "outcome": result.outcome,
+                "text": result.text,
+                "concepts": json.dumps(list(result.concepts), ensure_ascii=False),
+                "queries": json.dumps(list(result.queries), ensure_ascii=False),
+                "reasoning": json.dumps(result.reasoning, ensure_ascii=False, default=str) if result.reasoning is not None else None,
+                "width": width,
+                "height": height,
+                "trace_id": report.trace_id if report is not None else None,
+                "total_ms": report.total_ms if report is not None else None,
+                "stage_ms": json.dumps(report.stage_totals()) if report is not None else None,
+            },
+            [(num, str(label), box, score) for num, label, box, score in result.with_scores()],
+        )
+
+    def add_record(self, record, image_hash=None, image_size=None, critique=True, detector=None):
+        """Stores a BatchRunner JSONL record (src/batch_runner.py); returns the run id."""
+        width, height = image_size or (None, None)
+        stage_ms = {name: round(seconds * 1000, 3) for name, seconds in (record.get("timings") or {}).items()}
+        objects = record.get("objects", [])
+        if record["status"] == "ok":
+            # same summary the pipeline returns, so `lookup` can serve batch runs too
+            text = f"🔍 Validated objects: {', '.join(set(str(obj['label']) for obj in objects))}"
+        else:
+            text = record.get("error")
+        reasoning = record.get("reasoning")
+        return self._insert(
+            {
+                "image_hash": image_hash,
+                "source": record.get("image"),
+                "request": record["prompt"],
+                "critique": int(bool(critique)),
+                "detector": detector,
+                "outcome": record["status"],
+                "text": text,
+                "concepts": json.dumps(record.get("concepts") or [], ensure_ascii=False, default=str),
+                "queries": json.dumps(record.get("refined_queries") or record.get("concepts") or [], ensure_ascii=False, default=str),
+                "reasoning": json.dumps(reasoning, ensure_ascii=False, default=str) if reasoning is not None else None,
+                "width": width,
+                "height": height,
+                "trace_id": None,
+                "total_ms": round(sum(stage_ms.values()), 3),
+                "stage_ms": json.dumps(stage_ms),
+            },
+            [(obj["num"], str(obj["label"]), obj["box"], obj.get("score")) for obj in objects],
+        )
+
+    def _insert(self, run, objects):
+        run["created_at"] = time.time()
+        columns = ", ".join(run)
+        placeholders = ", ".join("?" for _ in run)
+        with self._lock, self._conn:
+            run_id = self._conn.execute(f"INSERT INTO runs ({columns}) VALUES ({placeholders})", list(run.values())).lastrowid
+            for num, label, box, score in objects:
+                x1, y1, x2, y2 = (float(v) for v in box)
+                detection_id = self._conn.execute(
+                    "INSERT INTO detections (run_id, num, label, score, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, num, label, score, x1, y1, x2, y2),
+                ).lastrowid
+                if run["width"] and run["height"]:
+                    self._conn.execute(
+                        "INSERT INTO detection_boxes (id, x1, x2, y1, y2) VALUES (?, ?, ?, ?, ?)",
+                        (detection_id, x1 / run["width"], x2 / run["width"], y1 / run["height"], y2 / run["height"]),
+                    )
+        return run_id
+
+    # ---- short-circuit cache ----
+    def lookup(self, image_hash, request, critique=True, detector=None):
+        """
+        DetectionResult of the latest "ok" run for this image content and
+        request, or None. The final image is not stored; callers re-render it
+        from the boxes.
+        """
+        if not self.short_circuit or image_hash is None:
+            return None
+        sql = "SELECT id FROM runs WHERE image_hash = ? AND request = ? AND critique = ? AND detector IS ? AND outcome = 'ok'"
+        params = [image_hash, request, int(bool(critique)), detector]
+        if self.max_age is not None:
+            sql += " AND created_at >= ?"
+            params.append(time.time() - self.max_age)
+        with self._lock:
+            row = self._conn.execute(sql + " ORDER BY id DESC LIMIT 1", params).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        run = self.get_run(row[0])
+        return DetectionResult(
+            run["outcome"],
+            run["text"],
+            objects=[(d["num"], d["label"], d["box"]) for d in run["detections"]],
+            scores=[d["score"] if d["score"] is not None else 0.0 for d in run["detections"]],
+            queries=run["queries"],
+            concepts=run["concepts"],
+            reasoning=run["reasoning"],
+            image_hash=run["image_hash"],
+            image_size=(run["width"], run["height"]) if run["width"] else None,
+            cached=True,
+        )
+
+    # ---- queries ----
+    def get_run(self, run_id):
+        """One run as a dict with its `detections`, or None."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            run = dict(zip([c[0] for c in cursor.description], row))
+            detections = self._conn.execute(
+                "SELECT num, label, score, x1, y1, x2, y2 FROM detections WHERE run_id = ? ORDER BY num", (run_id,)
+            ).fetchall()
+        for key in ("concepts", "queries", "reasoning", "stage_ms"):
+            if run[key] is not None:
+                run[key] = json.loads(run[key])
+        run["detections"] = [
+            {"num": num, "label": label, "score": score, "box": [x1, y1, x2, y2]}
+            for num, label, score, x1, y1, x2, y2 in detections
+        ]
+        return run
+
+    def find(self, label=None, image_hash=None, region=None, min_score=None, request=None, limit=100):
+        """
+        Detections matching every given filter, newest run first, as dicts with
+        the run's image hash / source / request:
+        `label` exact label; `image_hash`; `region` (x1, y1, x2, y2) in
+        normalized [0, 1] coordinates, boxes intersecting it (R-tree);
+        `min_score`; `request` substring.
+        """
+        sql = (
+            "SELECT d.run_id, d.num, d.label, d.score, d.x1, d.y1, d.x2, d.y2,"
+            " r.image_hash, r.source, r.request, r.created_at"
+            " FROM detections d JOIN runs r ON r.id = d.run_id"
+        )
+        where, params = [], []
+        if region is not None:
+            sql += " JOIN detection_boxes b ON b.id = d.id"
+            rx1, ry1, rx2, ry2 = region
+            where.append("b.x1 <= ? AND b.x2 >= ? AND b.y1 <= ? AND b.y2 >= ?")
+            params += [rx2, rx1, ry2, ry1]
+        if label is not None:
+            where.append("d.label = ?")
+            params.append(label)
+        if image_hash is not None:
+            where.append("r.image_hash = ?")
+            params.append(image_hash)
+        if min_score is not None:
+            where.append("d.score >= ?")
+            params.append(min_score)
+        if request is not None:
+            where.append("r.request LIKE ?")
+            params.append(f"%{request}%")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY d.run_id DESC, d.num LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {
+                "run_id": run_id,
+                "num": num,
+                "label": label,
+                "score": score,
+                "box": [x1, y1, x2, y2],
+                "image_hash": image_hash,
+                "source": source,
+                "request": request,
+                "created_at": created_at,
+            }
+            for run_id, num, label, score, x1, y1, x2, y2, image_hash, source, request, created_at in rows
+        ]
+
+    def images_with(self, label, min_score=None, limit=100):
+        """[(image_hash, source, boxes)] of images with at least one validated `label` box."""
+        sql = (
+            "SELECT r.image_hash, MAX(r.source), COUNT(*) FROM detections d JOIN runs r ON r.id = d.run_id"
+            " WHERE d.label = ?"
+        )
+        params = [label]
+        if min_score is not None:
+            sql += " AND d.score >= ?"
+            params.append(min_score)
+        sql += " GROUP BY r.image_hash ORDER BY COUNT(*) DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def labels(self):
+        """{label: number of validated boxes} over all runs."""
+        with self._lock:
+            rows = self._conn.execute("SELECT label, COUNT(*) FROM detections GROUP BY label ORDER BY COUNT(*) DESC").fetchall()
+        return dict(rows)
+
+    def stats(self):
+        with self._lock:
+            runs, images = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT image_hash) FROM runs").fetchone()
+            boxes = self._conn.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+        return {"runs": runs, "images": images, "detections": boxes, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_RESULT_STORE = None
+_RESULT_STORE_LOCK = threading.Lock()
+
+
+def get_result_store():
+    """Process-wide result store configured from src.config (None when RESULT_STORE_PATH is unset)."""
+    global _RESULT_STORE
+    from src.config import RESULT_STORE_PATH, RESULT_STORE_MAX_AGE, RESULT_STORE_SHORT_CIRCUIT
+    if not RESULT_STORE_PATH:
+        return None
+    with _RESULT_STORE_LOCK:
+        if _RESULT_STORE is None:
+            _RESULT_STORE = ResultStore(RESULT_STORE_PATH, max_age=RESULT_STORE_MAX_AGE, short_circuit=RESULT_STORE_SHORT_CIRCUIT)
+        return _RESULT_STORE
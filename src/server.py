@@ -0,0 +1,357 @@
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse
+from src.config import (
+    MODEL_TYPES,
+    DEFAULT_DETECTOR,
+    CONFIDENCE_THRESHOLD,
+    CONCEPT_EXTRACTION_VLM,
+    CRITIQUE_VLM,
+    VALIDATION_VLM,
+    WORKER_QUEUE_SIZE,
+    WORKER_QUEUE_TIMEOUT,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_BATCH_WINDOW,
+    SERVER_MAX_BATCH_SIZE,
+    SERVER_MAX_IMAGE_BYTES,
+    SERVER_DRAIN_TIMEOUT,
+    SERVER_DRAIN_DELAY,
+    CASCADE_ENABLED,
+    CASCADE_PRESCREEN_DETECTOR,
+    get_device,
+)
+from src.dynamic_batcher import Coalescer, DynamicBatcher
+from src.metrics import get_metrics
+from src.model_registry import get_registry
+from src.pipeline import ObjectDetectionTool
+from src.vlm_tool import VLMTool
+from src.worker_pool import PoolFullError, WorkerPool
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = get_metrics().counter("http_detect_requests", "Detection API requests by HTTP status.", ["status"])
+HTTP_COALESCED = get_metrics().counter("http_detect_coalesced", "Detection API requests answered by an identical in-flight request.")
+
+
+class ServiceUnavailable(RuntimeError):
+    """The service is still warming up or is draining for shutdown."""
+
+
+class DetectionService:
+    """
+    Process-wide state behind the HTTP API. Every request gets a lightweight
+    ObjectDetectionTool over the shared weights and VLM client; detector
+    calls go through one DynamicBatcher so concurrent requests share forward
+    passes, and identical in-flight requests (same image bytes, request text
+    and critique flag) are run once through a Coalescer.
+    """
+    def __init__(
+        self,
+        model_id=MODEL_TYPES[DEFAULT_DETECTOR],
+        device=None,
+        workers=SERVER_WORKERS,
+        max_queue=WORKER_QUEUE_SIZE,
+        queue_timeout=WORKER_QUEUE_TIMEOUT,
+        batch_window=SERVER_BATCH_WINDOW,
+        max_batch_size=SERVER_MAX_BATCH_SIZE,
+    ):
+        self.model_id = model_id
+        self.device = device if device is not None else get_device()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        self.vlm_tool = None
+        self.tool = None
+        self.batcher = None
+        self.pool = None
+        self.coalescer = Coalescer()
+        self._weights = None
+        self._ready = threading.Event()
+        self._draining = False
+        self._inflight = 0
+        self._idle = threading.Condition()
+        self.startup_error = None
+
+    # ---- lifecycle ----
+    def start(self):
+        """Loads and warms the detector, then opens the service for requests."""
+        try:
+            self.vlm_tool = VLMTool(api_key=os.getenv("OPENAI_API_KEY"))
+            self._weights = get_registry().warm_up(self.model_id, self.device)
+            if CASCADE_ENABLED:
+                get_registry().warm_up(MODEL_TYPES[CASCADE_PRESCREEN_DETECTOR], self.device)
+            # the batcher's own tool runs detector forwards only and never re-enters the batcher (or the cascade)
+            self.batcher = DynamicBatcher(self._build_tool(batcher=None, cascade=False), max_batch_size=self.max_batch_size, window=self.batch_window)
+            # one reentrant tool serves every request; results are per-call DetectionResults
+            self.tool = self._build_tool(self.batcher)
+            self.pool = WorkerPool(max_workers=self.workers, max_queue=self.max_queue, timeout=self.queue_timeout)
+        except Exception as e:
+            self.startup_error = e
+            logger.exception("Detection service failed to start")
+            raise
+        self._ready.set()
+        logger.info("Detection service ready (%s on %s)", self.model_id, self.device)
+
+    def begin_drain(self):
+        """Stops admitting requests (/readyz turns 503) without waiting for in-flight ones."""
+        with self._idle:
+            if not self._draining:
+                logger.info("Draining: no longer admitting detection requests")
+            self._draining = True
+
+    def drain(self, timeout=SERVER_DRAIN_TIMEOUT):
+        """Stops admitting requests and waits up to `timeout` s for in-flight ones. Returns True when idle."""
+        self.begin_drain()
+        with self._idle:
+            idle = self._idle.wait_for(lambda: self._inflight == 0, timeout=timeout)
+        if not idle:
+            logger.warning("Shutting down with %d detection request(s) still running", self._inflight)
+        return idle
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+        if self.vlm_tool is not None:
+            self.vlm_tool.close()
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and not self._draining
+
+    # ---- requests ----
+    def _build_tool(self, batcher, cascade=None):
+        processor, model = self._weights
+        return ObjectDetectionTool(
+            model_id=self.model_id,
+            device=self.device,
+            vlm_tool=self.vlm_tool,
+            confidence_threshold=CONFIDENCE_THRESHOLD,
+            concept_detection_model=CONCEPT_EXTRACTION_VLM,
+            initial_critique_model=CRITIQUE_VLM,
+            final_critique_model=VALIDATION_VLM,
+            processor=processor,
+            model=model,
+            debug_dir=None,
+            batcher=batcher,
+            cascade=cascade,
+        )
+
+    def _run_job(self, image_bytes, user_request, critique):
+        return self.tool.detect_objects(image_bytes, user_request, do_critique=critique)
+
+    def _run_pooled(self, image_bytes, user_request, critique):
+        return self.pool.run(self._run_job, image_bytes, user_request, critique)
+
+    def detect(self, image_bytes, user_request, critique=True):
+        """
+        Runs the pipeline on encoded image bytes. Returns
+        (DetectionResult, coalesced); coalesced callers share one result. Raises
+        ServiceUnavailable before warm-up / while draining and PoolFullError
+        under overload.
+        """
+        with self._idle:
+            if not self.ready:
+                raise ServiceUnavailable("draining" if self._draining else "warming up")
+            self._inflight += 1
+        try:
+            key = (hashlib.sha256(image_bytes).hexdigest(), user_request, bool(critique))
+            return self.coalescer.run(key, self._run_pooled, image_bytes, user_request, critique)
+        finally:
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "draining": self._draining,
+            "inflight": self._inflight,
+            "worker_pool": self.pool.stats() if self.pool is not None else None,
+            "batcher": self.batcher.stats() if self.batcher is not None else None,
+            "coalescer": self.coalescer.stats(),
+        }
+
+
+def _encode_jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def detection_response(result, return_image=False):
+    """JSON body of `POST /v1/detect` for a DetectionResult."""
+    report = result.report
+    body = {
+        "trace_id": report.trace_id,
+        "outcome": result.outcome,
+        "text": result.text,
+        "queries": list(result.queries),
+        "cached": result.cached,
+        "objects": [
+            {"num": num, "label": str(label), "box": list(box), "score": score}
+            for num, label, box, score in result.with_scores()
+        ],
+        "timings": {
+            "total_ms": report.total_ms,
+            "stage_totals_ms": report.stage_totals(),
+            "stages": report.stages,
+        },
+    }
+    if return_image:
+        body["image"] = _encode_jpeg(result.image) if result.image is not None else None
+    return body
+
+
+def create_app(service=None, drain_timeout=SERVER_DRAIN_TIMEOUT):
+    """
+    FastAPI app exposing:
+      POST /v1/detect  multipart `image` + form `request` (`critique`, `return_image` optional)
+      GET  /healthz    process is up
+      GET  /readyz     model warmed up and not draining (503 otherwise)
+      POST /v1/drain   start draining (pre-stop hook): /readyz and new detections get 503
+      GET  /v1/stats   worker pool / batcher / coalescer counters
+      GET  /metrics    Prometheus text format
+    The model is warmed up in the background so /healthz answers immediately.
+    Draining has to start while the server still accepts connections, i.e.
+    from /v1/drain or the signal handling in `main`; by the time the lifespan
+    shutdown runs uvicorn has stopped listening.
+    """
+    service = service if service is not None else DetectionService()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        threading.Thread(target=service.start, name="service-warmup", daemon=True).start()
+        try:
+            yield
+        finally:
+            # normally already idle; off the event loop in case requests are still finishing
+            await asyncio.to_thread(service.drain, drain_timeout)
+            service.close()
+
+    app = FastAPI(title="Agentic Object Detection", lifespan=lifespan)
+    app.state.service = service
+
+    # sync handlers run in the threadpool; the pipeline itself runs in the WorkerPool
+    @app.post("/v1/detect")
+    def detect(
+        image: UploadFile = File(...),
+        request: str = Form(...),
+        critique: bool = Form(True),
+        return_image: bool = Form(False),
+    ):
+        image_bytes = image.file.read(SERVER_MAX_IMAGE_BYTES + 1)
+        if not image_bytes:
+            HTTP_REQUESTS.inc(status="400")
+            raise HTTPException(status_code=400, detail="Empty image upload")
+        if len(image_bytes) > SERVER_MAX_IMAGE_BYTES:
+            HTTP_REQUESTS.inc(status="413")
+            raise HTTPException(status_code=413, detail=f"Image larger than {SERVER_MAX_IMAGE_BYTES} bytes")
+        try:
+            result, coalesced = service.detect(image_bytes, request, critique=critique)
+        except ServiceUnavailable as e:
+            HTTP_REQUESTS.inc(status="503")
+            raise HTTPException(status_code=503, detail=f"Service unavailable: {e}", headers={"Retry-After": "5"})
+        except PoolFullError as e:
+            HTTP_REQUESTS.inc(status="503")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except (OSError, ValueError) as e:  # PIL cannot decode the upload
+            HTTP_REQUESTS.inc(status="400")
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        except Exception:
+            HTTP_REQUESTS.inc(status="500")
+            raise
+        HTTP_REQUESTS.inc(status="200")
+        if coalesced:
+            HTTP_COALESCED.inc()
+        body = detection_response(result, return_image=return_image)
+        body["coalesced"] = coalesced
+        return body
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    def readyz():
+        if service.ready:
+            return {"status": "ready"}
+        if service.startup_error is not None:
+            status = f"failed: {service.startup_error}"
+        else:
+            status = "draining" if service.stats()["draining"] else "warming up"
+        return JSONResponse({"status": status}, status_code=503)
+
+    @app.post("/v1/drain")
+    def drain():
+        service.begin_drain()
+        return {"status": "draining", "inflight": service.stats()["inflight"]}
+
+    @app.get("/v1/stats")
+    def stats():
+        return service.stats()
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+
+def main():
+    import argparse
+    import uvicorn
+
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="HTTP detection service")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    service = DetectionService()
+
+    class Server(uvicorn.Server):
+        """
+        On the first SIGTERM/SIGINT the service drains while uvicorn keeps
+        listening: /readyz reports 503 for at least SERVER_DRAIN_DELAY s (so
+        load balancers stop routing here) and in-flight requests finish,
+        then uvicorn shuts down. A second signal exits right away.
+        """
+        draining = None
+
+        def handle_exit(self, sig, frame):
+            if self.draining is not None:
+                return super().handle_exit(sig, frame)
+            self.draining = threading.Thread(target=self._drain_then_exit, args=(sig, frame), name="service-drain", daemon=True)
+            self.draining.start()
+
+        def _drain_then_exit(self, sig, frame):
+            service.begin_drain()
+            time.sleep(SERVER_DRAIN_DELAY)
+            service.drain(timeout=SERVER_DRAIN_TIMEOUT)
+            super().handle_exit(sig, frame)
+
+    config = uvicorn.Config(create_app(service), host=args.host, port=args.port, timeout_graceful_shutdown=int(SERVER_DRAIN_TIMEOUT))
+    Server(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import base64
+import threading
+
+import numpy as np
+import torch
+
+from src.vlm_cache import MemoryCache, SQLiteCache
+
+
+class TextEmbeddingCache:
+    """
+    Cache of detector text-query embeddings keyed by (model_id, backend, prompt).
+    A memory LRU of CPU float32 tensors sits in front of an optional SQLite
+    tier, so frequent concepts survive restarts and cost nothing to encode.
+    """
+    def __init__(self, memory_entries=4096, disk=None):
+        self.memory = MemoryCache(max_entries=memory_entries)
+        self.disk = disk
+
+    @staticmethod
+    def _key(model_id, backend, prompt):
+        return f"{model_id}|{backend}|{prompt}"
+
+    def get_many(self, model_id, backend, prompts):
+        """{prompt: tensor} for the prompts found in either tier."""
+        found = {}
+        for prompt in prompts:
+            key = self._key(model_id, backend, prompt)
+            embedding = self.memory.get(key)
+            if embedding is None and self.disk is not None:
+                stored = self.disk.get(key)
+                if stored is not None:
+                    embedding = torch.from_numpy(np.frombuffer(base64.b64decode(stored), dtype=np.float32).copy())
+                    self.memory.set(key, embedding)
+            if embedding is not None:
+                found[prompt] = embedding
+        return found
+
+    def put_many(self, model_id, backend, embeddings):
+        """Stores `{prompt: tensor [dim]}` in both tiers."""
+        for prompt, embedding in embeddings.items():
+            key = self._key(model_id, backend, prompt)
+            embedding = embedding.detach().to("cpu", torch.float32).contiguous()
+            self.memory.set(key, embedding)
+            if self.disk is not None:
+                self.disk.set(key, base64.b64encode(embedding.numpy().tobytes()).decode("ascii"))
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+_TEXT_CACHE = None
+_TEXT_CACHE_LOCK = threading.Lock()
+
+
+def get_text_cache():
+    """Process-wide text embedding cache configured from src.config (None when disabled)."""
+    global _TEXT_CACHE
+    from src.config import (
+        TEXT_EMBED_CACHE_ENABLED,
+        TEXT_EMBED_CACHE_PATH,
+        TEXT_EMBED_CACHE_MAX_BYTES,
+        TEXT_EMBED_CACHE_MEMORY_ENTRIES,
+    )
+    if not TEXT_EMBED_CACHE_ENABLED:
+        return None
+    with _TEXT_CACHE_LOCK:
+        if _TEXT_CACHE is None:
+            disk = SQLiteCache(TEXT_EMBED_CACHE_PATH, max_bytes=TEXT_EMBED_CACHE_MAX_BYTES) if TEXT_EMBED_CACHE_PATH else None
+            _TEXT_CACHE = TextEmbeddingCache(memory_entries=TEXT_EMBED_CACHE_MEMORY_ENTRIES, disk=disk)
+        return _TEXT_CACHE
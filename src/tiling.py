@@ -0,0 +1,180 @@
+import numpy as np
+
+from PIL import Image
+from src.postprocess import postprocess
+from src.tracing import stage
+from src.utils import load_image
+from src.config import (
+    TILE_SIZE,
+    TILE_OVERLAP,
+    TILE_MIN_IMAGE_SIDE,
+    TILE_PRESCREEN_SIZE,
+    TILE_PRESCREEN_THRESHOLD,
+    TILE_FLAT_STD,
+    TILE_BATCH_SIZE,
+    TILE_MAX_DETECTIONS,
+)
+
+EDGE_EPS = 2  # px; a box this close to an interior tile edge is treated as cut by it
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """
+    (x1, y1, x2, y2) tiles of at most `tile_size` px covering a (width, height)
+    image. Neighbours overlap by at least `overlap` px and the last row/column
+    is aligned to the image edge, so every tile has the full size when the
+    image is larger than one tile.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, tile_size - overlap))
+        positions.append(length - tile_size)
+        return positions
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height)) for y in starts(height) for x in starts(width)]
+
+
+def _intersects(tiles, boxes):
+    """[T] bool: whether each tile overlaps any of `boxes` [N, 4]."""
+    tiles = np.asarray(tiles, dtype=np.float32).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(len(tiles), dtype=bool)
+    overlap_x = (tiles[:, None, 0] < boxes[None, :, 2]) & (boxes[None, :, 0] < tiles[:, None, 2])
+    overlap_y = (tiles[:, None, 1] < boxes[None, :, 3]) & (boxes[None, :, 1] < tiles[:, None, 3])
+    return (overlap_x & overlap_y).any(axis=1)
+
+
+def _cut_by_interior_edge(boxes, tile, image_size):
+    """[N] bool: boxes touching a tile edge that is not also an image edge."""
+    x1, y1, x2, y2 = tile
+    width, height = image_size
+    return (
+        ((boxes[:, 0] <= x1 + EDGE_EPS) & (x1 > 0))
+        | ((boxes[:, 1] <= y1 + EDGE_EPS) & (y1 > 0))
+        | ((boxes[:, 2] >= x2 - EDGE_EPS) & (x2 < width))
+        | ((boxes[:, 3] >= y2 - EDGE_EPS) & (y2 < height))
+    )
+
+
+class TiledDetector:
+    """
+    Sliced inference for images much larger than the detector input.
+
+    1. Low-res pass: the image is shrunk to `prescreen_size` and run once. Its
+       confident boxes cover objects large enough to survive the downscale;
+       its weak boxes (>= `prescreen_threshold`) mark the regions worth a
+       closer look.
+    2. Tiles of `tile_size` with `overlap` are skipped when they are flat
+       (thumbnail std < `flat_std`) or, with prescreening on, touch no weak
+       box. The rest run through `tool.detect_batch` `batch_size` at a time,
+       so memory is bounded by one batch of tiles, not by the image.
+    3. Tile boxes are shifted to image coordinates. Boxes cut by an interior
+       tile edge are dropped: an object smaller than `overlap` is whole in a
+       neighbouring tile, and a larger one is covered by the low-res pass.
+       Everything is merged with the usual NMS (src/postprocess.py).
+    """
+    def __init__(
+        self,
+        tool,
+        tile_size=TILE_SIZE,
+        overlap=TILE_OVERLAP,
+        min_image_side=TILE_MIN_IMAGE_SIDE,
+        prescreen_size=TILE_PRESCREEN_SIZE,
+        prescreen_threshold=TILE_PRESCREEN_THRESHOLD,
+        flat_std=TILE_FLAT_STD,
+        batch_size=TILE_BATCH_SIZE,
+        max_detections=TILE_MAX_DETECTIONS,
+    ):
+        if not 0 <= overlap < tile_size:
+            raise ValueError(f"Tile overlap must be in [0, tile_size), got {overlap} for tile_size {tile_size}")
+        self.tool = tool
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_image_side = min_image_side
+        self.prescreen_size = prescreen_size
+        self.prescreen_threshold = prescreen_threshold
+        self.flat_std = flat_std
+        self.batch_size = batch_size
+        self.max_detections = max_detections
+
+    def should_tile(self, img):
+        return max(img.size) > max(self.min_image_side, self.tile_size)
+
+    def _low_res_pass(self, img, query_list):
+        """(thumbnail, (sx, sy) thumbnail -> full res, raw scores [N], full-res boxes [N, 4], labels)."""
+        width, height = img.size
+        ratio = min(1.0, self.prescreen_size / max(width, height))
+        thumb = img
+        if ratio < 1.0:
+            # reducing_gap downsamples by an integer factor first, without a full-size copy
+            thumb = img.resize((max(1, round(width * ratio)), max(1, round(height * ratio))), Image.BILINEAR, reducing_gap=2.0)
+        scale = (width / thumb.size[0], height / thumb.size[1])
+        encoding = self.tool._encode_image(thumb, use_cache=False)
+        scores, boxes, labels = self.tool._detect_with_encoding(encoding, query_list, thumb.size)
+        scores = np.asarray(scores.cpu() if hasattr(scores, "cpu") else scores, dtype=np.float32).reshape(-1)
+        boxes = np.asarray(boxes.cpu() if hasattr(boxes, "cpu") else boxes, dtype=np.float32).reshape(-1, 4)
+        boxes = boxes * np.array([scale[0], scale[1], scale[0], scale[1]], dtype=np.float32)
+        return thumb, scale, scores, boxes, list(labels)
+
+    def _select_tiles(self, tiles, thumb, scale, scores, boxes):
+        keep = np.ones(len(tiles), dtype=bool)
+        if self.flat_std is not None:
+            gray = np.asarray(thumb.convert("L"), dtype=np.float32)
+            sx, sy = scale
+            for i, (x1, y1, x2, y2) in enumerate(tiles):
+                tx1, ty1 = int(x1 / sx), int(y1 / sy)
+                region = gray[ty1:max(ty1 + 1, int(y2 / sy)), tx1:max(tx1 + 1, int(x2 / sx))]
+                keep[i] = region.std() >= self.flat_std
+        if self.prescreen_threshold is not None:
+            margin = self.overlap / 2
+            candidates = boxes[scores >= self.prescreen_threshold] + np.array([-margin, -margin, margin, margin], dtype=np.float32)
+            keep &= _intersects(tiles, candidates)
+        return [tile for tile, kept in zip(tiles, keep) if kept]
+
+    def detect(self, image, query_list):
+        """Detections for the whole image in full-resolution pixel coordinates."""
+        img = load_image(image)
+        queries = list(dict.fromkeys(query_list))
+        if not queries:
+            return postprocess([], [], [], self.tool.confidence_threshold)
+
+        with stage("tile_prescreen", size=f"{img.size[0]}x{img.size[1]}") as span:
+            thumb, scale, scores, boxes, labels = self._low_res_pass(img, queries)
+            tiles = tile_grid(img.size[0], img.size[1], self.tile_size, self.overlap)
+            selected = self._select_tiles(tiles, thumb, scale, scores, boxes)
+            span.set_attribute("tiles", len(tiles))
+            span.set_attribute("skipped", len(tiles) - len(selected))
+
+        # large objects come from the low-res pass, small ones from the tiles
+        confident = scores >= self.tool.confidence_threshold
+        all_scores = [scores[confident]]
+        all_boxes = [boxes[confident]]
+        all_labels = [label for label, keep in zip(labels, confident) if keep]
+
+        with stage("tile_forward", tiles=len(selected), batch_size=self.batch_size):
+            for start in range(0, len(selected), self.batch_size):
+                batch = selected[start:start + self.batch_size]
+                # crops are made per batch, so at most `batch_size` tiles are alive at once
+                results = self.tool.detect_batch([(img.crop(tile), queries) for tile in batch], max_batch_size=self.batch_size)
+                for tile, detections in zip(batch, results):
+                    if not len(detections):
+                        continue
+                    tile_boxes = detections.boxes + np.array([tile[0], tile[1], tile[0], tile[1]], dtype=np.float32)
+                    keep = ~_cut_by_interior_edge(tile_boxes, tile, img.size)
+                    all_scores.append(detections.scores[keep])
+                    all_boxes.append(tile_boxes[keep])
+                    all_labels += [label for label, kept in zip(detections.labels, keep) if kept]
+
+        with stage("tile_merge") as span:
+            detections = postprocess(
+                np.concatenate(all_scores),
+                np.concatenate(all_boxes),
+                all_labels,
+                self.tool.confidence_threshold,
+                image_size=img.size,
+                max_per_label=self.max_detections,
+                max_detections=self.max_detections,
+            )
+            span.set_attribute("boxes", len(detections))
+        return detections
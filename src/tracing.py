@@ -0,0 +1,232 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from src.metrics import STAGE_SECONDS
+from src.config import TRACE_EXPORT, TRACE_SERVICE_NAME
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed pipeline step. Ids, timestamps and attributes follow the
+    OpenTelemetry span model so traces can be exported as OTLP JSON.
+    """
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def end_ns(self):
+        return self.start_ns + int((self.duration or 0.0) * 1e9)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NullSpan:
+    """Stand-in yielded by `stage()` when no trace is active."""
+    def set_attribute(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": value if isinstance(value, str) else json.dumps(value, default=str)}
+    return {"key": key, "value": typed}
+
+
+class Trace:
+    """Spans recorded for one pipeline run (or one benchmark/batch request)."""
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+
+    def durations(self):
+        """Total seconds per stage name (a stage may run more than once, e.g. detect)."""
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def to_otlp(self):
+        """OTLP/JSON `ExportTraceServiceRequest` body for this trace."""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "src.tracing"}, "spans": [span.to_otlp() for span in self.spans]}],
+        }]}
+
+
+class RunReport:
+    """
+    Per-run summary returned next to `final_img`/`final_text`:
+    stage timings (ms, in start order), the attributes each stage recorded
+    and the final `[(num, label, [x1,y1,x2,y2]), ...]` objects with their
+    detector scores.
+    """
+    def __init__(self, trace_id, outcome, total_ms, stages, objects=None, scores=None):
+        self.trace_id = trace_id
+        self.outcome = outcome
+        self.total_ms = total_ms
+        self.stages = stages
+        self.objects = list(objects or [])
+        self.scores = [float(score) for score in scores or []]
+
+    @classmethod
+    def from_trace(cls, trace, root, outcome, objects=None, scores=None):
+        """Builds the report from the spans nested under `root`."""
+        members = {root.span_id}
+        for span in sorted(trace.spans, key=lambda s: s.start):
+            if span.parent_id in members:
+                members.add(span.span_id)
+        stages = [
+            {
+                "name": span.name,
+                "start_ms": round((span.start - root.start) * 1000, 3),
+                "duration_ms": round(span.duration * 1000, 3),
+                "status": span.status,
+                "attributes": dict(span.attributes),
+            }
+            for span in sorted(trace.spans, key=lambda s: s.start)
+            if span is not root and span.span_id in members
+        ]
+        return cls(trace.trace_id, outcome, round(root.duration * 1000, 3), stages, objects, scores)
+
+    def stage_totals(self):
+        """Total ms per stage name."""
+        totals = {}
+        for entry in self.stages:
+            totals[entry["name"]] = round(totals.get(entry["name"], 0.0) + entry["duration_ms"], 3)
+        return totals
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "outcome": self.outcome,
+            "total_ms": self.total_ms,
+            "stage_totals_ms": self.stage_totals(),
+            "stages": self.stages,
+            "objects": [[num, str(label), [float(v) for v in box]] for num, label, box in self.objects],
+            "scores": self.scores,
+        }
+
+
+def _export_otel(trace):
+    """Replays finished spans into the OpenTelemetry SDK, if one is configured."""
+    try:
+        from opentelemetry import trace as otel_trace
+    except ImportError as e:
+        raise ImportError("TRACE_EXPORT='otel' requires opentelemetry-api (pip install opentelemetry-sdk)") from e
+    tracer = otel_trace.get_tracer("src.tracing")
+    otel_spans = {}
+    for span in sorted(trace.spans, key=lambda s: s.start):
+        parent = otel_spans.get(span.parent_id)
+        context = otel_trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = tracer.start_span(span.name, context=context, attributes=span.attributes, start_time=span.start_ns)
+        otel_spans[span.span_id] = otel_span
+        if span.status == "error":
+            otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR))
+        otel_span.end(end_time=span.end_ns)
+
+
+def export_trace(trace, target=TRACE_EXPORT):
+    """
+    Ships a finished trace: `target` is None (off), "otel" (the global
+    OpenTelemetry tracer provider) or a file path (one OTLP/JSON line per trace).
+    """
+    if target is None or not trace.spans:
+        return
+    if target == "otel":
+        _export_otel(trace)
+        return
+    line = json.dumps(trace.to_otlp(), default=str)
+    with _export_lock:
+        with open(target, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def start_trace():
+    """
+    Collects every `stage()` entered in this context into a Trace.
+    Nested calls join the active trace; the outermost one exports it.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        export_trace(trace)
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Times a pipeline stage into the `pipeline_stage_seconds` histogram and,
+    when a trace is active, records it as a child span of the enclosing stage.
+    Yields the span so callers can attach attributes (a no-op without a trace).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        started = time.perf_counter()
+        try:
+            yield _NULL_SPAN
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+        return
+
+    parent = _current_span.get()
+    span = Span(name, trace.trace_id, parent.span_id if parent is not None else None, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException:
+        span.status = "error"
+        raise
+    finally:
+        _current_span.reset(token)
+        span.duration = time.perf_counter() - span.start
+        trace.spans.append(span)
+        STAGE_SECONDS.observe(span.duration, stage=name)
@@ -1,102 +1,81 @@
-import cv2
 import base64
+import io
+import logging
 import os
 import numpy as np
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 
+logger = logging.getLogger(__name__)
 
-def encode_image(image_path):
+
+def image_to_jpeg_bytes(image, quality=95):
+    """Encodes a PIL image (or RGB ndarray) to JPEG bytes in memory."""
+    buffer = io.BytesIO()
+    load_image(image).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+def encode_image(image):
+    """
+    Base64 for the VLM image payload.
+    A path is sent as its file bytes; in-memory images are JPEG-encoded without touching disk.
+    """
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
+        if isinstance(image, str):
+            with open(image, "rb") as image_file:
+                return base64.b64encode(image_file.read()).decode("utf-8")
+        return base64.b64encode(image_to_jpeg_bytes(image)).decode("utf-8")
     except Exception as e:
-        print(f"Error encoding image: {e}")
+        logger.warning("Error encoding image: %s", e)
         return None
 
-def draw_arrows_and_numbers(image_path, detected_objects):
+def draw_arrows_and_numbers(image, detected_objects, output_path=None):
     """
     Draws arrows and numbers on an image to label detected objects.
+    `image` is a path, PIL image, RGB ndarray or encoded bytes; the labeled
+    image is returned as a PIL image. It is also written to `output_path`
+    when one is given (debug sink).
+    Rendering is done by src/render.py (ROI-only blending, collision-aware numbers).
     """
-    img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    used_positions = []
-
-    # Pad the image with a white border
-    top, bottom, left, right = 50, 50, 50, 50
-    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=[255, 255, 255])
-
-    height, width, _ = img.shape
-
-    for i, (num, obj, box) in enumerate(detected_objects):
-        x1, y1, x2, y2 = map(int, box)
-        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2  # Center of the bounding box
-
-        # Adjust coordinates for padded image
-        x1 += left
-        y1 += top
-        x2 += left
-        y2 += top
-        cx += left
-        cy += top
-
-        # Determine arrow direction towards the nearest border
-        distances = {'top': cy, 'bottom': height - cy, 'left': cx, 'right': width - cx}
-        direction = min(distances, key=distances.get)
-
-        if direction == 'top':
-            arrow_end = (cx, top)
-            text_position = (cx - 10, top - 10)
-        elif direction == 'bottom':
-            arrow_end = (cx, height - bottom)
-            text_position = (cx - 10, height - 5)
-        elif direction == 'left':
-            arrow_end = (left, cy)
-            text_position = (left - 30, cy + 5)
-        else:
-            arrow_end = (width - right, cy)
-            text_position = (width - 30, cy + 5)
-
-        # Draw the dashed arrow from the object center to the border
-        color = (0, 0, 0)  # Black color for all arrows
-        line_type = cv2.LINE_4
-        cv2.arrowedLine(img, (cx, cy), arrow_end, color, 2, tipLength=0.3)
-
-        # Draw a semi-transparent rectangle behind the text
-        overlay = img.copy()
-        cv2.rectangle(overlay, (text_position[0] - 5, text_position[1] - 20), (text_position[0] + 30, text_position[1] + 5), (0, 0, 0), -1)
-        alpha = 0.5
-        cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
-
-        # Draw the number at the border with black text
-        cv2.putText(img, str(num), text_position, font, 0.5, color, 2)
-
-    # Create dynamic output path based on input image path
-    base_name = os.path.basename(image_path)
-    name_part, ext_part = os.path.splitext(base_name)
-    output_filename = f"{name_part}_intermediate{ext_part}"
-    
-    # Correctly construct the path to save in the project's output/intermediate directory
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    output_dir = os.path.join(project_root, "output", "intermediate")
-    os.makedirs(output_dir, exist_ok=True)
-    labeled_image_path = os.path.join(output_dir, output_filename)
-    
-    cv2.imwrite(labeled_image_path, img)
-    return labeled_image_path
+    from src.render import render_arrows  # cv2 is only imported once something is drawn
+    labeled_image = Image.fromarray(render_arrows(load_image(image), detected_objects))
+    if output_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        labeled_image.save(output_path)
+    return labeled_image
 
     
 def load_image(image_input):
+    """
+    Decodes any supported input to an RGB PIL image.
+    RGB PIL images are returned as-is (no copy), so callers must not draw on the result.
+    """
     if isinstance(image_input, str):  # Path
         if not os.path.exists(image_input):
             raise FileNotFoundError(f"Image file not found: {image_input}")
         return Image.open(image_input).convert("RGB")
     elif isinstance(image_input, Image.Image):  # PIL
-        return image_input.convert("RGB")
+        return image_input if image_input.mode == "RGB" else image_input.convert("RGB")
     elif isinstance(image_input, np.ndarray):  # Numpy
         return Image.fromarray(image_input).convert("RGB")
+    elif isinstance(image_input, (bytes, bytearray, memoryview)):  # encoded bytes (JPEG/PNG ...)
+        return Image.open(io.BytesIO(image_input)).convert("RGB")
     else:
-        raise ValueError("Unsupported image input type. Please provide a file path, PIL Image, or numpy array")
+        raise ValueError("Unsupported image input type. Please provide a file path, PIL Image, numpy array or encoded bytes")
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two [N, 4] / [M, 4] xyxy arrays."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
 
 def bboxes_to_points(bboxes):
     all_points = []
@@ -124,41 +103,22 @@ def draw_rounded_rectangle(draw, box, radius, outline, width):
     x1, y1, x2, y2 = box
     draw.rectangle([x1 + radius, y1, x2 - radius, y2], outline=outline, width=width)
 
-def draw_bounding_boxes(image_path, filtered_objects):
-    # Open the image
-    final_img = Image.open(image_path).convert("RGB")
-    draw = ImageDraw.Draw(final_img)
-    font = ImageFont.truetype("arial.ttf", 20)
-
-    for num, lbl, box in filtered_objects:
-        x1, y1, x2, y2 = box
-        box_width = x2 - x1
-        box_height = y2 - y1
-
-        # Define styles
-        outline_color = "red"
-        outline_width = 3
-        radius = 10  # Radius for rounded corners
-        label_fill_color = (255, 0, 0, 128)  # Semi-transparent red
-        text_color = "white"
-        padding = 5
-
-        # Draw rounded rectangle for bounding box
-        draw.rounded_rectangle([x1, y1, x2, y2], radius=radius, outline=outline_color, width=outline_width)
-
-        # Calculate text size
-        left, top, right, bottom = draw.textbbox((0, 0), lbl, font=font)
-        text_width = right - left
-        text_height = bottom - top
-
-        # Position for label box
-        label_box = [x1, y1 - text_height - 2 * padding, x1 + text_width + 2 * padding, y1]
-
-        # Draw label box
-        draw.rectangle(label_box, fill=label_fill_color)
+def draw_bounding_boxes(image, filtered_objects):
+    """
+    Final annotation: rounded red boxes with label captions, returned as a new
+    PIL image (the decoded input is shared with the other pipeline stages and
+    is not modified). Fonts and label glyphs are cached by src/render.py.
+    """
+    from src.render import render_boxes
+    return Image.fromarray(render_boxes(load_image(image), filtered_objects))
 
-        # Draw text
-        text_position = (x1 + padding, y1 - text_height - padding)
-        draw.text(text_position, lbl, fill=text_color, font=font)
 
-    return final_img
\ No newline at end of file
+def save_bounding_boxes(image, filtered_objects, output_path):
+    """
+    Renders the final boxes and writes them to `output_path`.
+    Module-level so it can run in a process pool.
+    """
+    final_img = draw_bounding_boxes(image, filtered_objects)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    final_img.save(output_path)
+    return output_path
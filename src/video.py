@@ -0,0 +1,290 @@
+import logging
+import time
+import cv2
+import numpy as np
+
+from PIL import Image
+
+from src.vlm_tool import VLMError
+from src.utils import iou_matrix
+from src.config import (
+    VIDEO_DETECT_EVERY,
+    VIDEO_REFRESH_EVERY,
+    VIDEO_SCENE_CHANGE_THRESHOLD,
+    VIDEO_MIN_REFRESH_GAP,
+    TRACKER_IOU_THRESHOLD,
+    TRACKER_MAX_MISSES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Track:
+    """
+    One tracked object. Position is smoothed with an alpha-beta filter
+    (the steady-state form of a constant-velocity Kalman filter), so the box
+    can be extrapolated on frames where the detector does not run.
+    """
+    def __init__(self, track_id, label, box, frame_index):
+        self.track_id = track_id
+        self.label = label
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)  # px / frame for x1, y1, x2, y2
+        self.hits = 1
+        self.misses = 0
+        self.last_update = frame_index
+
+    def predict(self):
+        self.box = self.box + self.velocity
+
+    def update(self, box, frame_index, alpha=0.6, beta=0.2):
+        residual = np.asarray(box, dtype=np.float32) - self.box
+        dt = max(1, frame_index - self.last_update)
+        self.box = self.box + alpha * residual
+        self.velocity = self.velocity + beta * residual / dt
+        self.hits += 1
+        self.misses = 0
+        self.last_update = frame_index
+
+
+class IoUTracker:
+    """
+    Greedy IoU tracker: detections are matched to predicted track boxes of
+    the same label in descending IoU order. Unmatched detections start new
+    tracks; tracks unmatched for `max_misses` detector runs are dropped.
+    """
+    def __init__(self, iou_threshold=TRACKER_IOU_THRESHOLD, max_misses=TRACKER_MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self._next_id = 1
+
+    def predict(self):
+        for track in self.tracks:
+            track.predict()
+
+    def update(self, detections, frame_index):
+        """`detections` = [(num, label, box), ...] for the current frame."""
+        self.predict()
+        matched_tracks, matched_dets = set(), set()
+        if self.tracks and detections:
+            ious = iou_matrix([t.box for t in self.tracks], [box for _, _, box in detections])
+            same_label = np.array([[str(t.label) == str(lbl) for _, lbl, _ in detections] for t in self.tracks])
+            ious = np.where(same_label, ious, 0.0)
+            for flat in np.argsort(-ious, axis=None):
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or d in matched_dets:
+                    continue
+                self.tracks[t].update(detections[d][2], frame_index)
+                matched_tracks.add(t)
+                matched_dets.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d, (_, label, box) in enumerate(detections):
+            if d not in matched_dets:
+                self.tracks.append(Track(self._next_id, label, box, frame_index))
+                self._next_id += 1
+        return self.active()
+
+    def active(self):
+        """[(track_id, label, [x1,y1,x2,y2]), ...] for tracks that are currently visible."""
+        return [(t.track_id, t.label, t.box.tolist()) for t in self.tracks if t.misses == 0 or t.hits > 1]
+
+
+class FrameResult:
+    """Per-frame output of VideoDetector.stream()."""
+    def __init__(self, frame_index, timestamp, frame, tracks, detected, refreshed, queries):
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+        self.frame = frame          # RGB ndarray
+        self.tracks = tracks        # [(track_id, label, box), ...]
+        self.detected = detected    # detector ran on this frame
+        self.refreshed = refreshed  # VLM query extraction/validation ran on this frame
+        self.queries = queries
+
+
+def _frame_histogram(frame):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [32, 32], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+class VideoDetector:
+    """
+    Streaming mode for video files and camera/RTSP streams.
+
+    The VLM stages (concept extraction, critique, validation) run only on
+    refresh frames: the first frame, every `refresh_every` frames and on
+    scene changes at least `min_refresh_gap` frames after the last refresh
+    (so fast pans or flashing content cannot fire a refresh per frame). The
+    refined query list is reused in between, the detector runs every
+    `detect_every`-th frame and an IoUTracker carries object identities
+    across the frames in between.
+    """
+    def __init__(
+        self,
+        tool,
+        user_request,
+        detect_every=VIDEO_DETECT_EVERY,
+        refresh_every=VIDEO_REFRESH_EVERY,
+        scene_change_threshold=VIDEO_SCENE_CHANGE_THRESHOLD,
+        min_refresh_gap=VIDEO_MIN_REFRESH_GAP,
+        do_critique=True,
+        tracker=None,
+    ):
+        self.tool = tool
+        self.user_request = user_request
+        self.detect_every = detect_every
+        self.refresh_every = refresh_every
+        self.scene_change_threshold = scene_change_threshold
+        self.min_refresh_gap = min_refresh_gap
+        self.do_critique = do_critique
+        self.tracker = tracker if tracker is not None else IoUTracker()
+        self.queries = []
+        self.source_fps = None  # frame rate reported by the source opened in stream()
+        self._reference_hist = None
+        self._last_refresh = None
+
+    def _needs_refresh(self, frame_index, frame):
+        if self._last_refresh is None:
+            return True
+        since_refresh = frame_index - self._last_refresh
+        if self.refresh_every and since_refresh >= self.refresh_every:
+            return True
+        if self.min_refresh_gap and since_refresh < self.min_refresh_gap:
+            return False
+        if self.scene_change_threshold is not None and self._reference_hist is not None:
+            similarity = cv2.compareHist(self._reference_hist, _frame_histogram(frame), cv2.HISTCMP_CORREL)
+            return similarity < self.scene_change_threshold
+        return False
+
+    def _refresh(self, frame_index, frame):
+        """
+        Runs the VLM stages on one frame and keeps the validated query list.
+        Returns the detections of this frame.
+        """
+        self._last_refresh = frame_index
+        self._reference_hist = _frame_histogram(frame)
+        img = Image.fromarray(frame)
+        tool = self.tool
+
+        try:
+            queries = tool.vlm_tool.extract_objects_from_request(img, self.user_request, model=tool.concept_detection_model)
+        except VLMError as e:
+            logger.warning("Concept extraction failed, keeping previous queries: %s", e)
+            queries = None
+        if not queries:
+            return tool.detect(img, self.queries, use_cache=False) if self.queries else []
+
+        detections, labeled_image, scores = tool._run_detector(img, queries, with_scores=True, use_cache=False)
+        # critique / validation follow the tool's stage policy (src/policy.py), as in a single run
+        decision = tool.policy.critique(queries, detections, scores, tool.initial_critique_model) if self.do_critique else None
+        if decision is not None and not decision.skipped:
+            current_labels = ",".join(set([str(lbl) for _, lbl, _ in detections]))
+            refined_query_list = tool._critique_and_refine_query(
+                user_request=self.user_request,
+                original_concepts=current_labels,
+                labeled_image=labeled_image,
+                objects_detected=current_labels,
+                model=decision.model,
+            )
+            if refined_query_list and set(refined_query_list) != set(queries):
+                queries = refined_query_list
+                detections, labeled_image, scores = tool._run_detector(img, queries, with_scores=True, use_cache=False)
+
+        decision = tool.policy.validation(queries, detections, scores, tool.final_critique_model)
+        if decision.skipped:
+            self.queries = queries
+            return detections
+        valid_numbers = tool._validate_bboxes_with_llm(self.user_request, labeled_image, model=decision.model)
+        validated = tool._apply_validation(detections, valid_numbers)
+        if valid_numbers:
+            # 검증을 통과한 box의 detector label만 이후 프레임의 쿼리로 유지
+            kept_nums = {n for n, _, _ in validated}
+            kept_labels = {str(lbl) for n, lbl, _ in detections if n in kept_nums}
+            queries = [q for q in queries if any(q in label for label in kept_labels)] or queries
+            detections = [d for d in detections if d[0] in kept_nums]
+        self.queries = queries
+        return detections
+
+    def stream(self, source):
+        """
+        Generator of FrameResult for every frame of `source`
+        (a video path, stream URL or camera index).
+        """
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise IOError(f"Could not open video source: {source}")
+        self.source_fps = capture.get(cv2.CAP_PROP_FPS) or None
+        try:
+            frame_index = 0
+            while True:
+                ok, bgr = capture.read()
+                if not ok:
+                    break
+                frame = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+                refreshed = self._needs_refresh(frame_index, frame)
+                detected = refreshed or frame_index % self.detect_every == 0
+                if refreshed:
+                    tracks = self.tracker.update(self._refresh(frame_index, frame), frame_index)
+                elif detected:
+                    detections = self.tool.detect(frame, self.queries, use_cache=False) if self.queries else []
+                    tracks = self.tracker.update(detections, frame_index)
+                else:
+                    self.tracker.predict()
+                    tracks = self.tracker.active()
+
+                yield FrameResult(frame_index, timestamp, frame, tracks, detected, refreshed, list(self.queries))
+                frame_index += 1
+        finally:
+            capture.release()
+
+    def run(self, source, output_path=None, fps=None):
+        """
+        Consumes the stream, optionally writing an annotated video.
+        Returns a small summary (frames, detector runs, VLM refreshes, fps).
+        """
+        writer = None
+        frames = detector_runs = refreshes = 0
+        started = time.perf_counter()
+        try:
+            for result in self.stream(source):
+                frames += 1
+                detector_runs += int(result.detected)
+                refreshes += int(result.refreshed)
+                if output_path is not None:
+                    annotated = annotate_frame(result.frame, result.tracks)
+                    if writer is None:
+                        height, width = annotated.shape[:2]
+                        # stream() has opened the source by now; live streams may not report a rate
+                        fps = fps or self.source_fps or 25.0
+                        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+                    writer.write(cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR))
+        finally:
+            if writer is not None:
+                writer.release()
+        elapsed = time.perf_counter() - started
+        return {
+            "frames": frames,
+            "detector_runs": detector_runs,
+            "vlm_refreshes": refreshes,
+            "fps": frames / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def annotate_frame(frame, tracks):
+    """Draws tracked boxes with `#id label` captions on a copy of an RGB frame."""
+    annotated = frame.copy()
+    for track_id, label, box in tracks:
+        x1, y1, x2, y2 = map(int, box)
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        cv2.putText(annotated, f"#{track_id} {label}", (x1, max(15, y1 - 5)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+    return annotated
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def make_cache_key(model, messages, response_format=None, temperature=None, max_tokens=None):
+    """
+    Content address of a VLM call. Images are sent inline as base64 data URLs,
+    so hashing the messages also hashes the image bytes.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "response_format": response_format,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-memory LRU tier with optional TTL."""
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """
+    On-disk tier backed by a single SQLite file.
+    Expired rows are dropped on read; when the stored bytes exceed
+    `max_bytes` the least recently accessed rows are evicted. The stored
+    byte total is summed once at open and kept up to date on every write.
+    """
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created_at)")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            total = self._bytes
+            with self._conn:
+                previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now),
+                )
+                total += size - (previous[0] if previous is not None else 0)
+                total = self._evict(total)
+            # only after the commit, so a failed write leaves the total untouched
+            self._bytes = total
+
+    def _evict(self, total):
+        """Drops expired, then least recently accessed rows; returns the new byte total."""
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            expired = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?", (cutoff,)).fetchone()[0]
+            if expired:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+                total -= expired
+        if total <= self.max_bytes:
+            return total
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        return total
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self._bytes
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    Memory tier in front of an optional disk tier. Disk hits are promoted
+    to memory. Any object with get(key)/set(key, value) can serve as a tier.
+    `aget`/`aset` are the coroutine versions for event-loop callers: the
+    memory tier is answered inline, the disk tier runs in a worker thread.
+    """
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else MemoryCache()
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def aget(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def aset(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses, "memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+def build_default_cache():
+    """Memory + SQLite cache configured from src.config."""
+    from src.config import (
+        VLM_CACHE_PATH,
+        VLM_CACHE_TTL,
+        VLM_CACHE_MAX_BYTES,
+        VLM_CACHE_MEMORY_ENTRIES,
+    )
+    return TieredCache(
+        memory=MemoryCache(max_entries=VLM_CACHE_MEMORY_ENTRIES, ttl=VLM_CACHE_TTL),
+        disk=SQLiteCache(VLM_CACHE_PATH, max_bytes=VLM_CACHE_MAX_BYTES, ttl=VLM_CACHE_TTL),
+    )
@@ -1,48 +1,417 @@
-import base64
-import json
-from openai import OpenAI
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
 
-from src.utils import encode_image
+import openai
+from openai import AsyncOpenAI
 
-class VLMTool:
+from src.image_prep import ImagePreparer
+from src.metrics import get_metrics, VLM_REQUEST_SECONDS, VLM_EVENTS, VLM_TOKENS
+from src.vlm_cache import TieredCache, build_default_cache, make_cache_key
+from src.config import (
+    VLM_CACHE_ENABLED,
+    VLM_MAX_CONCURRENCY,
+    VLM_TIMEOUT,
+    VLM_MAX_RETRIES,
+    VLM_BACKOFF_BASE,
+    VLM_BACKOFF_MAX,
+    VLM_RATE_LIMITS,
+    VLM_RATE_LIMIT_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_MODELS = ["gpt-4.1", "gpt-4o"]
+SPECULATIONS = get_metrics().counter(
+    "vlm_speculations", "Speculative VLM calls by outcome (used, cancelled, wasted).", ["model", "outcome"]
+)
+SPECULATIVE_WASTED_TOKENS = get_metrics().counter(
+    "vlm_speculative_wasted_tokens", "Tokens of speculative VLM calls that completed but were discarded.", ["model"]
+)
+IMAGE_TOKEN_ESTIMATE = 765  # "detail": "high" 이미지 1장(4 tiles)에 대한 대략적인 토큰 수
+
+
+class VLMError(Exception):
+    """
+    Structured error for a failed VLM call.
+    `retryable` tells whether the failure was transient (429/5xx/timeout);
+    `attempts` is how many requests were sent before giving up.
+    """
+    def __init__(self, message, model=None, status=None, attempts=0, retryable=False):
+        super().__init__(message)
+        self.model = model
+        self.status = status
+        self.attempts = attempts
+        self.retryable = retryable
+
+    def to_dict(self):
+        return {
+            "error": type(self).__name__,
+            "message": str(self),
+            "model": self.model,
+            "status": self.status,
+            "attempts": self.attempts,
+            "retryable": self.retryable,
+        }
+
+
+class VLMRateLimitError(VLMError):
+    """429 responses persisted past the retry budget."""
+
+
+class VLMTimeoutError(VLMError):
+    """The request timed out on every attempt."""
+
+
+class VLMResponseError(VLMError):
+    """The API answered but the response was empty or unusable."""
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for one model's requests-per-minute and
+    tokens-per-minute budget. Token cost is estimated up front and
+    corrected with the real usage once the response arrives.
+    """
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+        return now
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                now = self._refill()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60.0 / self.rpm,
+                    (tokens - self._tokens) * 60.0 / self.tpm,
+                    0.01,
+                )
+                await asyncio.sleep(wait)
+
+    async def settle(self, estimated_tokens, actual_tokens):
+        """Returns (or charges) the difference between the estimate and real usage."""
+        self._refill()
+        self._tokens = min(self.tpm, self._tokens + estimated_tokens - actual_tokens)
+
+    async def pause(self, seconds):
+        """Blocks all callers for `seconds` (used when the server answers 429)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class SharedRateLimiter:
+    """
+    RateLimiter whose buckets live in a SQLite file, so every process opening
+    the same `path` (e.g. the workers of src/distributed.py) draws from one
+    rpm/tpm budget and honours one 429 pause. Same interface as RateLimiter.
+    """
+    def __init__(self, path, model, rpm, tpm):
+        self.path = path
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # autocommit mode; every update runs in its own BEGIN IMMEDIATE transaction
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " model TEXT PRIMARY KEY,"
+            " requests REAL NOT NULL,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " blocked_until REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO rate_buckets VALUES (?, ?, ?, ?, 0)",
+            (model, float(rpm), float(tpm), time.time()),
+        )
+
+    def _transact(self, update):
+        """Runs `update(requests, tokens, now, blocked_until)` on the refilled bucket atomically."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, tokens, updated_at, blocked_until = self._conn.execute(
+                    "SELECT requests, tokens, updated_at, blocked_until FROM rate_buckets WHERE model = ?", (self.model,)
+                ).fetchone()
+                # wall clock, since the bucket is shared between processes
+                now = time.time()
+                elapsed = max(0.0, now - updated_at)
+                requests = min(self.rpm, requests + elapsed * self.rpm / 60.0)
+                tokens = min(self.tpm, tokens + elapsed * self.tpm / 60.0)
+                requests, tokens, blocked_until, result = update(requests, tokens, now, blocked_until)
+                self._conn.execute(
+                    "UPDATE rate_buckets SET requests = ?, tokens = ?, updated_at = ?, blocked_until = ? WHERE model = ?",
+                    (requests, tokens, now, blocked_until, self.model),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _try_acquire(self, tokens):
+        """0 when the budget was taken, else the seconds to wait before retrying."""
+        def update(requests, available, now, blocked_until):
+            if now < blocked_until:
+                return requests, available, blocked_until, blocked_until - now
+            if requests >= 1 and available >= tokens:
+                return requests - 1, available - tokens, blocked_until, 0.0
+            wait = max((1 - requests) * 60.0 / self.rpm, (tokens - available) * 60.0 / self.tpm, 0.01)
+            return requests, available, blocked_until, wait
+        return self._transact(update)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, tokens)
+            if wait <= 0:
+                return
+            # jitter so waiting processes do not retry the transaction in lockstep
+            await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+    async def settle(self, estimated_tokens, actual_tokens):
+        """Returns (or charges) the difference between the estimate and real usage."""
+        await asyncio.to_thread(self._transact, lambda requests, tokens, now, blocked_until: (
+            requests, min(self.tpm, tokens + estimated_tokens - actual_tokens), blocked_until, None
+        ))
+
+    async def pause(self, seconds):
+        """Blocks every process sharing the bucket for `seconds`."""
+        await asyncio.to_thread(self._transact, lambda requests, tokens, now, blocked_until: (
+            requests, tokens, max(blocked_until, now + seconds), None
+        ))
+
+
+def estimate_tokens(messages, max_tokens):
+    """Rough prompt+completion token estimate used for budgeting before the call."""
+    tokens = max_tokens
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += len(part["text"]) // 4
+            elif part.get("type") == "image_url":
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncVLMTool:
     """
-    Handles LLM calls 
+    asyncio-native VLM client.
+    Many requests may be in flight at once (bounded by `max_concurrency`);
+    429/5xx/timeouts are retried with exponential backoff + full jitter and
+    every model is throttled by its own RateLimiter budget (a
+    SharedRateLimiter when `rate_limit_path` is set, so several processes
+    share one budget).
+    `base_url` lets the client point at a local mock server.
     """
-    def __init__(self, api_key):
-        self.client = OpenAI(api_key=api_key)
-    
-    def chat_completion(
+    def __init__(
+        self,
+        api_key,
+        base_url=None,
+        max_concurrency=VLM_MAX_CONCURRENCY,
+        timeout=VLM_TIMEOUT,
+        max_retries=VLM_MAX_RETRIES,
+        backoff_base=VLM_BACKOFF_BASE,
+        backoff_max=VLM_BACKOFF_MAX,
+        rate_limits=None,
+        rate_limit_path=VLM_RATE_LIMIT_PATH,
+        cache=None,
+        image_preparer=None,
+    ):
+        # 재시도는 직접 처리하므로 SDK 내부 재시도는 끔
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+        rate_limits = VLM_RATE_LIMITS if rate_limits is None else rate_limits
+        if rate_limit_path:
+            # budgets shared with every other process using the same file
+            self.limiters = {model: SharedRateLimiter(rate_limit_path, model, **budget) for model, budget in rate_limits.items()}
+        else:
+            self.limiters = {model: RateLimiter(**budget) for model, budget in rate_limits.items()}
+        self.usage = {}
+        # cache=None -> config 기본 캐시, cache=False -> 캐시 사용 안 함
+        if cache is None:
+            cache = build_default_cache() if VLM_CACHE_ENABLED else False
+        self.cache = cache or None
+        # 업로드 이미지 축소/재인코딩 (critique/validation에서 같은 이미지는 한 번만 인코딩)
+        self.image_preparer = image_preparer if image_preparer is not None else ImagePreparer()
+
+    def _record(self, model, **deltas):
+        stats = self.usage.setdefault(model, {
+            "requests": 0, "retries": 0, "errors": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+            "cache_hits": 0, "cache_misses": 0,
+        })
+        for name, value in deltas.items():
+            stats[name] += value
+            if not value:
+                continue
+            if name.endswith("_tokens"):
+                VLM_TOKENS.inc(value, model=model, kind=name[:-len("_tokens")])
+            else:
+                VLM_EVENTS.inc(value, model=model, event=name)
+
+    async def _cache_get(self, key):
+        # the disk tier is SQLite: keep its reads and writes off the event loop
+        if isinstance(self.cache, TieredCache):
+            return await self.cache.aget(key)
+        return await asyncio.to_thread(self.cache.get, key)
+
+    async def _cache_set(self, key, value):
+        if isinstance(self.cache, TieredCache):
+            await self.cache.aset(key, value)
+        else:
+            await asyncio.to_thread(self.cache.set, key, value)
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def chat_completion(
         self,
         messages,
         model="gpt-4o",
         max_tokens=300,
         temperature=0.1,
-        response_format=None
+        response_format=None,
+        on_usage=None,
     ):
         """Calls GPT for chat completion.
-        return first message of GPTs"""
-        try:
-            if model in ["gpt-4.1", "gpt-4o"]:
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_completion_tokens=max_tokens,
-                    response_format=response_format if response_format else {"type": "text"}
-                )
+        return first message of GPTs, raises VLMError on failure
+        `on_usage(prompt_tokens, completion_tokens)` is called for every billed response."""
+        if model not in SUPPORTED_MODELS:
+            raise NotImplementedError("This model is not supported")
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(model, messages, response_format, temperature, max_tokens)
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                self._record(model, cache_hits=1)
+                return cached
+            self._record(model, cache_misses=1)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        limiter = self.limiters.get(model)
+        estimated = estimate_tokens(messages, max_tokens)
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            outcome = "error"
+            if limiter is not None:
+                await limiter.acquire(estimated)
+            try:
+                async with self._semaphore:
+                    self._record(model, requests=1, retries=1 if attempt else 0)
+                    request_started = time.perf_counter()
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            max_completion_tokens=max_tokens,
+                            temperature=temperature,
+                            response_format=response_format if response_format else {"type": "text"}
+                        ),
+                        timeout=self.timeout,
+                    )
+            except (asyncio.TimeoutError, openai.APITimeoutError) as e:
+                outcome = "timeout"
+                last_error = VLMTimeoutError(f"VLM request timed out: {e}", model=model, attempts=attempt + 1, retryable=True)
+            except openai.RateLimitError as e:
+                outcome = "rate_limited"
+                retry_after = _retry_after(e)
+                if limiter is not None and retry_after:
+                    await limiter.pause(retry_after)
+                last_error = VLMRateLimitError(f"VLM rate limited: {e}", model=model, status=429, attempts=attempt + 1, retryable=True)
+            except openai.APIConnectionError as e:
+                last_error = VLMError(f"VLM connection error: {e}", model=model, attempts=attempt + 1, retryable=True)
+            except openai.APIStatusError as e:
+                retry_after = _retry_after(e)
+                retryable = e.status_code >= 500 or e.status_code == 408
+                last_error = VLMError(f"VLM request failed: {e}", model=model, status=e.status_code, attempts=attempt + 1, retryable=retryable)
             else:
-                raise NotImplementedError("This model is not supported")
+                VLM_REQUEST_SECONDS.observe(time.perf_counter() - request_started, model=model, outcome="ok")
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    self._record(model, prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                    if on_usage is not None:
+                        on_usage(usage.prompt_tokens, usage.completion_tokens)
+                    if limiter is not None:
+                        await limiter.settle(estimated, usage.total_tokens)
+                content = response.choices[0].message.content if response.choices else None
+                if not content:
+                    self._record(model, errors=1)
+                    raise VLMResponseError("VLM returned an empty response", model=model, attempts=attempt + 1)
+                if cache_key is not None:
+                    await self._cache_set(cache_key, content)
+                return content
 
-            return response.choices[0].message.content
+            VLM_REQUEST_SECONDS.observe(time.perf_counter() - request_started, model=model, outcome=outcome)
+            if not last_error.retryable or attempt == self.max_retries:
+                break
+            await asyncio.sleep(self._backoff(attempt, retry_after))
 
-        except Exception as e:
-            print(f"Error calling LLM: {e}")
-            return None
+        self._record(model, errors=1)
+        raise last_error
 
-    def extract_objects_from_request(self, image_path, user_text, model="gpt-4.1"):
+    async def extract_objects_from_request(self, image, user_text, model="gpt-4.1"):
         """ Asks the LLM to parse user request for which objects to detect/segment.
+        `image` is a path or an in-memory image.
         Returns a list of objects in plain text."""
-        base64_image = encode_image(image_path) 
-        if not base64_image:
+        # resize + JPEG 인코딩은 CPU 작업이므로 event loop 밖에서 수행
+        try:
+            prepared = await asyncio.to_thread(self.image_preparer.prepare, image, model)
+        except Exception as e:
+            logger.warning("Error encoding image: %s", e)
             return None
 
         prompt = (
@@ -61,18 +430,12 @@ class VLMTool:
                 "role": "user",
                 "content": [
                     {"type": "text", "text": user_text},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                            "detail": "high"
-                        }
-                    }
+                    prepared.content()
                 ]
             }
         ]
 
-        result = self.chat_completion(messages, model=model)
+        result = await self.chat_completion(messages, model=model)
         if result:
             detected_objects = [
                 obj.strip().lower()
@@ -81,4 +444,101 @@ class VLMTool:
             ]
             return detected_objects
 
-        return []
\ No newline at end of file
+        return []
+
+    async def close(self):
+        await self.client.close()
+
+
+class SpeculativeCompletion:
+    """
+    A chat completion started before the caller knows whether it will need
+    the answer. Call exactly one of `result()` (the answer is used) or
+    `discard()`: a pending request is cancelled, and a finished one has its
+    tokens counted as wasted.
+    """
+    def __init__(self, vlm_tool, messages, model, **kwargs):
+        self.model = model
+        self.tokens = 0
+        self.outcome = None
+        self._lock = threading.Lock()
+        self.future = vlm_tool.submit(vlm_tool.async_tool.chat_completion(
+            messages, model=model, on_usage=self._add_usage, **kwargs
+        ))
+
+    def _add_usage(self, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.tokens += prompt_tokens + completion_tokens
+
+    def result(self, timeout=None):
+        """Blocks for the answer. Raises VLMError like `VLMTool.chat_completion`."""
+        self.outcome = "used"
+        SPECULATIONS.inc(model=self.model, outcome="used")
+        return self.future.result(timeout)
+
+    def discard(self):
+        """Drops the call; returns "cancelled" (still in flight) or "wasted" (already answered)."""
+        if self.future.cancel():
+            # the request may already have reached the API; its usage is then unknown
+            self.outcome = "cancelled"
+        else:
+            self.outcome = "wasted"
+            with self._lock:
+                SPECULATIVE_WASTED_TOKENS.inc(self.tokens, model=self.model)
+        SPECULATIONS.inc(model=self.model, outcome=self.outcome)
+        return self.outcome
+
+
+class VLMTool:
+    """
+    Handles LLM calls
+    Synchronous facade over AsyncVLMTool: coroutines run on a private
+    event-loop thread, so the tool can be shared by many worker threads
+    and `submit()` can overlap calls without the caller owning a loop.
+    """
+    def __init__(self, api_key, **kwargs):
+        self.async_tool = AsyncVLMTool(api_key, **kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="vlm-event-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedules a coroutine on the VLM loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def chat_completion(self, messages, model="gpt-4o", max_tokens=300, temperature=0.1, response_format=None):
+        """Blocking chat completion. Raises VLMError on failure."""
+        return self.submit(self.async_tool.chat_completion(
+            messages, model=model, max_tokens=max_tokens,
+            temperature=temperature, response_format=response_format,
+        )).result()
+
+    def speculate(self, messages, model="gpt-4o", max_tokens=300, temperature=0.1, response_format=None):
+        """Starts a chat completion in the background; returns a SpeculativeCompletion."""
+        return SpeculativeCompletion(
+            self, messages, model,
+            max_tokens=max_tokens, temperature=temperature, response_format=response_format,
+        )
+
+    def extract_objects_from_request(self, image, user_text, model="gpt-4.1"):
+        return self.submit(self.async_tool.extract_objects_from_request(image, user_text, model=model)).result()
+
+    def prepare_image(self, image, model):
+        """Downscaled, cached JPEG payload for `image` sized for `model`."""
+        return self.async_tool.image_preparer.prepare(image, model)
+
+    def payload_stats(self):
+        return self.async_tool.image_preparer.stats()
+
+    @property
+    def usage(self):
+        return self.async_tool.usage
+
+    def cache_stats(self):
+        cache = self.async_tool.cache
+        return cache.stats() if cache is not None else None
+
+    def close(self):
+        self.submit(self.async_tool.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
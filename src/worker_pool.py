@@ -0,0 +1,104 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolFullError(RuntimeError):
+    """Raised when the worker pool queue stays full past the submit timeout."""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool that serves concurrent requests against shared models.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may
+    wait; further submits block up to `timeout` seconds and are then rejected
+    with PoolFullError (backpressure). Queue and service times are tracked
+    so the pool can be sized from `stats()`.
+    """
+    def __init__(self, max_workers=2, max_queue=8, timeout=30.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detector-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiting = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._service_total = 0.0
+        self._service_max = 0.0
+        self._peak_pending = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules `fn(*args, **kwargs)` and returns a Future. Raises PoolFullError on overload."""
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise PoolFullError(
+                f"Worker pool is full ({self.max_workers} running, {self.max_queue} queued)"
+            )
+
+        enqueued_at = time.perf_counter()
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._waiting += 1
+            self._peak_pending = max(self._peak_pending, self._waiting + self._running)
+
+        def _job():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._waiting -= 1
+                self._running += 1
+                wait = started_at - enqueued_at
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                service = time.perf_counter() - started_at
+                with self._lock:
+                    self._running -= 1
+                    self._service_total += service
+                    self._service_max = max(self._service_max, service)
+                    self._counters["completed" if ok else "failed"] += 1
+                self._slots.release()
+
+        try:
+            return self._executor.submit(_job)
+        except Exception:
+            with self._lock:
+                self._waiting -= 1
+            self._slots.release()
+            raise
+
+    def run(self, fn, *args, **kwargs):
+        """Blocking helper: submit and wait for the result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stats(self):
+        """Snapshot of queueing / backpressure metrics."""
+        with self._lock:
+            finished = self._counters["completed"] + self._counters["failed"]
+            started = finished + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._waiting,
+                "peak_pending": self._peak_pending,
+                **self._counters,
+                "avg_queue_wait_s": self._queue_wait_total / started if started else 0.0,
+                "max_queue_wait_s": self._queue_wait_max,
+                "avg_service_s": self._service_total / finished if finished else 0.0,
+                "max_service_s": self._service_max,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
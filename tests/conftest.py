@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Add the project root to the Python path (same as the scripts in sctipts/)
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
@@ -0,0 +1,111 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torchvision")
+
+from src.postprocess import Detections, postprocess, weighted_box_fusion
+
+
+def _run(scores, boxes, labels, **kwargs):
+    options = {"iou_threshold": 0.5, "agnostic_iou_threshold": None, "max_per_label": None, "max_detections": None}
+    options.update(kwargs)
+    return postprocess(np.array(scores, dtype=np.float32), np.array(boxes, dtype=np.float32), labels, 0.0, **options)
+
+
+# A and B: same object, IoU 0.82; C: exactly A under another label; D: far away
+A, B, C, D = [0, 0, 10, 10], [1, 0, 11, 10], [0, 0, 10, 10], [50, 50, 60, 60]
+
+
+def test_class_aware_nms_keeps_overlaps_of_other_labels():
+    detections = _run([0.9, 0.8, 0.7], [A, B, C], ["dog", "dog", "cat"])
+    assert detections.labels == ["dog", "cat"]
+    np.testing.assert_allclose(detections.scores, [0.9, 0.7])
+    np.testing.assert_allclose(detections.boxes, [A, C])
+
+
+def test_agnostic_nms_runs_after_class_aware_nms():
+    detections = _run([0.9, 0.8, 0.7], [A, B, C], ["dog", "dog", "cat"], agnostic_iou_threshold=0.8)
+    assert detections.labels == ["dog"]
+    np.testing.assert_allclose(detections.scores, [0.9])
+
+
+def test_agnostic_nms_below_threshold_keeps_both_labels():
+    # B vs. a cat box at A: IoU 0.82 < 0.9
+    detections = _run([0.9, 0.7], [B, A], ["dog", "cat"], agnostic_iou_threshold=0.9)
+    assert detections.labels == ["dog", "cat"]
+
+
+def test_without_nms_everything_is_sorted_by_score():
+    detections = _run([0.2, 0.9, 0.5], [A, B, D], ["dog", "dog", "dog"], iou_threshold=None)
+    np.testing.assert_allclose(detections.scores, [0.9, 0.5, 0.2])
+    np.testing.assert_allclose(detections.boxes, [B, D, A])
+
+
+def test_per_label_top_k_applies_before_global_top_k():
+    boxes = [[i * 20, 0, i * 20 + 10, 10] for i in range(5)]
+    detections = _run(
+        [0.9, 0.8, 0.7, 0.6, 0.5], boxes, ["dog", "dog", "dog", "cat", "cat"], max_per_label=2, max_detections=3
+    )
+    # third dog is capped per label; then the best three of the remaining four
+    assert detections.labels == ["dog", "dog", "cat"]
+    np.testing.assert_allclose(detections.scores, [0.9, 0.8, 0.6])
+    np.testing.assert_allclose(detections.boxes, [boxes[0], boxes[1], boxes[3]])
+
+
+def test_score_threshold_and_clipping():
+    detections = postprocess(
+        np.array([0.9, 0.1], dtype=np.float32),
+        np.array([[-5, -5, 120, 40], D], dtype=np.float32),
+        ["dog", "dog"],
+        0.5,
+        image_size=(100, 30),
+    )
+    assert len(detections) == 1
+    np.testing.assert_allclose(detections.boxes, [[0, 0, 100, 30]])
+
+
+def test_empty_input():
+    assert len(postprocess([], [], [], 0.0)) == 0
+    assert len(_run([0.1], [A], ["dog"], iou_threshold=0.5)) == 1
+
+
+def test_detections_iterate_numbered_from_one():
+    detections = _run([0.5, 0.9], [A, D], ["dog", "cat"])
+    assert [num for num, _, _ in detections] == [1, 2]
+    assert detections[0] == (1, "cat", D)
+    assert detections.with_scores()[1][3] == pytest.approx(0.5)
+
+
+def _detections(boxes, scores, labels):
+    return Detections(np.array(boxes, dtype=np.float32), np.array(scores, dtype=np.float32), labels)
+
+
+def test_wbf_scales_scores_by_weight_share():
+    prescreen = _detections([A, D], [0.6, 0.6], ["dog", "dog"])
+    main = _detections([A], [0.9], ["dog"])
+    scores, boxes, labels = weighted_box_fusion([prescreen, main], weights=(1.0, 2.0), iou_threshold=0.55)
+    fused = sorted(zip(scores.tolist(), boxes.tolist(), labels), reverse=True)
+    # seen by both: weighted mean (0.6 * 1 + 0.9 * 2) / 3
+    assert fused[0][0] == pytest.approx(0.8)
+    np.testing.assert_allclose(fused[0][1], A)
+    # pre-screen only: 0.6 x (1 / 3)
+    assert fused[1][0] == pytest.approx(0.2)
+    np.testing.assert_allclose(fused[1][1], D)
+
+
+def test_wbf_averages_overlapping_boxes():
+    first = _detections([[0, 0, 10, 10]], [0.5], ["dog"])
+    second = _detections([[2, 0, 12, 10]], [0.5], ["dog"])  # IoU 0.67
+    scores, boxes, labels = weighted_box_fusion([first, second], iou_threshold=0.55)
+    assert labels == ["dog"]
+    np.testing.assert_allclose(scores, [0.5])
+    np.testing.assert_allclose(boxes, [[1, 0, 11, 10]])
+
+
+def test_wbf_keeps_labels_and_distant_boxes_apart():
+    first = _detections([A], [0.8], ["dog"])
+    second = _detections([A, D], [0.8, 0.8], ["cat", "dog"])
+    scores, boxes, labels = weighted_box_fusion([first, second], iou_threshold=0.55)
+    assert sorted(labels) == ["cat", "dog", "dog"]
+    # every cluster was seen by one of two equally weighted models
+    np.testing.assert_allclose(scores, [0.4, 0.4, 0.4])
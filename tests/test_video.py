@@ -0,0 +1,73 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from src.video import IoUTracker, Track, VideoDetector, _frame_histogram
+
+
+def _ids(tracks):
+    return [track_id for track_id, _, _ in tracks]
+
+
+def test_track_alpha_beta_update_and_predict():
+    track = Track(1, "dog", [0, 0, 10, 10], frame_index=0)
+    track.update([10, 0, 20, 10], frame_index=1)
+    np.testing.assert_allclose(track.box, [6, 0, 16, 10])
+    np.testing.assert_allclose(track.velocity, [2, 0, 2, 0])
+    track.predict()
+    np.testing.assert_allclose(track.box, [8, 0, 18, 10])
+    # a gap of several frames spreads the velocity correction over them
+    track.update([12, 0, 22, 10], frame_index=3)
+    np.testing.assert_allclose(track.velocity, [2.4, 0, 2.4, 0], rtol=1e-5)
+
+
+def test_tracker_keeps_ids_and_hides_unconfirmed_misses():
+    tracker = IoUTracker(iou_threshold=0.3, max_misses=2)
+    tracks = tracker.update([(1, "dog", [0, 0, 10, 10]), (2, "cat", [50, 50, 60, 60])], 0)
+    assert _ids(tracks) == [1, 2]
+
+    tracks = tracker.update([(1, "dog", [1, 0, 11, 10])], 1)
+    # the dog keeps its id; the cat missed once and was only seen once, so it is hidden
+    assert _ids(tracks) == [1]
+    np.testing.assert_allclose(tracks[0][2], [0.6, 0, 10.6, 10], rtol=1e-5)
+
+
+def test_tracker_matches_same_label_only_and_expires_misses():
+    tracker = IoUTracker(iou_threshold=0.3, max_misses=2)
+    tracker.update([(1, "dog", [0, 0, 10, 10])], 0)
+    tracks = tracker.update([(1, "cat", [0, 0, 10, 10])], 1)
+    # same place, other label: a new track
+    assert [(track_id, label) for track_id, label, _ in tracks] == [(2, "cat")]
+
+    tracker.update([], 2)
+    assert sorted(t.track_id for t in tracker.tracks) == [1, 2]
+    tracker.update([], 3)
+    # the dog has now missed three detector runs (> max_misses)
+    assert [t.track_id for t in tracker.tracks] == [2]
+
+
+def test_tracker_matches_greedily_by_iou():
+    tracker = IoUTracker(iou_threshold=0.3, max_misses=2)
+    tracker.update([(1, "dog", [0, 0, 10, 10]), (2, "dog", [5, 0, 15, 10])], 0)
+    tracks = tracker.update([(1, "dog", [4, 0, 14, 10]), (2, "dog", [0, 0, 10, 10])], 1)
+    boxes = {track_id: box for track_id, _, box in tracks}
+    assert sorted(boxes) == [1, 2]
+    np.testing.assert_allclose(boxes[1], [0, 0, 10, 10])
+    np.testing.assert_allclose(boxes[2], [4.4, 0, 14.4, 10], rtol=1e-5)
+
+
+def test_scene_change_refresh_waits_for_min_gap():
+    detector = VideoDetector(tool=None, user_request="dogs", refresh_every=None, scene_change_threshold=0.5, min_refresh_gap=30)
+    # the histogram is over hue / saturation, so the two scenes differ in hue
+    red = np.zeros((32, 32, 3), dtype=np.uint8)
+    red[..., 0] = 255
+    blue = np.zeros((32, 32, 3), dtype=np.uint8)
+    blue[..., 2] = 255
+    assert detector._needs_refresh(0, red)
+    detector._last_refresh = 0
+    detector._reference_hist = _frame_histogram(red)
+
+    assert not detector._needs_refresh(5, blue)
+    assert detector._needs_refresh(30, blue)
+    assert not detector._needs_refresh(30, red)
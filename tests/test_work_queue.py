@@ -0,0 +1,86 @@
+import pytest
+
+from src.distributed import SQLiteWorkQueue
+
+
+def _jobs(*ids):
+    return [{"id": job_id, "image": f"{job_id}.jpg", "prompt": "find the dog", "timings": {}} for job_id in ids]
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    work_queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    yield work_queue
+    work_queue.close()
+
+
+def test_put_many_is_idempotent_on_job_id(work_queue):
+    assert work_queue.put_many(_jobs("a", "b")) == 2
+    assert work_queue.put_many(_jobs("b", "c")) == 1
+    assert work_queue.counts() == {"pending": 3, "leased": 0, "done": 0, "failed": 0}
+
+
+def test_lease_hands_out_each_job_once(work_queue):
+    work_queue.put_many(_jobs("a", "b", "c"))
+    first = work_queue.lease("w1", 2, lease_timeout=60)
+    second = work_queue.lease("w2", 2, lease_timeout=60)
+    assert [job["id"] for job in first] == ["a", "b"]
+    assert [job["id"] for job in second] == ["c"]
+    assert first[0]["prompt"] == "find the dog"
+    assert work_queue.lease("w3", 2) == []
+
+
+def test_expired_lease_is_leased_again(work_queue):
+    work_queue.put_many(_jobs("a"))
+    assert [job["id"] for job in work_queue.lease("w1", 1, lease_timeout=-1)] == ["a"]
+    # w1 stopped heartbeating: its lease is already over
+    assert [job["id"] for job in work_queue.lease("w2", 1, lease_timeout=60)] == ["a"]
+    assert work_queue.counts()["leased"] == 1
+
+
+def test_heartbeat_keeps_the_lease(work_queue):
+    work_queue.put_many(_jobs("a"))
+    work_queue.lease("w1", 1, lease_timeout=-1)
+    assert work_queue.heartbeat("w1", lease_timeout=60) == 1
+    assert work_queue.lease("w2", 1) == []
+
+
+def test_ack_finishes_a_job(work_queue):
+    work_queue.put_many(_jobs("a"))
+    work_queue.lease("w1", 1)
+    work_queue.ack("a", status="no_objects")
+    assert work_queue.counts()["done"] == 1
+    assert work_queue.unfinished() == 0
+    # a late ack from an expired lease changes nothing
+    work_queue.ack("a")
+    assert work_queue.counts()["done"] == 1
+
+
+def test_job_failing_max_attempts_times_is_failed(work_queue):
+    work_queue.put_many(_jobs("bad", "good"))
+    for attempt in range(2):
+        jobs = work_queue.lease("w1", 1)
+        assert [job["id"] for job in jobs] == ["bad"]
+        work_queue.fail("bad", "w1", f"decode error {attempt}")
+    assert work_queue.failed_jobs() == [("bad", 2, "decode error 1")]
+    # the failed job is not handed out again
+    assert [job["id"] for job in work_queue.lease("w1", 2)] == ["good"]
+
+
+def test_fail_from_another_worker_is_ignored(work_queue):
+    work_queue.put_many(_jobs("a"))
+    work_queue.lease("w1", 1)
+    work_queue.fail("a", "w2", "not mine")
+    assert work_queue.counts()["leased"] == 1
+
+
+def test_release_worker_requeues_its_jobs(work_queue):
+    work_queue.put_many(_jobs("a", "b"))
+    work_queue.lease("w1", 1)
+    work_queue.lease("w2", 1)
+    assert work_queue.release_worker("w1") == 1
+    assert work_queue.counts() == {"pending": 1, "leased": 1, "done": 0, "failed": 0}
+    assert [job["id"] for job in work_queue.lease("w3", 1)] == ["a"]
+    # second crash of the same job uses up its attempts
+    assert work_queue.release_worker("w3") == 1
+    assert work_queue.failed_jobs() == [("a", 2, "worker w3 exited")]